@@ -1,69 +1,233 @@
+import collections
+import argparse
 import concurrent.futures
+import contextlib
+import functools
+import gzip
+import hashlib
+import heapq
+import importlib
+import io
+import json
+import mmap
+import multiprocessing
 import os
+import queue
 import pathlib
 import re
 import shutil
 import subprocess
+import sys
 import tarfile
+import tempfile
+import threading
 import time
 import zipfile
 from datetime import datetime
 from enum import Enum
-import py7zr
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
 import platform
 
 
+def import_optional(module_name):
+    """
+    Imports an optional library the first time it is needed rather than at startup, returns None when it is not installed
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
 def log_general_message(message, calling_method='Undefined Calling Method', print_to_console=True, string_log_level = 'INFO'):
 
-    log_level = LogLevels[string_log_level.upper()]
-    # Check if the log level of the message is allowed with the current configured log level
-    if(log_level.value >= global_config.current_log_level.value):
-        # Get current date and time to use in log lines
-        now = datetime.now()
-        current_date_time = now.strftime("[%m-%d-%Y %H:%M:%S]")
+    log_level = LOG_LEVELS_BY_NAME.get(string_log_level) or LogLevels[string_log_level.upper()]
+    # Check if the log level of the message is allowed with the current configured log level, before any formatting
+    if(log_level.value < global_config.current_log_level.value):
+        return
 
-        # Join all component of the log message
-        full_message = f"{current_date_time} [{log_level.name}]: {message} ({calling_method})"
+    # Join all component of the log message
+    full_message = f"{current_log_timestamp()} [{log_level.name}]: {message} ({calling_method})"
 
-        if(print_to_console):
-            # Print the event to stdout
-            print(full_message)
+    # Hand the message to the log writer thread, which prints it and writes it to the output log
+    global_config.log_writer.write(full_message, print_to_console)
 
-        log_full_message = f"{full_message}\n"
-        # Write the message to the output log
-        global_config.processing_log_file_handle.write(log_full_message)
+def current_log_timestamp():
+    """
+    Returns the timestamp used in log lines, only formatting it again once the second has changed
+    """
+    global cached_log_timestamp
+    current_second = int(time.time())
+    cached_second, cached_timestamp = cached_log_timestamp
+    if cached_second != current_second:
+        cached_timestamp = datetime.fromtimestamp(current_second).strftime("[%m-%d-%Y %H:%M:%S]")
+        cached_log_timestamp = (current_second, cached_timestamp)
+    return cached_timestamp
+
+class LogWriter():
+    """
+    Writes log messages from every thread through a queue to a single writer thread, so lines never interleave and
+    callers never wait on the file. The writer takes every message waiting in the queue at once, writing and flushing
+    them as one batch.
+    """
+    def __init__(self, log_file_handle):
+        self.log_file_handle = log_file_handle
+        self.queue = queue.SimpleQueue()
+        self.writer_thread = threading.Thread(target=self.write_queued_messages, daemon=True)
+        self.writer_thread.start()
+
+    def write(self, full_message, print_to_console):
+        self.queue.put((full_message, print_to_console))
+
+    def write_queued_messages(self):
+        closing = False
+        while not closing:
+            queued_messages = [self.queue.get()]
+            while len(queued_messages) < LOG_BATCH_SIZE:
+                try:
+                    queued_messages.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if queued_messages[-1] is None:
+                queued_messages.pop()
+                closing = True
+
+            console_lines = [f"{full_message}\n" for full_message, print_to_console in queued_messages if print_to_console]
+            if console_lines:
+                # Print the events to stdout
+                sys.stdout.write(''.join(console_lines))
+                sys.stdout.flush()
+            # Write the messages to the output log
+            self.log_file_handle.write(''.join(f"{full_message}\n" for full_message, print_to_console in queued_messages))
+            self.log_file_handle.flush()
+
+    def close(self):
+        """
+        Writes every message still queued, then stops the writer thread
+        """
+        self.queue.put(None)
+        self.writer_thread.join()
+
+def unique_path(path, reserved_paths=()):
+    """
+    Returns the path, or the path with the first free number appended when something already exists there or the path
+    is reserved for another file
+    """
+    candidate_path = path
+    number = 1
+    while candidate_path in reserved_paths or os.path.lexists(candidate_path):
+        candidate_path = f"{path}_{number}"
+        number += 1
+    return candidate_path
+
+def extraction_output_path(file_path, output_folder, reserved_paths):
+    """
+    Picks the path an archive is extracted to, named after the archive without its last extension, and reserves it.
+    Archives that would share a name, such as logs.tar.gz and logs.tar.zst, get numbered paths rather than extracting
+    over each other.
+    """
+    output_path = join_paths_and_convert(output_folder, pathlib.Path(file_path).stem)
+    if output_path == file_path:  # An archive without an extension would otherwise be extracted over itself
+        output_path = f"{output_path}_extracted"
+    output_path = unique_path(output_path, reserved_paths)
+    reserved_paths.add(output_path)
+    return output_path
+
+def check_member_paths(member_names, output_path):
+    """
+    Raises ValueError when an archive member, such as ../../etc/cron.d/job or an absolute path, would be written
+    outside of output_path once extracted
+    """
+    output_root = os.path.realpath(output_path)
+    for member_name in member_names:
+        member_path = os.path.realpath(os.path.join(output_root, member_name))
+        if os.path.commonpath([output_root, member_path]) != output_root:
+            raise ValueError(f"Archive member {member_name} would be extracted outside of {output_path}")
 
-def extract_then_move(compresed_object, file_path, file_name, file_type):
-    extraction_folder = join_paths_and_convert(global_config.log_parsing_folder_full_path, file_name)
-    log_general_message(f"Found {file_type} file {file_name}, starting decompression process into {global_config.log_parsing_folder_full_path}",
-                        "Regex Searching: Extracting Files")
-    os.makedirs(extraction_folder, exist_ok=True)
-    compresed_object.extractall(extraction_folder)
-    log_general_message(f"Decompressed {file_type} file {file_name} to {extraction_folder}",
-                        "Regex Searching: Extracting Files")
-    shutil.move(file_path, global_config.compressed_files_folder_full_path)
+def check_tar_members(tar_ref, output_path):
+    """
+    The checks of tarfile's data filter for Python versions without it: members and the targets of links must stay
+    inside output_path
+    """
+    members = tar_ref.getmembers()
+    check_member_paths([member.name for member in members], output_path)
+    for member in members:
+        if member.issym():
+            check_member_paths([os.path.join(os.path.dirname(member.name), member.linkname)], output_path)
+        elif member.islnk():
+            check_member_paths([member.linkname], output_path)
+        elif not (member.isfile() or member.isdir()):
+            raise ValueError(f"Archive member {member.name} is not a file, folder or link")
+
+def extract_file(file_path, output_path):
+    """
+    Process pool worker that extracts one archive to output_path. Archives with members are extracted into a folder
+    at output_path, while a single compressed file such as a rotated server.log.1.gz is stream decompressed to the file
+    output_path without holding it in memory. Workers are spawned without the global config, so the caller does all of
+    the logging. Returns (archive type, output path, seconds taken), or None when the file is not an archive. Raises
+    ValueError for an archive with members that would be written outside of output_path.
+    """
+    start_time = time.perf_counter()
+
+    with open(file_path, 'rb') as file:
+        archive_type = detect_archive_type(file.read(ARCHIVE_HEADER_SIZE))
+    if archive_type == ArchiveTypes.GZIP:
+        # A gzip file is either a tar.gz or a single compressed log, the decompressed header tells them apart
+        with gzip.open(file_path, 'rb') as gzip_file:
+            if detect_archive_type(gzip_file.read(ARCHIVE_HEADER_SIZE)) == ArchiveTypes.TAR:
+                archive_type = ArchiveTypes.TAR
 
-def extract_file(file_path):
-    file_name = pathlib.Path(file_path).stem
+    if archive_type is None:
+        return None
 
-    if zipfile.is_zipfile(file_path):
-        file_type = 'Zip'
+    if archive_type == ArchiveTypes.ZIP:
         with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            extract_then_move(zip_ref, file_path, file_name, file_type)
+            check_member_paths(zip_ref.namelist(), output_path)
+            zip_ref.extractall(output_path)
 
-    elif tarfile.is_tarfile(file_path):
-        file_type = 'Tar'
-        with tarfile.open(file_path, 'r:gz') as tar_ref:
-            extract_then_move(tar_ref, file_path, file_name, file_type)
+    elif archive_type == ArchiveTypes.TAR:
+        with tarfile.open(file_path, 'r:*') as tar_ref:
+            if hasattr(tarfile, 'data_filter'):
+                tar_ref.extractall(output_path, filter='data')
+            else:
+                check_tar_members(tar_ref, output_path)
+                tar_ref.extractall(output_path)
 
-    elif file_path.endswith('.7z'):
-        file_type = '7Zip'
+    elif archive_type == ArchiveTypes.SEVEN_ZIP:
+        # py7zr is slow to import, so it is only imported once a 7zip archive is found
+        import py7zr
         with py7zr.SevenZipFile(file_path, mode='r') as seven_zip:
-            extract_then_move(seven_zip, file_path, file_name, file_type)
+            check_member_paths(seven_zip.getnames(), output_path)
+            seven_zip.extractall(output_path)
 
-    else:
-        log_general_message(f"No decompression performed on file {file_name} as it is not a zip, tar.gz, or 7zip file", "Regex Searching: Extracting Files")
+    elif archive_type == ArchiveTypes.GZIP:
+        with gzip.open(file_path, 'rb') as source, open(output_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, HASH_CHUNK_SIZE)
 
+    elif archive_type == ArchiveTypes.ZSTD:
+        zstandard = import_optional('zstandard')
+        if zstandard is None:
+            raise ImportError(f"The zstandard package is needed to decompress {file_path}")
+        with open(file_path, 'rb') as source, open(output_path, 'wb') as destination:
+            zstandard.ZstdDecompressor().copy_stream(source, destination)
+
+    return archive_type, output_path, time.perf_counter() - start_time
+
+def find_nested_archives(output_path):
+    """
+    Lists the archives found in the output of an extraction, which is either a folder or a single decompressed file
+    """
+    if os.path.isfile(output_path):
+        return [output_path] if is_archive_file(output_path) else []
+    nested_archives = []
+    for root, dirs, files in os.walk(output_path):
+        for file in files:
+            file_path = join_paths_and_convert(root, file)
+            if is_archive_file(file_path):
+                nested_archives.append(file_path)
+    return nested_archives
 
 def run_command(command):
     """
@@ -74,27 +238,1358 @@ def run_command(command):
     return subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
 
 def grep_pattern(pattern, file_path):
+    """
+    Runs grep for a pattern on a file and yields the matched lines as batches of (byte offset, line number, line), so
+    the grep output is never held in memory as a whole
+    """
     log_general_message(f"Processing '{pattern}' on the files '{file_path}'", "Regex Searching: Grep Commands")
     # Convert bytes to string for grep command
     pattern_str = pattern.decode('utf-8')
-    # Use grep to search for the pattern
-    grep_command = f"grep -P '{pattern_str}' {file_path}"
+    # Use grep to search for the pattern, -n and -b prefix each line with its line number and byte offset
+    grep_command = f"grep -P -n -b '{pattern_str}' {file_path}"
 
     # Execute the command
     process = run_command(grep_command)
-    # Get the output
-    output, error = process.communicate()
-    output_str = output.decode('utf-8')
-    # Count the number of occurrences of identical matches
-    lines = output_str.split('\n')
-
-    results = "\n".join(f"{line}" for line in lines)
+    # Read the output as it is produced
+    batch = []
+    for output_line in process.stdout:
+        line_number, byte_offset, line = output_line.rstrip(b'\n').split(b':', 2)
+        batch.append((int(byte_offset), int(line_number), line))
+        if len(batch) >= RESULT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    process.wait()
+
+def extract_required_literals(parsed_pattern):
+    """
+    Walks a parsed regex and returns a list of literals where at least one of them has to be in any line the regex
+    matches, or None when no such literal can be found. Where there are several choices the one whose shortest literal
+    is longest is used, as longer literals reject more lines.
+    """
+    candidates = []
+    literal_run = bytearray()
+    for op, av in parsed_pattern:
+        if op == sre_parse.LITERAL:
+            literal_run.append(av)
+            continue
+        if literal_run:
+            candidates.append([bytes(literal_run)])
+            literal_run.clear()
+
+        literals = None
+        if op == sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, sub_pattern = av
+            if not add_flags & re.IGNORECASE:
+                literals = extract_required_literals(sub_pattern)
+        elif op == sre_parse.BRANCH:
+            branch_literals = [extract_required_literals(branch) for branch in av[1]]
+            if all(branch_literals):
+                literals = [literal for branch in branch_literals for literal in branch]
+        elif op in REQUIRED_REPEAT_OPS:
+            minimum, maximum, sub_pattern = av
+            if minimum >= 1:
+                literals = extract_required_literals(sub_pattern)
+        if literals:
+            candidates.append(literals)
+
+    if literal_run:
+        candidates.append([bytes(literal_run)])
+    if not candidates:
+        return None
+    # Package and class names share their leading parts, such as org.apache.kafka, so between literals of the same
+    # length the later one is usually the rarer one
+    return max(reversed(candidates), key=lambda literals: min(len(literal) for literal in literals))
 
-    # If no results send back None
-    if len(results) == 0:
+def pattern_required_literals(pattern, flags=0):
+    """
+    Returns the required literals of a pattern, or None if the pattern has none or is not case sensitive
+    """
+    parsed_pattern = sre_parse.parse(pattern, flags)
+    if parsed_pattern.state.flags & re.IGNORECASE:
         return None
+    return extract_required_literals(parsed_pattern)
+
+def pattern_structure(pattern):
+    """
+    Returns (index, character, depth) of every (, ) and | of a pattern that is not escaped or inside a character class,
+    where depth is the number of groups open around the character
+    """
+    structure = []
+    depth = 0
+    index = 0
+    in_class = False
+    while index < len(pattern):
+        char = pattern[index:index + 1]
+        if char == b'\\':
+            index += 2
+            continue
+        if in_class:
+            in_class = char != b']'
+        elif char == b'[':
+            in_class = True
+            # A ] straight after the opening [ or [^ is part of the class rather than its end
+            if pattern[index + 1:index + 2] == b'^':
+                index += 1
+            if pattern[index + 1:index + 2] == b']':
+                index += 1
+        elif char == b'(':
+            structure.append((index, char, depth))
+            depth += 1
+        elif char == b')':
+            depth -= 1
+            structure.append((index, char, depth))
+        elif char == b'|':
+            structure.append((index, char, depth))
+        index += 1
+    return structure
+
+def split_top_level_branches(pattern):
+    """
+    Splits a pattern on the | characters that are outside of every group
+    """
+    branches = []
+    start = 0
+    for index, char, depth in pattern_structure(pattern):
+        if char == b'|' and depth == 0:
+            branches.append(pattern[start:index])
+            start = index + 1
+    branches.append(pattern[start:])
+    return branches
+
+def strip_leading_wildcards(pattern):
+    """
+    Removes a leading .* or ^.* from each top level branch of a pattern, and from the first branches of groups that open
+    a branch. A search for the rest of the branch matches exactly the same lines, while a leading .* makes the regex
+    engine retry it from every position of the line, which is quadratic in the line length. Groups repeated with {}
+    are left alone, as .*a{2} and a{2} do not match the same lines.
+    """
+    stripped_branches = []
+    for branch in split_top_level_branches(pattern):
+        while True:
+            wildcard = LEADING_WILDCARD_PATTERN.match(branch)
+            if wildcard is None:
+                break
+            branch = branch[wildcard.end():]
+        group_opening = GROUP_OPENING_PATTERN.match(branch)
+        if group_opening is not None:
+            group_end = next((index for index, char, depth in pattern_structure(branch) if char == b')' and depth == 0),
+                             None)
+            if group_end is not None and branch[group_end + 1:group_end + 2] != b'{':
+                branch = (branch[:group_opening.end()] + strip_leading_wildcards(branch[group_opening.end():group_end])
+                          + branch[group_end:])
+        stripped_branches.append(branch)
+    return b'|'.join(stripped_branches)
+
+def pattern_search_form(pattern, strip_wildcards=True):
+    """
+    Rewrites a pattern into the form used to test lines, returning (search pattern, inline flag letters, compile flags).
+    Inline flags such as (?i) are taken out and applied to the whole pattern, as Python only accepts them at the very
+    start where grep -P accepts them anywhere, and leading wildcards are removed by strip_leading_wildcards unless
+    strip_wildcards is False. Patterns with backreferences are left as they are, since removing a wildcard can change
+    what a group captured.
+    """
+    flag_letters = b''
+    for index, char, depth in reversed(pattern_structure(pattern)):
+        inline_flags = INLINE_FLAGS_PATTERN.match(pattern, index) if char == b'(' else None
+        if inline_flags is not None:
+            flag_letters += inline_flags.group(1)
+            pattern = pattern[:index] + pattern[inline_flags.end():]
+    # The u flag is the default for str patterns and is not allowed on bytes
+    flag_letters = bytes(sorted(set(flag_letters) - set(b'u')))
+    flags = 0
+    for letter in flag_letters:
+        flags |= INLINE_FLAG_VALUES[letter]
+    if strip_wildcards and BACKREFERENCE_PATTERN.search(pattern) is None:
+        pattern = strip_leading_wildcards(pattern)
+    return pattern, flag_letters, flags
+
+class PrefilterCounts():
+    """
+    Per pattern counts of the lines scanned and of the lines that passed the literal prefilter and were tested with the
+    full regex, the difference between the two is the lines the prefilter skipped. The time spent in each pattern's
+    regex and the time the whole scan took are gathered alongside them for the run report. lines_read counts every
+    line read, including lines outside a time window, so the lines of a file scanned in chunks can be numbered.
+    """
+    def __init__(self, pattern_count):
+        self.lines_scanned = [0] * pattern_count
+        self.lines_tested = [0] * pattern_count
+        self.regex_seconds = [0.0] * pattern_count
+        self.scan_seconds = 0.0
+        self.lines_read = 0
+
+    def add(self, other, pattern_indexes):
+        """
+        Adds counts gathered over a subset of the patterns, pattern_indexes maps the subset back to these patterns
+        """
+        for index, pattern_index in enumerate(pattern_indexes):
+            self.lines_scanned[pattern_index] += other.lines_scanned[index]
+            self.lines_tested[pattern_index] += other.lines_tested[index]
+            self.regex_seconds[pattern_index] += other.regex_seconds[index]
+        self.scan_seconds += other.scan_seconds
+        self.lines_read += other.lines_read
+
+class PatternSet():
+    """
+    Holds every configured regex pattern compiled once in its search form, along with the literals each pattern
+    requires. Lines that contain none of the required literals are rejected by a single alternation of all the
+    literals, and each pattern's full regex only runs on lines containing one of its own literals. When a pattern has
+    no required literal the alternation of all the patterns as named groups is used to reject lines instead, unless the
+    patterns cannot be joined, for example when two of them use the same group name, and then every pattern is tested.
+    """
+    def __init__(self, patterns, required_literals=None):
+        self.patterns = list(patterns)
+        search_forms = [pattern_search_form(pattern) for pattern in self.patterns]
+        self.compiled_patterns = [re.compile(search_pattern, flags) for search_pattern, flag_letters, flags in search_forms]
+        self.group_names = [f'p{index}' for index in range(len(self.patterns))]
+        try:
+            # Flags are scoped to their own pattern inside the alternation
+            self.combined_pattern = re.compile(b'|'.join(
+                b'(?P<%s>(?%s:%s))' % (name.encode('utf-8'), flag_letters, search_pattern)
+                for name, (search_pattern, flag_letters, flags) in zip(self.group_names, search_forms)))
+        except re.error:
+            self.combined_pattern = None
+
+        # The literals can be handed in from the pattern cache, which skips parsing every pattern again
+        if required_literals is None:
+            required_literals = [pattern_required_literals(search_pattern, flags)
+                                 for search_pattern, flag_letters, flags in search_forms]
+        self.required_literals = required_literals
+        # Each distinct literal and the patterns requiring it, so a line is checked for every literal only once
+        literal_pattern_indexes = collections.defaultdict(list)
+        for index, literals in enumerate(self.required_literals):
+            for literal in literals or ():
+                literal_pattern_indexes[literal].append(index)
+        self.literal_pattern_indexes = list(literal_pattern_indexes.items())
+        self.unfiltered_pattern_indexes = [index for index, literals in enumerate(self.required_literals)
+                                           if literals is None]
+        if all(self.required_literals):
+            self.literal_prefilter = re.compile(b'|'.join(re.escape(literal) for literal in
+                                                          sorted(literal_pattern_indexes, key=len, reverse=True)))
+        else:
+            self.literal_prefilter = None
+
+    def match_line(self, line, prefilter_counts=None):
+        """
+        Returns the indexes of every pattern that matches the line, in pattern order.
+        """
+        if self.literal_prefilter is not None:
+            if self.literal_prefilter.search(line) is None:
+                return []
+        elif self.combined_pattern is not None and self.combined_pattern.search(line) is None:
+            return []
+
+        candidate_indexes = set(self.unfiltered_pattern_indexes)
+        for literal, pattern_indexes in self.literal_pattern_indexes:
+            if literal in line:
+                candidate_indexes.update(pattern_indexes)
+
+        matched_indexes = []
+        for index in sorted(candidate_indexes):
+            compiled_pattern = self.compiled_patterns[index]
+            if prefilter_counts is not None:
+                prefilter_counts.lines_tested[index] += 1
+                regex_start_time = time.perf_counter()
+                regex_match = compiled_pattern.search(line)
+                prefilter_counts.regex_seconds[index] += time.perf_counter() - regex_start_time
+            else:
+                regex_match = compiled_pattern.search(line)
+            if regex_match:
+                matched_indexes.append(index)
+        return matched_indexes
+
+def scan_stream(stream, pattern_set, prefilter_counts=None, start_offset=0, trace_assembler=None, first_line_number=1,
+                since=None, until=None):
+    """
+    Reads a binary stream line by line a single time and yields (pattern_index, byte_offset, line_number, line) for
+    every pattern that matches, where byte_offset is the position of the line in the stream plus start_offset and the
+    first line of the stream is numbered first_line_number.
+    Trailing newlines are removed from the lines the same way grep removes them from its output.
+    When a trace assembler is given every line is also handed to it, so stack traces are assembled in the same read.
+    When since or until is set only the lines of events in that time window are scanned, for streams such as archive
+    members that cannot be binary searched, while the lines outside it are still counted in the offsets and numbers.
+    """
+    has_time_window = since is not None or until is not None
+    in_window = not has_time_window
+    skipped_line_count = 0
+    byte_offset = start_offset
+    line_number = first_line_number - 1
+    for line_number, line in enumerate(stream, first_line_number):
+        line_offset = byte_offset
+        byte_offset += len(line)
+        if has_time_window:
+            in_window = is_in_time_window(line, in_window, since, until)
+            if not in_window:
+                skipped_line_count += 1
+                continue
+        line = line.rstrip(b'\n')
+        if trace_assembler is not None:
+            trace_assembler.add_line(line)
+        for pattern_index in pattern_set.match_line(line, prefilter_counts):
+            yield pattern_index, line_offset, line_number, line
+    if prefilter_counts is not None:
+        prefilter_counts.lines_read += line_number - first_line_number + 1
+        for index in range(len(prefilter_counts.lines_scanned)):
+            prefilter_counts.lines_scanned[index] += line_number - first_line_number + 1 - skipped_line_count
+
+class StackTraces():
+    """
+    Assembled stack traces counted by fingerprint, the exception type plus the top frames of the trace, along with the
+    first and last timestamp each fingerprint was seen at and the first occurrence as an example
+    """
+    def __init__(self):
+        # Fingerprint to [count, first timestamp, last timestamp, example label, example exception line]
+        self.fingerprints = {}
+
+    def add(self, fingerprint, count, first_timestamp, last_timestamp, label, message):
+        entry = self.fingerprints.get(fingerprint)
+        if entry is None:
+            self.fingerprints[fingerprint] = [count, first_timestamp, last_timestamp, label, message]
+            return
+        entry[0] += count
+        if first_timestamp is not None and (entry[1] is None or first_timestamp < entry[1]):
+            entry[1] = first_timestamp
+        if last_timestamp is not None and (entry[2] is None or last_timestamp > entry[2]):
+            entry[2] = last_timestamp
+
+    def merge(self, other):
+        for fingerprint, (count, first_timestamp, last_timestamp, label, message) in other.fingerprints.items():
+            self.add(fingerprint, count, first_timestamp, last_timestamp, label, message)
+
+class StackTraceAssembler():
+    """
+    Attaches the continuation lines of a log event to it while a stream is scanned. A line such as
+    java.io.IOException: ... that follows an event opens a trace, its "at ..." frames are collected up to frame_count,
+    and the trace is counted in stack_traces under the timestamp of its event once a line that is not part of it is seen.
+    Frames of "Caused by:" and "Suppressed:" sections are not part of the fingerprint.
+    """
+    def __init__(self, stack_traces, label, frame_count):
+        self.stack_traces = stack_traces
+        self.label = label
+        self.frame_count = frame_count
+        self.event_timestamp = None
+        self.exception_type = None
+        self.message = None
+        self.frames = []
+        self.collecting_frames = False
+
+    def add_line(self, line):
+        if line.startswith(b'['):
+            timestamp_match = LOG_TIMESTAMP_PATTERN.match(line)
+            if timestamp_match:
+                self.finish_trace()
+                self.event_timestamp = timestamp_match.group(1)
+                return
+
+        if self.exception_type is not None:
+            stripped_line = line.lstrip()
+            if stripped_line.startswith(b'at '):
+                if self.collecting_frames and len(self.frames) < self.frame_count:
+                    # Keep the method and drop the (File.java:line) part so traces from rebuilt jars still group
+                    self.frames.append(stripped_line[3:].split(b'(', 1)[0].decode('utf-8', errors='replace'))
+                return
+            if stripped_line.startswith((b'Caused by:', b'Suppressed:', b'...')):
+                self.collecting_frames = False
+                return
+            self.finish_trace()
+
+        exception_match = EXCEPTION_HEADER_PATTERN.match(line)
+        if exception_match:
+            self.exception_type = exception_match.group(1).decode('utf-8', errors='replace')
+            self.message = line[:STACK_TRACE_MESSAGE_LENGTH].decode('utf-8', errors='replace')
+            self.collecting_frames = True
+
+    def needs_more_lines(self):
+        """
+        True while the open trace could still gain frames, used to read past the end of a chunk to finish it
+        """
+        return self.exception_type is not None and self.collecting_frames and len(self.frames) < self.frame_count
+
+    def finish_trace(self):
+        if self.exception_type is None:
+            return
+        timestamp = self.event_timestamp.decode('ascii') if self.event_timestamp is not None else None
+        self.stack_traces.add((self.exception_type, tuple(self.frames)), 1, timestamp, timestamp, self.label,
+                              self.message)
+        self.exception_type = None
+        self.message = None
+        self.frames = []
+        self.collecting_frames = False
+
+class PrefixedStream(io.RawIOBase):
+    """
+    Replays bytes already read from the start of a stream before continuing with the rest of the stream, used so the
+    archive type of a non seekable stream can be detected from its header
+    """
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def detect_archive_type(header):
+    """
+    Detects the archive type from the first bytes of a file, returns None when the bytes are not a known archive
+    """
+    if header.startswith(b'PK\x03\x04'):
+        return ArchiveTypes.ZIP
+    if header.startswith(b'7z\xbc\xaf\x27\x1c'):
+        return ArchiveTypes.SEVEN_ZIP
+    if header.startswith(b'\x1f\x8b'):
+        return ArchiveTypes.GZIP
+    if header.startswith(b'\x28\xb5\x2f\xfd'):
+        return ArchiveTypes.ZSTD
+    if header[257:262] == b'ustar':
+        return ArchiveTypes.TAR
+    return None
+
+def stream_is_seekable(stream):
+    """
+    Members of a tar being streamed raise instead of returning False from seekable(), so both count as not seekable
+    """
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return False
+
+def make_seekable(stream):
+    """
+    Zip and 7zip members need random access, so non seekable streams are copied to a spooled temporary file that only
+    uses disk once the member is larger than the configured spool size
+    """
+    if stream_is_seekable(stream):
+        return stream
+    spooled_file = tempfile.SpooledTemporaryFile(max_size=global_config.archive_spool_max_bytes)
+    shutil.copyfileobj(stream, spooled_file)
+    spooled_file.seek(0)
+    return spooled_file
+
+def iterate_log_streams(label, stream, depth=0):
+    """
+    Yields (label, binary stream) for a plain file, or for every member of an archive without extracting it to disk.
+    Archives nested inside archives are opened recursively up to the configured depth, and members are labeled as
+    archive!member so results can be attributed to them.
+    """
+    if stream_is_seekable(stream):
+        start_position = stream.tell()
+        header = stream.read(ARCHIVE_HEADER_SIZE)
+        stream.seek(start_position)
     else:
-        return f"Results for pattern '{pattern_str}' in file '{file_path}: \n{results}\n"
+        header = stream.read(ARCHIVE_HEADER_SIZE)
+        stream = io.BufferedReader(PrefixedStream(header, stream))
+    archive_type = detect_archive_type(header)
+
+    if archive_type is None or depth >= global_config.max_archive_depth:
+        yield label, stream
+        return
+
+    log_general_message(f"Streaming {archive_type.value} archive {label}", "Regex Searching: Streaming Archives")
+
+    if archive_type == ArchiveTypes.GZIP:
+        # A gzip file is either a tar.gz or a single compressed log, the decompressed header tells them apart
+        yield from iterate_log_streams(label, gzip.GzipFile(fileobj=stream), depth + 1)
+
+    elif archive_type == ArchiveTypes.ZSTD:
+        zstandard = import_optional('zstandard')
+        if zstandard is None:
+            log_general_message(f"Skipping {label} as the zstandard package is not installed",
+                                "Regex Searching: Streaming Archives", string_log_level='WARN')
+            return
+        yield from iterate_log_streams(label, zstandard.ZstdDecompressor().stream_reader(stream), depth + 1)
+
+    elif archive_type == ArchiveTypes.TAR:
+        with tarfile.open(fileobj=stream, mode='r|') as tar_ref:
+            for member in tar_ref:
+                if member.isfile():
+                    yield from iterate_log_streams(f"{label}{ARCHIVE_MEMBER_SEPARATOR}{member.name}",
+                                                   tar_ref.extractfile(member), depth + 1)
+
+    elif archive_type == ArchiveTypes.ZIP:
+        with zipfile.ZipFile(make_seekable(stream), 'r') as zip_ref:
+            for member in zip_ref.infolist():
+                if not member.is_dir():
+                    with zip_ref.open(member) as member_stream:
+                        yield from iterate_log_streams(f"{label}{ARCHIVE_MEMBER_SEPARATOR}{member.filename}",
+                                                       member_stream, depth + 1)
+
+    elif archive_type == ArchiveTypes.SEVEN_ZIP:
+        import py7zr
+        with py7zr.SevenZipFile(make_seekable(stream), mode='r') as seven_zip:
+            for member_name, member_stream in iterate_seven_zip_members(seven_zip):
+                yield from iterate_log_streams(f"{label}{ARCHIVE_MEMBER_SEPARATOR}{member_name}",
+                                               member_stream, depth + 1)
+
+def iterate_seven_zip_members(seven_zip):
+    """
+    Yields (member name, binary stream) for every file in an open 7zip archive. py7zr has no per member streaming
+    reader, so older versions decompress the members into memory with readall, while versions without readall extract
+    them into a temporary folder that is removed once every member has been read.
+    """
+    if hasattr(seven_zip, 'readall'):
+        yield from seven_zip.readall().items()
+        return
+    with tempfile.TemporaryDirectory(dir=global_config.results_folder_full_path) as extract_folder:
+        check_member_paths(seven_zip.getnames(), extract_folder)
+        seven_zip.extractall(path=extract_folder)
+        for root, dirs, files in os.walk(extract_folder):
+            for file in sorted(files):
+                member_path = join_paths_and_convert(root, file)
+                with open(member_path, 'rb') as member_stream:
+                    yield pathlib.Path(os.path.relpath(member_path, extract_folder)).as_posix(), member_stream
+
+def scan_file(file_path, pattern_set, since=None, until=None, trace_frame_count=None, put_results=None):
+    """
+    Scans a file once against all patterns, streaming the members of the file if it is an archive.
+    Returns a list of (label, matches), where matches is a dict of pattern index to the list of
+    (byte offset, line number, line) matched, along with the prefilter counts of the scan. Only events between since and until are scanned when either is set.
+    When trace_frame_count is set the stack traces assembled during the scan are returned too, otherwise None is.
+    When put_results is given the matches are handed to it as (label, matches) in batches of at most RESULT_BATCH_SIZE
+    lines while the file is read instead, and the returned list is empty. Every member is handed over at least once,
+    even without matches, so the members are counted the same way whichever patterns are scanned.
+    """
+    log_general_message(f"Processing all patterns on the file '{file_path}'", "Regex Searching: Single Pass Scan")
+    scan_start_time = time.perf_counter()
+    results = []
+    prefilter_counts = PrefilterCounts(len(pattern_set.patterns))
+    stack_traces = StackTraces() if trace_frame_count else None
+    try:
+        with open(file_path, 'rb') as file:
+            for label, stream in iterate_log_streams(file_path, file):
+                trace_assembler = StackTraceAssembler(stack_traces, label, trace_frame_count) if trace_frame_count else None
+                matches = {}
+                batch_line_count = 0
+                member_put = False
+                for pattern_index, byte_offset, line_number, line in scan_stream(
+                        stream, pattern_set, prefilter_counts, trace_assembler=trace_assembler, since=since, until=until):
+                    matches.setdefault(pattern_index, []).append((byte_offset, line_number, line))
+                    if put_results is not None:
+                        batch_line_count += 1
+                        if batch_line_count >= RESULT_BATCH_SIZE:
+                            put_results(label, matches)
+                            matches = {}
+                            batch_line_count = 0
+                            member_put = True
+                if trace_assembler is not None:
+                    trace_assembler.finish_trace()
+                if put_results is None:
+                    results.append((label, matches))
+                elif matches or not member_put:
+                    put_results(label, matches)
+    except Exception as error:
+        # A corrupt or unsupported archive is skipped, keeping the results of the members read before the error
+        log_general_message(f"Skipping the rest of '{file_path}' after an error reading it: {error}",
+                            "Regex Searching: Single Pass Scan", string_log_level='ERROR')
+    prefilter_counts.scan_seconds = time.perf_counter() - scan_start_time
+    return results, prefilter_counts, stack_traces
+
+def load_pattern_set(patterns):
+    """
+    Builds the PatternSet of the patterns, reusing the required literals cached on disk under a hash of the pattern
+    contents. Python cannot store compiled regexes, so they are compiled again from their source, but the parse of
+    every pattern that extracts its literals is skipped whenever the same patterns were used before.
+    """
+    pattern_hash = hashlib.blake2b(b'\0'.join(patterns) + sys.version.encode('utf-8'), digest_size=16).hexdigest()
+    cache_full_path = join_paths_and_convert(global_config.pattern_cache_folder_full_path,
+                                             f'{pattern_hash}-v{PATTERN_CACHE_VERSION}.json')
+    if os.path.exists(cache_full_path):
+        with open(cache_full_path, 'r') as cache_file:
+            required_literals = json.load(cache_file)
+        return PatternSet(patterns, [None if literals is None else
+                                     [literal.encode(CACHE_BYTES_ENCODING) for literal in literals]
+                                     for literals in required_literals])
+
+    pattern_set = PatternSet(patterns)
+    os.makedirs(global_config.pattern_cache_folder_full_path, exist_ok=True)
+    with open(cache_full_path, 'w') as cache_file:
+        json.dump([None if literals is None else [literal.decode(CACHE_BYTES_ENCODING) for literal in literals]
+                   for literals in pattern_set.required_literals], cache_file)
+    return pattern_set
+
+@functools.lru_cache(maxsize=None)
+def get_pattern_set(patterns):
+    """
+    Compiles a tuple of patterns once per process, so pool workers reuse the same PatternSet across chunks
+    """
+    return PatternSet(patterns)
+
+def is_archive_file(file_path):
+    """
+    Checks the header of a file on disk to tell if it is an archive that needs to be streamed
+    """
+    with open(file_path, 'rb') as file:
+        return detect_archive_type(file.read(ARCHIVE_HEADER_SIZE)) is not None
+
+def compute_line_aligned_chunks(file_path, chunk_size, range_start=0, range_end=None):
+    """
+    Splits a file, or a line aligned byte range of it, into (start, end) byte ranges of roughly chunk_size bytes, with
+    every range ending just after a newline so no line is split between two chunks
+    """
+    if range_end is None:
+        range_end = os.path.getsize(file_path)
+    if range_end - range_start <= chunk_size:
+        return [(range_start, range_end)]
+
+    chunks = []
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        start = range_start
+        while start < range_end:
+            newline_position = mapped_file.find(b'\n', min(start + chunk_size, range_end) - 1, range_end)
+            end = range_end if newline_position == -1 else newline_position + 1
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+def next_timestamped_line(mapped_file, position):
+    """
+    Returns (line start, timestamp) of the first line starting at or after position that begins with a log timestamp,
+    skipping continuation lines such as stack trace frames, or (None, None) when there is no such line
+    """
+    if position > 0 and mapped_file[position - 1:position] != b'\n':
+        position = mapped_file.find(b'\n', position) + 1
+        if position == 0:
+            return None, None
+    file_size = len(mapped_file)
+    while position < file_size:
+        timestamp_match = LOG_TIMESTAMP_PATTERN.match(mapped_file[position:position + LOG_TIMESTAMP_LENGTH])
+        if timestamp_match:
+            return position, timestamp_match.group(1)
+        position = mapped_file.find(b'\n', position) + 1
+        if position == 0:
+            break
+    return None, None
+
+def bisect_timestamped_lines(mapped_file, is_past_bound):
+    """
+    Binary searches a time ordered file for the start of the first timestamped line whose timestamp is past the bound,
+    returns the file size when there is none
+    """
+    low, high = 0, len(mapped_file)
+    while low < high:
+        middle = (low + high) // 2
+        line_start, timestamp = next_timestamped_line(mapped_file, middle)
+        if line_start is None or is_past_bound(timestamp):
+            high = middle
+        else:
+            # Every position up to this line leads to a timestamp before the bound
+            low = line_start + 1
+    line_start, timestamp = next_timestamped_line(mapped_file, low)
+    return len(mapped_file) if line_start is None else line_start
+
+def compute_time_window_range(file_path, since, until):
+    """
+    Finds the (start, end) byte range of a time ordered log holding the events between since and until, both inclusive
+    timestamps as bytes or None. The range starts and ends on timestamped lines, so continuation lines stay with the
+    event they belong to. Returns None when the file has no timestamped lines.
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return None
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        if next_timestamped_line(mapped_file, 0)[0] is None:
+            return None
+        start = 0 if since is None else bisect_timestamped_lines(mapped_file, lambda timestamp: timestamp >= since)
+        end = file_size if until is None else bisect_timestamped_lines(mapped_file, lambda timestamp: timestamp > until)
+    return start, max(start, end)
+
+def is_in_time_window(line, in_window, since, until):
+    """
+    Returns whether a line belongs to an event between since and until, given whether the line before it did.
+    A timestamped line starts a new event, continuation lines follow the event they belong to, and lines before the
+    first timestamp in a stream are outside the window.
+    """
+    timestamp_match = LOG_TIMESTAMP_PATTERN.match(line)
+    if timestamp_match is None:
+        return in_window
+    timestamp = timestamp_match.group(1)
+    return (since is None or timestamp >= since) and (until is None or timestamp <= until)
+
+def count_lines(mapped_file, start, end):
+    """
+    Counts the newlines in a byte range of a mapped file, a slice at a time so the range is never copied at once
+    """
+    line_count = 0
+    for position in range(start, end, HASH_CHUNK_SIZE):
+        line_count += mapped_file[position:min(position + HASH_CHUNK_SIZE, end)].count(b'\n')
+    return line_count
+
+def scan_file_range(file_path, start, end, patterns, trace_frame_count=None, count_lines_from=None):
+    """
+    Process pool worker that scans one line aligned byte range of a file through mmap.
+    Only uses its arguments so it can run in a fresh process, returns [(file_path, matches)], the prefilter counts and
+    the assembled stack traces like scan_file.
+    Lines are numbered from 1 at start, the caller adds the lines read by the chunks before it, which are in the
+    lines_read of their prefilter counts. When count_lines_from is given the lines between it and start are counted
+    first and included in both, used for a range starting part way into a file such as a time window.
+    A trace belongs to the range holding its exception line, so a trace still open at the end of the range is finished
+    by reading on past the end, while frames at the start of a range without their exception line are ignored.
+    """
+    scan_start_time = time.perf_counter()
+    matches = {}
+    prefilter_counts = PrefilterCounts(len(patterns))
+    stack_traces = StackTraces() if trace_frame_count else None
+    if end > start:
+        pattern_set = get_pattern_set(patterns)
+        trace_assembler = StackTraceAssembler(stack_traces, file_path, trace_frame_count) if trace_frame_count else None
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            skipped_line_count = 0
+            if count_lines_from is not None:
+                skipped_line_count = count_lines(mapped_file, count_lines_from, start)
+            for pattern_index, byte_offset, line_number, line in scan_stream(
+                    io.BytesIO(mapped_file[start:end]), pattern_set, prefilter_counts, start, trace_assembler,
+                    skipped_line_count + 1):
+                matches.setdefault(pattern_index, []).append((byte_offset, line_number, line))
+            prefilter_counts.lines_read += skipped_line_count
+            if trace_assembler is not None:
+                mapped_file.seek(end)
+                while trace_assembler.needs_more_lines():
+                    line = mapped_file.readline()
+                    if not line:
+                        break
+                    trace_assembler.add_line(line.rstrip(b'\n'))
+                trace_assembler.finish_trace()
+    prefilter_counts.scan_seconds = time.perf_counter() - scan_start_time
+    return [(file_path, matches)], prefilter_counts, stack_traces
+
+def hash_file_contents(file_path):
+    """
+    Hashes the contents of a file in fixed size chunks so large files are never read into memory at once
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def hash_pattern(pattern):
+    """
+    Short stable identifier of a pattern used as a key in the scan cache
+    """
+    return hashlib.blake2b(pattern, digest_size=8).hexdigest()
+
+class ScanCache():
+    """
+    Persistent cache of single pass scan results kept in the results folder between runs.
+    The manifest maps each file path to its size, mtime and content hash, so unchanged files are not hashed again.
+    Each content hash has a results file per pattern already scanned against that content, holding one JSON record per
+    matched line, so results are written as they are scanned and read back as a stream instead of being loaded whole.
+    """
+    def __init__(self, cache_folder_full_path):
+        self.cache_folder_full_path = cache_folder_full_path
+        self.manifest_full_path = join_paths_and_convert(cache_folder_full_path, 'scan_cache_manifest.json')
+        os.makedirs(cache_folder_full_path, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_full_path):
+            with open(self.manifest_full_path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+            # Results cached by an older version of the scan have a different layout and are not reused
+            if manifest.get('version') == SCAN_CACHE_VERSION:
+                self.manifest = manifest['files']
+        self.hits = 0
+        self.misses = 0
+
+    def cached_content_hash(self, file_path, file_stat):
+        """
+        Returns the content hash in the manifest when the size and mtime of the file are unchanged, otherwise None
+        """
+        entry = self.manifest.get(file_path)
+        if entry and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns:
+            return entry['content_hash']
+        return None
+
+    def record_content_hash(self, file_path, file_stat, content_hash):
+        self.manifest[file_path] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                                    'content_hash': content_hash}
+
+    def results_full_path(self, content_hash, pattern):
+        return join_paths_and_convert(self.cache_folder_full_path,
+                                      f'{content_hash}-{hash_pattern(pattern)}-v{SCAN_CACHE_VERSION}.jsonl')
+
+    def open_entry(self, file_path, patterns):
+        """
+        Returns the ScanCacheEntry of the recorded contents of the file, listing the patterns without cached results
+        """
+        content_hash = self.manifest[file_path]['content_hash']
+        results_full_paths = [self.results_full_path(content_hash, pattern) for pattern in patterns]
+        missing_pattern_indexes = [index for index, results_full_path in enumerate(results_full_paths)
+                                   if not os.path.exists(results_full_path)]
+        if missing_pattern_indexes:
+            self.misses += 1
+            log_general_message(f"Scan cache miss for '{file_path}', scanning {len(missing_pattern_indexes)} of "
+                                f"{len(patterns)} patterns", "Regex Searching: Scan Cache")
+        else:
+            self.hits += 1
+            log_general_message(f"Scan cache hit for '{file_path}'", "Regex Searching: Scan Cache")
+        return ScanCacheEntry(file_path, results_full_paths, missing_pattern_indexes)
+
+    def save(self):
+        with open(self.manifest_full_path, 'w') as manifest_file:
+            json.dump({'version': SCAN_CACHE_VERSION, 'files': self.manifest}, manifest_file)
+        log_general_message(f"Scan cache finished with {self.hits} hit(s) and {self.misses} miss(es)",
+                            "Regex Searching: Scan Cache")
+
+class ScanCacheEntry():
+    """
+    The cached results of one file's contents for every pattern. Matches of the patterns missing from the cache are
+    appended to temporary results files as they are added and moved into place once the file is finished, so a file
+    interrupted part way is never taken as cached. Each record is [member index, label suffix, byte offset,
+    line number, line], where the member index counts the labels of the file in order and the label suffix is the
+    archive member part of the label, so the results can be reused wherever the same contents are found.
+    When some of the patterns were cached before, the results of every pattern are replayed from the cache in file
+    order once the file is finished, otherwise the matches added are already all the results of the file.
+    """
+    def __init__(self, file_path, results_full_paths, missing_pattern_indexes):
+        self.file_path = file_path
+        self.results_full_paths = results_full_paths
+        self.missing_pattern_indexes = missing_pattern_indexes
+        self.replays_results = len(missing_pattern_indexes) < len(results_full_paths)
+        self.results_files = None
+        self.label = None
+        self.member_index = -1
+
+    def open_results_files(self):
+        # Opened on first use rather than when the entry is created, so only the file being written holds files open
+        if self.results_files is None:
+            self.results_files = {pattern_index: open(f"{self.results_full_paths[pattern_index]}.tmp", 'w')
+                                  for pattern_index in self.missing_pattern_indexes}
+
+    def add(self, label, matches):
+        """
+        Appends the matches of one label, given in the order the labels are found in the file
+        """
+        self.open_results_files()
+        if label != self.label:
+            self.label = label
+            self.member_index += 1
+        label_suffix = label[len(self.file_path):]
+        for pattern_index, lines in matches.items():
+            self.results_files[pattern_index].writelines(
+                json.dumps([self.member_index, label_suffix, byte_offset, line_number,
+                            line.decode(CACHE_BYTES_ENCODING)]) + '\n'
+                for byte_offset, line_number, line in lines)
+
+    def finish(self):
+        self.open_results_files()
+        for pattern_index, results_file in self.results_files.items():
+            results_file.close()
+            os.replace(results_file.name, self.results_full_paths[pattern_index])
+
+    def cached_batches(self):
+        """
+        Yields (label, matches) from the results files of every pattern in file order, in batches of at most
+        RESULT_BATCH_SIZE lines, holding only one pending record per pattern
+        """
+        def read_records(pattern_index, results_file):
+            for record in results_file:
+                member_index, label_suffix, byte_offset, line_number, line = json.loads(record)
+                yield member_index, byte_offset, pattern_index, label_suffix, line_number, line
+
+        with contextlib.ExitStack() as exit_stack:
+            results_files = [exit_stack.enter_context(open(results_full_path, 'r'))
+                             for results_full_path in self.results_full_paths]
+            batch_member_index, batch_label, matches, batch_line_count = None, None, {}, 0
+            for member_index, byte_offset, pattern_index, label_suffix, line_number, line in heapq.merge(
+                    *(read_records(pattern_index, results_file) for pattern_index, results_file in enumerate(results_files))):
+                if member_index != batch_member_index or batch_line_count >= RESULT_BATCH_SIZE:
+                    if matches:
+                        yield batch_label, matches
+                    batch_member_index, batch_label = member_index, f"{self.file_path}{label_suffix}"
+                    matches, batch_line_count = {}, 0
+                matches.setdefault(pattern_index, []).append((byte_offset, line_number, line.encode(CACHE_BYTES_ENCODING)))
+                batch_line_count += 1
+            if matches:
+                yield batch_label, matches
+
+def list_log_files():
+    """
+    Lists every file in the log parsing folder in walk order, leaving out files found to be copies of another file
+    """
+    file_paths = []
+    for root, dirs, files in os.walk(global_config.log_parsing_folder_full_path):
+        for file in files:
+            file_path = join_paths_and_convert(root, file)
+            if file_path not in global_config.duplicate_log_files:
+                file_paths.append(file_path)
+    return file_paths
+
+def deduplicate_log_files():
+    """
+    Finds files in the log parsing folder with identical contents so each content is only scanned once. Files are
+    grouped by size first and only files sharing a size are hashed in chunks, then the first path of each identical
+    group is kept and the others are recorded as its aliases.
+    """
+    files_by_size = collections.defaultdict(list)
+    for file_path in list_log_files():
+        files_by_size[os.path.getsize(file_path)].append(file_path)
+
+    skipped_bytes = 0
+    for file_size, file_paths in files_by_size.items():
+        if len(file_paths) < 2:
+            continue
+        files_by_hash = collections.defaultdict(list)
+        for file_path in file_paths:
+            files_by_hash[hash_file_contents(file_path)].append(file_path)
+        global_config.run_report.add_files('move', 0, file_size * len(file_paths))
+        for kept_path, *duplicate_paths in files_by_hash.values():
+            if not duplicate_paths:
+                continue
+            global_config.log_file_aliases[kept_path] = duplicate_paths
+            global_config.duplicate_log_files.update(duplicate_paths)
+            skipped_bytes += file_size * len(duplicate_paths)
+            log_general_message(f"Skipping {len(duplicate_paths)} identical copies of {kept_path}: {', '.join(duplicate_paths)}",
+                                "Moving Files: Deduplicating Files", string_log_level='DEBUG')
+
+    log_general_message(f"Found {len(global_config.duplicate_log_files)} duplicate file(s), skipping {skipped_bytes} "
+                        f"bytes that would have been scanned more than once",
+                        "Moving Files: Deduplicating Files")
+
+def label_aliases(label):
+    """
+    Returns the other paths the contents behind a label were found at, keeping the archive member part of the label
+    """
+    file_path, separator, member = label.partition(ARCHIVE_MEMBER_SEPARATOR)
+    return [f"{alias_path}{separator}{member}" for alias_path in global_config.log_file_aliases.get(file_path, ())]
+
+def log_prefilter_counts(patterns, prefilter_counts):
+    """
+    Logs how many lines each pattern's literal prefilter let through to the full regex and how many it skipped
+    """
+    for index, pattern in enumerate(patterns):
+        lines_scanned = prefilter_counts.lines_scanned[index]
+        lines_tested = prefilter_counts.lines_tested[index]
+        if lines_scanned == 0:
+            continue
+        log_general_message(f"Prefilter for pattern '{pattern.decode('utf-8')}' sent {lines_tested} of {lines_scanned} "
+                            f"lines to the regex ({lines_tested / lines_scanned:.2%} hit, "
+                            f"{(lines_scanned - lines_tested) / lines_scanned:.2%} skipped)",
+                            "Regex Searching: Literal Prefilter")
+
+def create_process_pool():
+    """
+    Creates the process pool used for scanning and indexing. Workers are spawned rather than forked, so they never
+    inherit locks held by the writer and logging threads of this process.
+    """
+    return concurrent.futures.ProcessPoolExecutor(max_workers=global_config.scan_worker_count,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+
+def results_in_order(scheduled_scans):
+    """
+    Pulls (key, future) pairs from a lazily submitting iterator and yields (key, result) in the same order, keeping at
+    most scan_max_in_flight futures scheduled. Waiting on the oldest future before submitting more work is what bounds
+    the results held in memory when writing falls behind scanning. A None future yields a None result, and a
+    StreamedScan can be scheduled in place of a future.
+    """
+    in_flight = collections.deque()
+    for key, future in scheduled_scans:
+        in_flight.append((key, future))
+        if len(in_flight) >= global_config.scan_max_in_flight:
+            key, future = in_flight.popleft()
+            yield key, None if future is None else future.result()
+    while in_flight:
+        key, future = in_flight.popleft()
+        yield key, None if future is None else future.result()
+
+class StreamedScan():
+    """
+    Scan of an archive on a thread that hands the matches of its members to the result writer in batches as it reads,
+    instead of returning every match at the end. Batches are held back until it is the archive's turn in file order,
+    which is when results_in_order asks for its result, so a scan waiting for its turn holds at most one batch.
+    The scan function is called with the arguments and a put_results callback, and its return value is the result.
+    When only some of the patterns are scanned, pattern_indexes maps the scanned patterns back to the full pattern list,
+    and the batches are put along with the cache entry when one is given.
+    """
+    def __init__(self, executor, result_writer, scan_function, *arguments, pattern_indexes=None, cache_entry=None):
+        self.result_writer = result_writer
+        self.pattern_indexes = pattern_indexes
+        self.cache_entry = cache_entry
+        self.turn = threading.Event()
+        self.cancelled = False
+        self.future = executor.submit(scan_function, *arguments, put_results=self.put_results)
+
+    def put_results(self, label, matches):
+        self.turn.wait()
+        if not self.cancelled:
+            if self.pattern_indexes is not None:
+                matches = {self.pattern_indexes[index]: lines for index, lines in matches.items()}
+            self.result_writer.put(label, matches, self.cache_entry)
+
+    def result(self):
+        self.turn.set()
+        return self.future.result()
+
+    def cancel(self):
+        """
+        Lets a scan still waiting for its turn run to the end without writing, once the scans before it have failed
+        """
+        self.cancelled = True
+        self.turn.set()
+
+def single_pass_all_in_directory(pattern_set, result_writer):
+    """
+    Scans every file in the log parsing folder once for all patterns and hands the (label, matches) of every scan to
+    the result writer in file order.
+    Plain files are split into line aligned chunks that are scanned on a process pool, archives are streamed on a
+    thread pool as their members can only be read in order.
+    When the scan cache is enabled only the patterns without cached results for a file's contents are scanned. The
+    results are put along with the file's cache entry, so the writer thread appends them to the cache as they arrive,
+    and the end of each file is put so the writer can finish the entry and write the file's cached results as a
+    stream. Files whose size or mtime changed since the manifest was saved are hashed on the process pool ahead of
+    their scans.
+    When a time window is set plain files are binary searched for the window and only that byte range is scanned.
+    When stack traces are assembled every file has to be read, so the scan cache is not used, and the stack traces of
+    all the files are returned. Otherwise None is returned.
+    """
+    file_paths = list_log_files()
+
+    patterns = tuple(pattern_set.patterns)
+    since, until = global_config.search_since, global_config.search_until
+    has_time_window = since is not None or until is not None
+    trace_frame_count = global_config.stack_trace_frame_count if global_config.assemble_stack_traces else None
+    scan_cache = None
+    if global_config.use_scan_cache and not has_time_window and trace_frame_count is None:
+        scan_cache = ScanCache(global_config.scan_cache_folder_full_path)
+
+    # The patterns scanned on each file, and with the scan cache the cache entry of each file, set as it is scheduled
+    pattern_indexes_to_scan = {}
+    cache_entries = {}
+
+    def schedule_scans(process_executor, thread_executor):
+        """
+        Submits the scans of each file only when asked for the next one, yielding ((file_path, is_last_part), future)
+        in file order, where is_last_part marks the last chunk of a file
+        """
+        hash_futures = {}
+        if scan_cache is not None:
+            for file_path in file_paths:
+                file_stat = os.stat(file_path)
+                if scan_cache.cached_content_hash(file_path, file_stat) is None:
+                    hash_futures[file_path] = (file_stat, process_executor.submit(hash_file_contents, file_path))
+
+        for file_path in file_paths:
+            global_config.run_report.add_files('scan', 1)
+            if scan_cache is None:
+                pattern_indexes_to_scan[file_path] = list(range(len(patterns)))
+            else:
+                if file_path in hash_futures:
+                    file_stat, hash_future = hash_futures.pop(file_path)
+                    scan_cache.record_content_hash(file_path, file_stat, hash_future.result())
+                cache_entries[file_path] = scan_cache.open_entry(file_path, patterns)
+                pattern_indexes_to_scan[file_path] = cache_entries[file_path].missing_pattern_indexes
+            if not pattern_indexes_to_scan[file_path]:
+                # Every pattern is already cached for this file
+                yield (file_path, True), None
+                continue
+            file_patterns = tuple(patterns[index] for index in pattern_indexes_to_scan[file_path])
+            if is_archive_file(file_path):
+                archive_file_paths.add(file_path)
+                global_config.run_report.add_files('scan', 0, os.path.getsize(file_path))
+                # The matches of the members are written as they are found
+                streamed_scans.append(StreamedScan(thread_executor, result_writer, scan_file, file_path,
+                                                   get_pattern_set(file_patterns), since, until, trace_frame_count,
+                                                   pattern_indexes=pattern_indexes_to_scan[file_path],
+                                                   cache_entry=cache_entries.get(file_path)))
+                yield (file_path, True), streamed_scans[-1]
+                continue
+            if has_time_window:
+                time_window_range = compute_time_window_range(file_path, since, until)
+                if time_window_range is None:
+                    log_general_message(f"Skipping '{file_path}' as it has no timestamped lines to place in the time "
+                                        f"window", "Regex Searching: Time Window")
+                    continue
+                chunks = compute_line_aligned_chunks(file_path, global_config.scan_chunk_size_bytes, *time_window_range)
+            else:
+                chunks = compute_line_aligned_chunks(file_path, global_config.scan_chunk_size_bytes)
+            if len(chunks) > 1:
+                log_general_message(f"Scanning '{file_path}' in {len(chunks)} chunks", "Regex Searching: Single Pass Scan")
+            for chunk_index, (start, end) in enumerate(chunks):
+                global_config.run_report.add_files('scan', 0, end - start)
+                # The first chunk of a time window counts the lines before the window so the lines are numbered
+                count_lines_from = 0 if has_time_window and chunk_index == 0 else None
+                yield (file_path, chunk_index == len(chunks) - 1), process_executor.submit(
+                    scan_file_range, file_path, start, end, file_patterns, trace_frame_count, count_lines_from)
+
+    total_prefilter_counts = PrefilterCounts(len(patterns))
+    total_stack_traces = StackTraces() if trace_frame_count else None
+    archive_file_paths = set()
+    streamed_scans = []
+    numbered_file_path, lines_before_chunk = None, 0
+    with create_process_pool() as process_executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=global_config.scan_worker_count) as thread_executor:
+        try:
+            for (file_path, is_last_part), scan_result in results_in_order(schedule_scans(process_executor,
+                                                                                          thread_executor)):
+                file_results = []
+                if scan_result is not None:
+                    results, prefilter_counts, stack_traces = scan_result
+                    pool_name = 'archive_threads' if file_path in archive_file_paths else 'scan_processes'
+                    global_config.run_report.add_worker_time('scan', pool_name, global_config.scan_worker_count,
+                                                             prefilter_counts.scan_seconds)
+                    if stack_traces is not None:
+                        total_stack_traces.merge(stack_traces)
+                    # Scans only return indexes into the patterns that were scanned, map them back to the full pattern list
+                    scanned_pattern_indexes = pattern_indexes_to_scan[file_path]
+                    total_prefilter_counts.add(prefilter_counts, scanned_pattern_indexes)
+                    # Chunks number their lines from their own start, so add the lines of the chunks before them
+                    if file_path != numbered_file_path:
+                        numbered_file_path, lines_before_chunk = file_path, 0
+                    if lines_before_chunk:
+                        results = [(label, {index: [(byte_offset, line_number + lines_before_chunk, line)
+                                                    for byte_offset, line_number, line in lines]
+                                            for index, lines in matches.items()})
+                                   for label, matches in results]
+                    lines_before_chunk += prefilter_counts.lines_read
+                    file_results = [(label, {scanned_pattern_indexes[index]: lines for index, lines in matches.items()})
+                                    for label, matches in results]
+
+                cache_entry = cache_entries.get(file_path)
+                for label, matches in file_results:
+                    result_writer.put(label, matches, cache_entry)
+                if cache_entry is not None and is_last_part:
+                    result_writer.put_cached(cache_entries.pop(file_path))
+        finally:
+            # Scans waiting for a turn that will not come have to finish before the thread pool can shut down
+            for streamed_scan in streamed_scans:
+                streamed_scan.cancel()
+
+    log_prefilter_counts(patterns, total_prefilter_counts)
+    global_config.run_report.add_pattern_counts(patterns, total_prefilter_counts)
+    if scan_cache is not None:
+        scan_cache.save()
+    return total_stack_traces
+
+def word_trigrams(word):
+    """
+    Returns every three byte substring of a word
+    """
+    return {word[index:index + 3] for index in range(len(word) - 2)}
+
+def index_file_blocks(file_path, blocks, first_block_index):
+    """
+    Process pool worker that builds the trigram postings for a run of consecutive blocks of a file.
+    Trigrams are only taken from inside words, which keeps indexing fast as each distinct word in a block is only
+    broken into trigrams once. Returns a dict of trigram to a bitmap of the blocks containing it, as an int where bit N
+    is block N of the file, and the number of lines in each block.
+    """
+    block_bitmaps = {}
+    block_line_counts = []
+    bitmap_size = len(blocks) // 8 + 1
+    with open(file_path, 'rb') as file:
+        for offset, (start, end) in enumerate(blocks):
+            file.seek(start)
+            block = file.read(end - start)
+            block_line_counts.append(block.count(b'\n'))
+            block_trigrams = set()
+            for word in set(WORD_PATTERN.findall(block)):
+                if len(word) >= 3:
+                    block_trigrams.update(word_trigrams(word))
+            for trigram in block_trigrams:
+                bitmap = block_bitmaps.get(trigram)
+                if bitmap is None:
+                    bitmap = block_bitmaps[trigram] = bytearray(bitmap_size)
+                bitmap[offset >> 3] |= 1 << (offset & 7)
+    return ({trigram: int.from_bytes(bitmap, 'little') << first_block_index for trigram, bitmap in block_bitmaps.items()},
+            block_line_counts)
+
+def candidate_block_bitmap(postings, literals, block_count):
+    """
+    Returns a bitmap of the blocks that can contain a line matching a pattern with the given required literals.
+    A block is a candidate for a literal when it has every trigram of every word in the literal, and a candidate for
+    the pattern when it is a candidate for any of its literals.
+    """
+    all_blocks = (1 << block_count) - 1
+    if literals is None:
+        return all_blocks
+    bitmap = 0
+    for literal in literals:
+        literal_bitmap = all_blocks
+        for word in WORD_PATTERN.findall(literal):
+            for trigram in word_trigrams(word):
+                literal_bitmap &= postings.get(trigram, 0)
+        bitmap |= literal_bitmap
+    return bitmap
+
+def bitmap_to_ranges(bitmap, blocks):
+    """
+    Converts a block bitmap into (start, end, first block index) byte ranges, joining ranges of adjacent blocks
+    """
+    ranges = []
+    for block_index, (start, end) in enumerate(blocks):
+        if bitmap >> block_index & 1:
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end, ranges[-1][2])
+            else:
+                ranges.append((start, end, block_index))
+    return ranges
+
+class TrigramIndex():
+    """
+    On disk index of the plain files in the log parsing folder, kept in the results folder for repeat queries.
+    Each file is split into line aligned blocks, and the index maps every trigram found inside words to the blocks that
+    contain it, along with the number of the first line of each block. Queries use the required literals of a pattern
+    to find the candidate blocks, and only those blocks are read and checked with the full regex.
+    """
+    def __init__(self, index_folder_full_path):
+        self.index_folder_full_path = index_folder_full_path
+        self.manifest_full_path = join_paths_and_convert(index_folder_full_path, 'trigram_index_manifest.json')
+        os.makedirs(index_folder_full_path, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_full_path):
+            with open(self.manifest_full_path, 'r') as manifest_file:
+                self.manifest = json.load(manifest_file)
+
+    def is_current(self, file_path):
+        """
+        Checks the file has an index entry that was built from its current size and mtime
+        """
+        entry = self.manifest.get(file_path)
+        if (entry is None or entry.get('version') != TRIGRAM_INDEX_VERSION
+                or not os.path.exists(self.index_full_path(file_path))):
+            return False
+        file_stat = os.stat(file_path)
+        return entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns
+
+    def index_full_path(self, file_path):
+        path_hash = hashlib.blake2b(file_path.encode('utf-8'), digest_size=16).hexdigest()
+        return join_paths_and_convert(self.index_folder_full_path, f'{path_hash}.json')
+
+    def build(self, file_paths):
+        """
+        Indexes every plain file that has no current index entry, the blocks of each file are indexed in groups on a
+        process pool and the postings of the groups are combined
+        """
+        file_paths = [file_path for file_path in file_paths
+                      if not is_archive_file(file_path) and not self.is_current(file_path)]
+        log_general_message(f"Building the trigram index for {len(file_paths)} file(s)", "Trigram Index: Build")
+        blocks_per_group = max(1, global_config.scan_chunk_size_bytes // global_config.index_block_size_bytes)
+
+        with create_process_pool() as executor:
+            scheduled_futures = {}
+            for file_path in file_paths:
+                blocks = compute_line_aligned_chunks(file_path, global_config.index_block_size_bytes)
+                scheduled_futures[file_path] = (blocks, [
+                    executor.submit(index_file_blocks, file_path, blocks[first:first + blocks_per_group], first)
+                    for first in range(0, len(blocks), blocks_per_group)])
+
+            for file_path, (blocks, futures) in scheduled_futures.items():
+                postings = {}
+                block_line_numbers = []
+                line_number = 1
+                for future in futures:
+                    group_postings, block_line_counts = future.result()
+                    for trigram, bitmap in group_postings.items():
+                        postings[trigram] = postings.get(trigram, 0) | bitmap
+                    for line_count in block_line_counts:
+                        block_line_numbers.append(line_number)
+                        line_number += line_count
+                # Bitmaps are stored as hex, which converts back to an int in linear time at any size
+                with open(self.index_full_path(file_path), 'w') as index_file:
+                    index_file.write(json.dumps({'blocks': blocks, 'block_line_numbers': block_line_numbers, 'postings': {
+                        trigram.decode(CACHE_BYTES_ENCODING): format(bitmap, 'x') for trigram, bitmap in postings.items()}}))
+                file_stat = os.stat(file_path)
+                self.manifest[file_path] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                                            'version': TRIGRAM_INDEX_VERSION}
+                log_general_message(f"Indexed '{file_path}' with {len(blocks)} block(s) and {len(postings)} trigram(s)",
+                                    "Trigram Index: Build")
+
+        with open(self.manifest_full_path, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file)
+
+    def query_file(self, file_path, pattern_set, time_window_range=None):
+        """
+        Scans only the candidate blocks of an indexed file, clipped to the time window byte range when one is given,
+        returns [(file_path, matches)] like scan_file
+        """
+        with open(self.index_full_path(file_path), 'r') as index_file:
+            file_index = json.load(index_file)
+        blocks = file_index['blocks']
+        block_line_numbers = file_index['block_line_numbers']
+        postings = {trigram.encode(CACHE_BYTES_ENCODING): int(bitmap, 16)
+                    for trigram, bitmap in file_index['postings'].items()}
+        pattern_bitmaps = [candidate_block_bitmap(postings, literals, len(blocks))
+                           for literals in pattern_set.required_literals]
+
+        matches = {}
+        combined_bitmap = 0
+        for bitmap in pattern_bitmaps:
+            combined_bitmap |= bitmap
+        log_general_message(f"Index narrowed '{file_path}' to {bin(combined_bitmap).count('1')} of {len(blocks)} "
+                            f"block(s)", "Trigram Index: Query")
+        with open(file_path, 'rb') as file:
+            for start, end, block_index in bitmap_to_ranges(combined_bitmap, blocks):
+                line_number = block_line_numbers[block_index]
+                if time_window_range is not None:
+                    window_start, end = max(start, time_window_range[0]), min(end, time_window_range[1])
+                    if window_start >= end:
+                        continue
+                    # Count the lines before the window from the start of the block the window starts in
+                    while block_index + 1 < len(blocks) and blocks[block_index + 1][0] <= window_start:
+                        block_index += 1
+                    file.seek(blocks[block_index][0])
+                    line_number = (block_line_numbers[block_index]
+                                   + file.read(window_start - blocks[block_index][0]).count(b'\n'))
+                    start = window_start
+                file.seek(start)
+                for pattern_index, byte_offset, line_number, line in scan_stream(
+                        io.BytesIO(file.read(end - start)), pattern_set, start_offset=start, first_line_number=line_number):
+                    matches.setdefault(pattern_index, []).append((byte_offset, line_number, line))
+        return [(file_path, matches)]
+
+def build_trigram_index():
+    log_general_message(f"Updating the trigram index of {global_config.log_parsing_folder_full_path}",
+                        "Trigram Index: Main Method")
+    TrigramIndex(global_config.trigram_index_folder_full_path).build(list_log_files())
+
+def indexed_all_in_directory(pattern_set, result_writer):
+    """
+    Searches the log parsing folder through the trigram index, handing (label, matches) to the result writer in file
+    order the same as single_pass_all_in_directory. Files without a current index entry, such as archives, are
+    scanned in full.
+    """
+    trigram_index = TrigramIndex(global_config.trigram_index_folder_full_path)
+    since, until = global_config.search_since, global_config.search_until
+
+    def search_file(file_path, put_results=None):
+        if trigram_index.is_current(file_path):
+            time_window_range = None
+            if since is not None or until is not None:
+                time_window_range = compute_time_window_range(file_path, since, until)
+                if time_window_range is None:
+                    return []
+            return trigram_index.query_file(file_path, pattern_set, time_window_range)
+        file_results, prefilter_counts, stack_traces = scan_file(file_path, pattern_set, since, until,
+                                                                 put_results=put_results)
+        return file_results
+
+    def schedule_searches(executor):
+        for file_path in list_log_files():
+            if is_archive_file(file_path):
+                # Archives are never indexed, so their members are scanned in full and written as they are found
+                streamed_scans.append(StreamedScan(executor, result_writer, search_file, file_path))
+                yield file_path, streamed_scans[-1]
+            else:
+                yield file_path, executor.submit(search_file, file_path)
+
+    streamed_scans = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=global_config.scan_worker_count) as executor:
+        try:
+            for file_path, file_results in results_in_order(schedule_searches(executor)):
+                global_config.run_report.add_files('scan', 1)
+                for label, matches in file_results:
+                    result_writer.put(label, matches)
+        finally:
+            for streamed_scan in streamed_scans:
+                streamed_scan.cancel()
 
 def sed_patterns( file_path, dict = [],):
     """
@@ -133,7 +1628,200 @@ def sed_patterns( file_path, dict = [],):
         return (f"Frequency of events of pattern '{pattern}' in file '{file_path}\n"
                 f"Count  |  Pattern Searched '{pattern}': \n{results}\n")
 
+def compile_summary_replacements(replacements):
+    """
+    Compiles the (pattern, replacement) pairs used to normalize result lines before counting them
+    """
+    return [(re.compile(pattern), replace) for pattern, replace in replacements]
+
+def normalize_line(line, compiled_replacements):
+    """
+    Applies every replacement globally to the line in order, the same as the chained sed substitutions
+    """
+    for compiled_pattern, replace in compiled_replacements:
+        line = compiled_pattern.sub(replace, line)
+    return line
+
+def iterate_result_lines(file_path, structured_format=None):
+    """
+    Yields the matched lines of the results, loaded from the records of the structured output when its format is given,
+    otherwise read back out of the text results by skipping the header of each block, the same as grep -v in the sed
+    pipeline
+    """
+    if structured_format is not None:
+        for record in read_structured_records(file_path, structured_format):
+            yield record['line']
+        return
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as parsed_results:
+        for line in parsed_results:
+            if "Results for pattern" in line:
+                continue
+            yield line.rstrip('\n')
+
+def summarize_patterns(file_path, structured_format=None):
+    """
+    Streams over the parsed results, normalizes every result line with the summary replacements, and counts identical
+    normalized lines in a hash map. Memory grows with the number of distinct normalized lines rather than the number of
+    lines, and only the top summary_top_k lines are kept through a bounded heap when it is set.
+    The lines are loaded from the structured output instead of the text results when its format is given.
+    Returns the summary text in the same count | line layout that uniq -c produces, or None when nothing was found.
+    """
+    log_general_message(f"Processing file '{file_path}'", "Summary: Normalize and Count")
+    compiled_replacements = compile_summary_replacements(global_config.sed_replacements_for_summary)
+
+    line_counts = collections.Counter()
+    for line in iterate_result_lines(file_path, structured_format):
+        line_counts[normalize_line(line, compiled_replacements)] += 1
+
+    if not line_counts:
+        return None
+
+    # Order by count then by line, both descending, matching sort -r over the uniq -c output
+    def order(item):
+        return item[1], item[0]
+    if global_config.summary_top_k is None:
+        top_lines = sorted(line_counts.items(), key=order, reverse=True)
+    else:
+        top_lines = heapq.nlargest(global_config.summary_top_k, line_counts.items(), key=order)
+
+    results = "\n".join(f"{count:7d} {line}" for line, count in top_lines)
+    return (f"Frequency of events in file '{file_path}\n"
+            f"Count  |  Normalized Line: \n{results}\n")
+
+class LogTemplate():
+    """
+    One mined template, the tokens of the lines it groups with TEMPLATE_WILDCARD in every parameter slot
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.count = 1
+
+    def similarity(self, tokens):
+        """
+        Returns the fraction of tokens equal to the template's constant tokens and the number of parameter slots
+        """
+        matching_tokens = 0
+        parameter_count = 0
+        for template_token, token in zip(self.tokens, tokens):
+            if template_token == TEMPLATE_WILDCARD:
+                parameter_count += 1
+            elif template_token == token:
+                matching_tokens += 1
+        return matching_tokens / len(tokens), parameter_count
+
+    def merge(self, tokens):
+        self.tokens = [template_token if template_token == token else TEMPLATE_WILDCARD
+                       for template_token, token in zip(self.tokens, tokens)]
+        self.count += 1
+
+    def __str__(self):
+        return ' '.join(self.tokens)
+
+class TemplateMiner():
+    """
+    Drain style online template miner. Lines are routed through a fixed depth parse tree, first by their token count
+    and then by their first few tokens, with tokens holding digits and anything past max_children routed to a wildcard
+    branch. The line is merged into the most similar template of the leaf it reaches, or starts a new template when none
+    is similar enough. Each line is seen once and only the templates are kept, so memory is bounded by the number of
+    templates rather than the number of lines.
+    """
+    def __init__(self, tree_depth=4, similarity_threshold=0.4, max_children=100):
+        # The token count level and the leaf level are part of the depth, the rest are prefix token levels
+        self.prefix_length = max(tree_depth - 2, 1)
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.children = collections.defaultdict(set)
+        self.leaves = collections.defaultdict(list)
+        self.templates = []
+
+    def leaf_key(self, tokens):
+        key = (len(tokens),)
+        for token in tokens[:self.prefix_length]:
+            if any(character.isdigit() for character in token):
+                token = TEMPLATE_WILDCARD
+            children = self.children[key]
+            if token not in children:
+                if len(children) >= self.max_children:
+                    token = TEMPLATE_WILDCARD
+                children.add(token)
+            key += (token,)
+        return key
+
+    def add_line(self, line):
+        """
+        Adds one line to the tree and returns the template it was grouped under, or None for a blank line
+        """
+        tokens = line.split()
+        if not tokens:
+            return None
+        leaf = self.leaves[self.leaf_key(tokens)]
+
+        best_template = None
+        best_score = None
+        for template in leaf:
+            score = template.similarity(tokens)
+            if best_score is None or score > best_score:
+                best_template, best_score = template, score
+
+        if best_template is not None and best_score[0] >= self.similarity_threshold:
+            best_template.merge(tokens)
+            return best_template
+
+        template = LogTemplate(tokens)
+        leaf.append(template)
+        self.templates.append(template)
+        return template
+
+def mine_log_templates(file_path, structured_format=None):
+    """
+    Streams over the parsed results once, mining templates from the result lines with their timestamps removed.
+    The lines are loaded from the structured output instead of the text results when its format is given.
+    Returns the templates in the same count | line layout as the summary, or None when nothing was found.
+    """
+    log_general_message(f"Mining templates from file '{file_path}'", "Summary: Template Mining")
+    template_miner = TemplateMiner(global_config.template_tree_depth, global_config.template_similarity_threshold,
+                                   global_config.template_max_children)
+    for line in iterate_result_lines(file_path, structured_format):
+        # Skip the separators between patterns
+        if line.startswith('--------------------'):
+            continue
+        template_miner.add_line(TEXT_TIMESTAMP_PATTERN.sub('', line, count=1))
+
+    if not template_miner.templates:
+        return None
+
+    log_general_message(f"Mined {len(template_miner.templates)} template(s)", "Summary: Template Mining")
+    top_templates = sorted(template_miner.templates, key=lambda template: template.count, reverse=True)
+    results = "\n".join(f"{template.count:7d} {template}" for template in top_templates)
+    return (f"Templates of events in file '{file_path}\n"
+            f"Count  |  Template ({TEMPLATE_WILDCARD} marks a parameter): \n{results}\n")
+
+def templates_to_summary():
+    """
+    Writes the mined templates of the parsed results to the log templates file next to the summary
+    """
+    if global_config.structured_output_format is not None:
+        result = mine_log_templates(structured_output_full_path(), global_config.structured_output_format)
+    else:
+        result = mine_log_templates(global_config.full_search_output_log_full_path)
+    if result is None:
+        log_general_message("No Results found to mine templates from", "Summary: Template Mining", False)
+        return
+    with open(global_config.log_templates_full_path, 'w') as templates_output:
+        templates_output.write(result)
+        templates_output.write(f'--------------------\n\n')
+
 def extract_all_directory():
+    """
+    Extracts every archive in the input folder into the log parsing folder on the process pool. As each extraction
+    finishes the archives found in its output are submitted too, up to max_archive_depth levels deep, so nested broker
+    bundles are extracted in parallel with the remaining top level archives. Top level archives are moved to the
+    compressed files folder once extracted, nested ones are deleted as their outer archive is kept there.
+    Archives keep the folder they were found in relative to the input folder, both in the log parsing folder and in
+    the compressed files folder, and archives that would share an output path get numbered ones. A failed extraction
+    or move is logged and the other archives carry on.
+    """
+    archive_paths = []
     for root, dirs, files in os.walk(global_config.input_folder_full_path):
 
         root = convert_wsl_paths(root)
@@ -155,30 +1843,105 @@ def extract_all_directory():
                 log_general_message(f"Skipping {file_path} due to being in the excluded folder paths",
                                     "Extracting Folders: Extract All Dirs")
                 continue
-            extract_file(file_path)
+            if is_archive_file(file_path):
+                archive_paths.append(file_path)
+            else:
+                log_general_message(f"No decompression performed on file {file} as it is not an archive or compressed file",
+                                    "Regex Searching: Extracting Files")
+
+    if not archive_paths:
+        return
+
+    extraction_start_time = time.perf_counter()
+    reserved_paths = set()
+    with create_process_pool() as executor:
+        pending_extractions = {}
+
+        def submit_extraction(file_path, output_folder, depth):
+            output_path = extraction_output_path(file_path, output_folder, reserved_paths)
+            log_general_message(f"Found archive {file_path}, starting decompression process into {output_path}",
+                                "Regex Searching: Extracting Files")
+            pending_extractions[executor.submit(extract_file, file_path, output_path)] = (file_path, depth)
+
+        for file_path in archive_paths:
+            relative_folder = os.path.relpath(os.path.dirname(file_path), global_config.input_folder_full_path)
+            output_folder = os.path.normpath(join_paths_and_convert(global_config.log_parsing_folder_full_path,
+                                                                    relative_folder))
+            os.makedirs(output_folder, exist_ok=True)
+            submit_extraction(file_path, output_folder, 0)
+
+        while pending_extractions:
+            finished_extractions, _ = concurrent.futures.wait(pending_extractions,
+                                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished_extractions:
+                file_path, depth = pending_extractions.pop(future)
+                try:
+                    extraction = future.result()
+                except Exception as error:
+                    log_general_message(f"Failed to decompress {file_path}: {error}",
+                                        "Regex Searching: Extracting Files", string_log_level='ERROR')
+                    continue
+                if extraction is None:
+                    continue
 
-def grep_all_in_directory(pattern):
-    futures = []
-    for root, dirs, files in os.walk(global_config.log_parsing_folder_full_path):
-        for file in files:
-            file_path = join_paths_and_convert(root, file)
-            future = process_file(pattern, file_path)
-            futures.append(future)
-    return futures
+                archive_type, output_path, seconds_taken = extraction
+                global_config.run_report.add_files('extract', 1, os.path.getsize(file_path))
+                global_config.run_report.add_worker_time('extract', 'extract_processes', global_config.scan_worker_count,
+                                                         seconds_taken)
+                log_general_message(f"Decompressed {archive_type.value} file {file_path} to {output_path} in {seconds_taken:.2f} seconds",
+                                    "Regex Searching: Extracting Files")
+                try:
+                    if depth == 0:
+                        archived_path = unique_path(join_paths_and_convert(
+                            global_config.compressed_files_folder_full_path,
+                            os.path.relpath(file_path, global_config.input_folder_full_path)))
+                        os.makedirs(os.path.dirname(archived_path), exist_ok=True)
+                        shutil.move(file_path, archived_path)
+                    else:
+                        os.remove(file_path)
+                except OSError as error:
+                    log_general_message(f"Failed to move {file_path} out of the way after decompressing it: {error}",
+                                        "Regex Searching: Extracting Files", string_log_level='ERROR')
+
+                if depth + 1 < global_config.max_archive_depth:
+                    for nested_archive in find_nested_archives(output_path):
+                        submit_extraction(nested_archive, os.path.dirname(nested_archive), depth + 1)
+
+    log_general_message(f"Finished decompressing archives in {time.perf_counter() - extraction_start_time:.2f} seconds",
+                        "Regex Searching: Extracting Files")
+
+def grep_all_in_directory(pattern_index, pattern, result_writer):
+    for file_path in list_log_files():
+        global_config.run_report.add_files('scan', 1, os.path.getsize(file_path))
+        for batch in grep_pattern(pattern, file_path):
+            result_writer.put(file_path, {pattern_index: batch})
 
-def process_file( pattern, file_path):
-    future = grep_pattern(pattern, file_path)
-    return future
+def move_merging_folders(source_path, destination_path):
+    """
+    Moves a file or folder, merging a folder into a folder already at the destination, such as one holding archives
+    extracted from it. A file whose name is taken gets a numbered name, and a failed move is logged without stopping
+    the moves of the other files.
+    """
+    if os.path.isdir(source_path) and not os.path.islink(source_path) and os.path.isdir(destination_path):
+        for file_name in os.listdir(source_path):
+            move_merging_folders(join_paths_and_convert(source_path, file_name),
+                                 join_paths_and_convert(destination_path, file_name))
+        if not os.listdir(source_path):
+            os.rmdir(source_path)
+        return
+    try:
+        shutil.move(source_path, unique_path(destination_path))
+    except OSError as error:
+        log_general_message(f"Failed to move {source_path} to {destination_path}: {error}",
+                            "Moving Files: Move Files", string_log_level='ERROR')
 
 def move_files_except():
     for file_name in os.listdir(global_config.input_folder_full_path):
         if file_name not in global_config.excluded_folders:
             source_folder = join_paths_and_convert(global_config.input_folder_full_path, file_name)
             destination_folder = join_paths_and_convert(global_config.log_parsing_folder_full_path, file_name)
-            if os.path.isdir(source_folder):
-                shutil.move(source_folder, destination_folder)
-            else:
-                shutil.move(source_folder, destination_folder)
+            global_config.run_report.add_files('move', 1)
+            move_merging_folders(source_folder, destination_folder)
 def recursive_file_dir_traversal(path):
     for root, dirs, files in os.walk(path):
         for file in files:
@@ -186,54 +1949,678 @@ def recursive_file_dir_traversal(path):
 
 
 def create_and_move_folders():
-    # Extract any compressed directories
-    log_general_message(f"Extracting any compressed files in the provided directory {global_config.input_folder_full_path}",
-                        "Extracting Folders: Main Method")
-    extract_all_directory()
+    if global_config.extract_archives_to_disk:
+        # Extract any compressed directories
+        log_general_message(f"Extracting any compressed files in the provided directory {global_config.input_folder_full_path}",
+                            "Extracting Folders: Main Method")
+        with global_config.run_report.phase('extract'):
+            extract_all_directory()
+    else:
+        log_general_message(f"Skipping extraction, archives will be searched in place",
+                            "Extracting Folders: Main Method")
 
     log_general_message(f"Moving files into {global_config.log_parsing_folder_full_path} for processing",
                         "Moving Files: Main Method")
-    move_files_except()
+    with global_config.run_report.phase('move'):
+        move_files_except()
+
+        if global_config.skip_duplicate_log_files:
+            log_general_message(f"Checking {global_config.log_parsing_folder_full_path} for files with identical contents",
+                                "Moving Files: Main Method")
+            deduplicate_log_files()
+
+def label_matches_in_order(matches):
+    """
+    Yields (byte offset, line number, line) for every line matched by any pattern in one labeled file, in file order,
+    with lines matched by several patterns only yielded once
+    """
+    previous_offset = None
+    for byte_offset, line_number, line in heapq.merge(*matches.values()):
+        if byte_offset != previous_offset:
+            previous_offset = byte_offset
+            yield byte_offset, line_number, line
+
+def timeline_source(label):
+    """
+    Tags a line in the merged timeline with the broker it came from when the path names one, otherwise with its file
+    """
+    broker_match = BROKER_PATTERN.search(label)
+    if broker_match:
+        return f"broker {broker_match.group(1)}: {label}"
+    return label
+
+def process_cpu_seconds():
+    """
+    CPU time of this process and of its finished child processes, which includes pool workers once the pool is shut down
+    """
+    process_times = os.times()
+    return process_times.user + process_times.system + process_times.children_user + process_times.children_system
+
+class RunReport():
+    """
+    Collects the wall and CPU time, bytes read and files processed of each phase, the busy time of the pools that ran
+    in each phase, and per pattern scan counts, matches and regex time, then writes them out as a JSON run report
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.phases = {}
+        self.patterns = {}
+
+    def phase_entry(self, phase_name):
+        return self.phases.setdefault(phase_name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'bytes_read': 0,
+                                                   'files': 0, 'pools': {}})
+
+    @contextlib.contextmanager
+    def phase(self, phase_name):
+        """
+        Times the code run inside the with block as part of the phase, a phase timed more than once adds up
+        """
+        phase_entry = self.phase_entry(phase_name)
+        wall_start_time = time.perf_counter()
+        cpu_start_time = process_cpu_seconds()
+        try:
+            yield phase_entry
+        finally:
+            phase_entry['wall_seconds'] += time.perf_counter() - wall_start_time
+            phase_entry['cpu_seconds'] += process_cpu_seconds() - cpu_start_time
+
+    def add_files(self, phase_name, file_count, byte_count=0):
+        phase_entry = self.phase_entry(phase_name)
+        phase_entry['files'] += file_count
+        phase_entry['bytes_read'] += byte_count
+
+    def add_worker_time(self, phase_name, pool_name, worker_count, busy_seconds):
+        pool_entry = self.phase_entry(phase_name)['pools'].setdefault(pool_name, {'workers': worker_count,
+                                                                                  'tasks': 0, 'busy_seconds': 0.0})
+        pool_entry['tasks'] += 1
+        pool_entry['busy_seconds'] += busy_seconds
+
+    def pattern_entry(self, pattern):
+        return self.patterns.setdefault(pattern.decode('utf-8'), {'lines_scanned': 0, 'lines_tested': 0,
+                                                                   'matches': 0, 'regex_seconds': 0.0})
+
+    def add_pattern_counts(self, patterns, prefilter_counts):
+        for index, pattern in enumerate(patterns):
+            pattern_entry = self.pattern_entry(pattern)
+            pattern_entry['lines_scanned'] += prefilter_counts.lines_scanned[index]
+            pattern_entry['lines_tested'] += prefilter_counts.lines_tested[index]
+            pattern_entry['regex_seconds'] += prefilter_counts.regex_seconds[index]
+
+    def add_pattern_matches(self, pattern, match_count):
+        self.pattern_entry(pattern)['matches'] += match_count
+
+    def write(self, report_full_path):
+        """
+        Writes the report with throughput per phase and utilization per pool, the busy time of the pool's tasks over
+        the time its workers were available during the phase
+        """
+        for phase_entry in self.phases.values():
+            wall_seconds = phase_entry['wall_seconds']
+            phase_entry['megabytes_per_second'] = (phase_entry['bytes_read'] / (1024 * 1024) / wall_seconds
+                                                   if wall_seconds else None)
+            for pool_entry in phase_entry['pools'].values():
+                available_seconds = pool_entry['workers'] * wall_seconds
+                pool_entry['utilization'] = pool_entry['busy_seconds'] / available_seconds if available_seconds else None
+        report = {
+            'total_wall_seconds': time.perf_counter() - self.start_time,
+            'total_cpu_seconds': process_cpu_seconds(),
+            'phases': self.phases,
+            'patterns': self.patterns,
+        }
+        with open(report_full_path, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+        log_general_message(f"Wrote the run report to {report_full_path}", "Main Method: Run Report")
+
+def start_profiler():
+    """
+    Starts the configured profiler on this process, pool workers are not profiled. Returns None when profiling is off
+    or pyinstrument is asked for but not installed.
+    """
+    if global_config.profiler == Profilers.CPROFILE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if global_config.profiler == Profilers.PYINSTRUMENT:
+        pyinstrument = import_optional('pyinstrument')
+        if pyinstrument is None:
+            log_general_message("Skipping profiling as the pyinstrument package is not installed",
+                                "Main Method: Profiling", string_log_level='WARN')
+            return None
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+def stop_profiler(profiler):
+    """
+    Stops the profiler and writes its report to the profile log, cProfile also keeps the raw stats for pstats or snakeviz
+    """
+    if profiler is None:
+        return
+    with open(global_config.profile_log_full_path, 'w') as profile_output:
+        if global_config.profiler == Profilers.CPROFILE:
+            profiler.disable()
+            profiler.dump_stats(global_config.profile_stats_full_path)
+            import pstats
+            pstats.Stats(profiler, stream=profile_output).sort_stats('cumulative').print_stats(PROFILE_REPORT_LINES)
+        else:
+            profiler.stop()
+            profile_output.write(profiler.output_text())
+    log_general_message(f"Wrote the profile to {global_config.profile_log_full_path}", "Main Method: Profiling")
+
+def structured_output_full_path():
+    """
+    Full path to the structured output of this run, named after the configured structured format
+    """
+    extension = 'jsonl' if global_config.structured_output_format == StructuredFormats.JSONL else 'columnar.jsonl'
+    return join_paths_and_convert(global_config.results_folder_full_path,
+                                  f'Parsed-Matches_{global_config.date_time}.{extension}')
+
+class StructuredResultWriter():
+    """
+    Writes one record per match holding the pattern id, file, line number, byte offset, timestamp, captured groups and
+    the line itself, in batches of STRUCTURED_BATCH_SIZE records.
+    JSONL writes a JSON object per record. The columnar layout writes each batch as one JSON object of columns with the
+    file names dictionary encoded, which is far smaller when most matches come from a few files.
+    Line numbers come from the scan along with the byte offsets. Groups are captured with the patterns as configured,
+    as the search forms the scan tests lines with have their leading wildcards removed, which changes what a group
+    spanning a wildcard captures.
+    """
+    def __init__(self, output_full_path, structured_format, patterns):
+        self.output_file = open(output_full_path, 'w', encoding='utf-8')
+        self.structured_format = structured_format
+        self.group_patterns = []
+        for pattern in patterns:
+            search_pattern, flag_letters, flags = pattern_search_form(pattern, strip_wildcards=False)
+            self.group_patterns.append(re.compile(search_pattern, flags))
+        self.records = []
+        self.record_count = 0
+
+    def add(self, label, matches):
+        def tag_lines(pattern_index, lines):
+            return ((byte_offset, pattern_index, line_number, line) for byte_offset, line_number, line in lines)
+
+        # Matches of all the patterns in file order
+        for byte_offset, pattern_index, line_number, line in heapq.merge(*(tag_lines(pattern_index, lines)
+                                                                           for pattern_index, lines in matches.items())):
+            timestamp_match = LOG_TIMESTAMP_PATTERN.match(line)
+            regex_match = self.group_patterns[pattern_index].search(line)
+            groups = []
+            if regex_match is not None:
+                groups = [group.decode('utf-8', errors='replace') if group is not None else None
+                          for group in regex_match.groups()]
+            self.records.append((pattern_index, label, line_number, byte_offset,
+                                 timestamp_match.group(1).decode('ascii') if timestamp_match else None, groups,
+                                 line.decode('utf-8', errors='replace')))
+            if len(self.records) >= STRUCTURED_BATCH_SIZE:
+                self.write_batch()
+
+    def write_batch(self):
+        if not self.records:
+            return
+        if self.structured_format == StructuredFormats.JSONL:
+            self.output_file.writelines(json.dumps(dict(zip(STRUCTURED_FIELDS, record))) + '\n'
+                                        for record in self.records)
+        else:
+            columns = dict(zip(STRUCTURED_FIELDS, (list(column) for column in zip(*self.records))))
+            file_names = list(dict.fromkeys(columns['file']))
+            file_name_indexes = {file_name: index for index, file_name in enumerate(file_names)}
+            columns['file'] = [file_name_indexes[file_name] for file_name in columns['file']]
+            columns['file_names'] = file_names
+            self.output_file.write(json.dumps(columns) + '\n')
+        self.record_count += len(self.records)
+        self.records = []
+
+    def close(self):
+        self.write_batch()
+        self.output_file.close()
+
+def read_structured_records(file_path, structured_format):
+    """
+    Yields every record of a structured output file as a dict of the STRUCTURED_FIELDS, in the order written
+    """
+    with open(file_path, 'r', encoding='utf-8') as structured_output:
+        for batch_line in structured_output:
+            batch = json.loads(batch_line)
+            if structured_format == StructuredFormats.JSONL:
+                yield batch
+                continue
+            file_names = batch['file_names']
+            for values in zip(*(batch[field] for field in STRUCTURED_FIELDS)):
+                record = dict(zip(STRUCTURED_FIELDS, values))
+                record['file'] = file_names[record['file']]
+                yield record
+
+class ResultWriter():
+    """
+    Writes scan results to the parsed results log from a single writer thread fed through a bounded queue, so scanning
+    blocks rather than piling up results in memory whenever writing falls behind.
+    The log is grouped by pattern, so each pattern's results are appended to its own spill file as they arrive and the
+    spill files are joined in pattern order once scanning is done. When the merged timeline is on, the matches of each
+    label are also spilled in file order with their timestamps, ready for the k-way merge. A failure writing the
+    timeline only turns the timeline off, the results of every pattern are still written.
+    When a structured format is given every match is also written as a record to the structured output.
+    """
+    def __init__(self, patterns, write_timeline=False, structured_format=None):
+        self.patterns = list(patterns)
+        self.structured_writer = None
+        if structured_format is not None:
+            self.structured_writer = StructuredResultWriter(structured_output_full_path(), structured_format, self.patterns)
+        self.queue = queue.Queue(maxsize=global_config.result_queue_max_items)
+        self.spill_files = [tempfile.TemporaryFile(dir=global_config.results_folder_full_path) for _ in self.patterns]
+        self.spill_labels = [None] * len(self.patterns)
+        self.line_counts = [0] * len(self.patterns)
+        self.timeline_spill = TimelineSpill() if write_timeline else None
+        self.timeline_timestamp = b''
+        self.error = None
+        self.writer_thread = threading.Thread(target=self.write_queued_results, daemon=True)
+        self.writer_thread.start()
+
+    def put(self, label, matches, cache_entry=None):
+        """
+        Queues the matches of one label, a dict of pattern index to a list of (byte offset, line number, line), blocking
+        while the queue is full. Matches of the same label and pattern may be put in several consecutive parts.
+        With a scan cache entry the matches are also added to the cache, and are only written once the file is
+        finished when the entry replays its cached results.
+        """
+        self.queue.put((label, matches, cache_entry))
+
+    def put_cached(self, cache_entry):
+        """
+        Queues the end of a file scanned with the scan cache, after every part of its matches
+        """
+        self.queue.put((None, None, cache_entry))
+
+    def write_queued_results(self):
+        while True:
+            queued_results = self.queue.get()
+            if queued_results is None:
+                return
+            # After an error keep draining the queue so scanning threads are never blocked forever
+            if self.error is not None:
+                continue
+            try:
+                label, matches, cache_entry = queued_results
+                if cache_entry is None:
+                    self.write_results(label, matches)
+                elif label is not None:
+                    cache_entry.add(label, matches)
+                    if not cache_entry.replays_results:
+                        self.write_results(label, matches)
+                else:
+                    cache_entry.finish()
+                    if cache_entry.replays_results:
+                        for label, matches in cache_entry.cached_batches():
+                            self.write_results(label, matches)
+            except Exception as error:
+                self.error = error
+
+    def write_results(self, label, matches):
+        for pattern_index, lines in matches.items():
+            if not lines:
+                continue
+            spill_file = self.spill_files[pattern_index]
+            if self.spill_labels[pattern_index] != label:
+                if self.spill_labels[pattern_index] is not None:
+                    spill_file.write(b'\n')
+                pattern_str = self.patterns[pattern_index].decode('utf-8')
+                # Copies of the file skipped by deduplication are listed in the header, keeping the summary counts
+                # of the result lines unchanged
+                aliases = label_aliases(label)
+                aliases_str = f" (identical copies: {', '.join(aliases)})" if aliases else ''
+                spill_file.write(f"Results for pattern '{pattern_str}' in file '{label}{aliases_str}: \n".encode('utf-8'))
+                self.spill_labels[pattern_index] = label
+            spill_file.writelines(line + b'\n' for byte_offset, line_number, line in lines)
+            self.line_counts[pattern_index] += len(lines)
+
+        if self.structured_writer is not None:
+            self.structured_writer.add(label, matches)
+
+        if self.timeline_spill is not None and any(matches.values()):
+            try:
+                self.spill_timeline(label, matches)
+            except OSError as error:
+                log_general_message(f"Turning off the merged timeline after failing to spill its matches: {error}",
+                                    "Regex Searching: Merged Timeline", string_log_level='ERROR')
+                self.timeline_spill.close()
+                self.timeline_spill = None
+
+    def spill_timeline(self, label, matches):
+        if not self.timeline_spill.is_current_label(label):
+            self.timeline_timestamp = b''
+        timestamped_lines = []
+        for byte_offset, line_number, line in label_matches_in_order(matches):
+            # Lines without a timestamp of their own, such as stack trace lines, take the timestamp of the closest
+            # earlier matched line so they stay next to it in the timeline
+            timestamp_match = LOG_TIMESTAMP_PATTERN.match(line)
+            if timestamp_match:
+                self.timeline_timestamp = timestamp_match.group(1)
+            timestamped_lines.append((self.timeline_timestamp, line))
+        self.timeline_spill.add(label, timestamped_lines)
+
+    def close(self, output_full_path):
+        """
+        Waits for every queued result to be written, then joins the spill files of all patterns into the output log
+        """
+        self.queue.put(None)
+        self.writer_thread.join()
+        if self.structured_writer is not None:
+            self.structured_writer.close()
+        if self.error is not None:
+            raise self.error
+        if self.structured_writer is not None:
+            log_general_message(f"Wrote {self.structured_writer.record_count} structured record(s) to "
+                                f"{structured_output_full_path()}", "Regex Searching: Writing Results")
+
+        with open(output_full_path, 'wb') as full_search_output:
+            for pattern_index, spill_file in enumerate(self.spill_files):
+                if self.spill_labels[pattern_index] is not None:
+                    spill_file.write(b'\n')
+                    spill_file.seek(0)
+                    shutil.copyfileobj(spill_file, full_search_output)
+                    # Print an extra tw blank lines in the log after printing the results
+                    full_search_output.write(b'--------------------\n\n')
+                    global_config.run_report.add_pattern_matches(self.patterns[pattern_index], self.line_counts[pattern_index])
+                    log_general_message(f"Wrote {self.line_counts[pattern_index]} matched line(s) for pattern "
+                                        f"'{self.patterns[pattern_index].decode('utf-8')}'",
+                                        "Regex Searching: Writing Results")
+                spill_file.close()
+
+class TimelineSpill():
+    """
+    Matched lines of every label with their timestamps, kept for the merged timeline in one shared spill file rather
+    than a file per label, so the number of open files stays the same however many files are scanned.
+    Each label's lines are a run of records (timestamp, label index, line) between two offsets of the spill file.
+    """
+    def __init__(self):
+        self.spill_file = tempfile.TemporaryFile(dir=global_config.results_folder_full_path)
+        self.spill_size = 0
+        self.labels = []
+        # [start, end] offsets of the records of each run in the spill file
+        self.runs = []
+
+    def is_current_label(self, label):
+        return bool(self.labels) and self.labels[-1] == label
+
+    def add(self, label, timestamped_lines):
+        """
+        Appends (timestamp, line) pairs of a label, extending the label's run when its lines arrive in several parts
+        """
+        if not self.is_current_label(label):
+            self.labels.append(label)
+            self.runs.append([self.spill_size, self.spill_size])
+        label_index = str(len(self.labels) - 1).encode('utf-8')
+        records = b''.join(timestamp + b'\t' + label_index + b'\t' + line + b'\n' for timestamp, line in timestamped_lines)
+        self.spill_file.write(records)
+        self.spill_size += len(records)
+        self.runs[-1][1] = self.spill_size
+
+    def merged_records(self):
+        """
+        Yields (timestamp, label, line) from every run ordered by timestamp, with ties kept in the order the labels were
+        added. Runs are merged at most TIMELINE_MERGE_FAN_IN at a time, writing each merge back as a longer run into a
+        new spill file, until few enough runs remain for the last merge.
+        """
+        spill_file, runs = self.spill_file, self.runs
+        while len(runs) > TIMELINE_MERGE_FAN_IN:
+            merged_spill_file = tempfile.TemporaryFile(dir=global_config.results_folder_full_path)
+            merged_runs = []
+            for first in range(0, len(runs), TIMELINE_MERGE_FAN_IN):
+                start = merged_spill_file.tell()
+                merged_spill_file.writelines(merge_timeline_runs(spill_file, runs[first:first + TIMELINE_MERGE_FAN_IN]))
+                merged_runs.append([start, merged_spill_file.tell()])
+            spill_file.close()
+            spill_file, runs = merged_spill_file, merged_runs
+        self.spill_file = spill_file
+        for record in merge_timeline_runs(spill_file, runs):
+            timestamp, _, label_line = record.rstrip(b'\n').partition(b'\t')
+            label_index, _, line = label_line.partition(b'\t')
+            yield timestamp, self.labels[int(label_index)], line
+
+    def close(self):
+        self.spill_file.close()
+
+def read_timeline_run(spill_file, start, end):
+    """
+    Yields the records of one run of a timeline spill file in the order they were written. Several runs of the same
+    file are read at once during a merge, so each read seeks to where this run left off.
+    """
+    remainder = b''
+    while start < end:
+        spill_file.seek(start)
+        chunk = spill_file.read(min(TIMELINE_READ_SIZE, end - start))
+        start += len(chunk)
+        records = (remainder + chunk).split(b'\n')
+        remainder = records.pop()
+        for record in records:
+            yield record + b'\n'
+
+def merge_timeline_runs(spill_file, runs):
+    """
+    Merges runs of timeline records by their leading timestamp, only one pending record per run is held by the merge
+    """
+    return heapq.merge(*(read_timeline_run(spill_file, start, end) for start, end in runs),
+                       key=lambda record: record[:record.index(b'\t')])
+
+def write_merged_timeline(timeline_spill):
+    """
+    Writes every matched line from every file into one timeline ordered by timestamp, using a k-way heap merge of the
+    per file runs of the timeline spill
+    """
+    log_general_message(f"Writing merged timeline to {global_config.merged_timeline_log_full_path}",
+                        "Regex Searching: Merged Timeline")
+    try:
+        with open(global_config.merged_timeline_log_full_path, 'w') as merged_timeline:
+            for timestamp, label, line in timeline_spill.merged_records():
+                merged_timeline.write(f"[{timeline_source(label)}] {line.decode('utf-8', errors='replace')}\n")
+    except OSError as error:
+        log_general_message(f"Failed to write the merged timeline: {error}", "Regex Searching: Merged Timeline",
+                            string_log_level='ERROR')
+    finally:
+        timeline_spill.close()
+
+def write_stack_trace_report(stack_traces):
+    """
+    Writes every stack trace fingerprint with its count, first and last timestamp and an example, most frequent first
+    """
+    log_general_message(f"Writing {len(stack_traces.fingerprints)} stack trace fingerprint(s) to "
+                        f"{global_config.stack_traces_log_full_path}", "Regex Searching: Stack Traces")
+    ordered_fingerprints = sorted(stack_traces.fingerprints.items(), key=lambda item: item[1][0], reverse=True)
+    with open(global_config.stack_traces_log_full_path, 'w') as stack_trace_output:
+        stack_trace_output.write(f"Stack traces grouped by exception type and the top {global_config.stack_trace_frame_count} frame(s)\n"
+                                 f"Count  |  First Seen  |  Last Seen  |  Exception: \n")
+        for (exception_type, frames), (count, first_timestamp, last_timestamp, label, message) in ordered_fingerprints:
+            stack_trace_output.write(f"{count:7d} | {first_timestamp} | {last_timestamp} | {exception_type}\n")
+            for frame in frames:
+                stack_trace_output.write(f"            at {frame}\n")
+            stack_trace_output.write(f"        First seen as '{message}' in file '{label}'\n\n")
+        stack_trace_output.write(f'--------------------\n\n')
 
 def find_all_grep_results():
     log_general_message(f"Starting event extraction based on provided REGEX", "Regex Searching: Moving Files")
+    if global_config.scan_mode in (ScanModes.SINGLE_PASS, ScanModes.INDEXED):
+        # Read every file once and test all the patterns together, or only the blocks the trigram index points to
+        pattern_set = load_pattern_set(global_config.regex_patterns)
+        result_writer = ResultWriter(pattern_set.patterns, global_config.write_merged_timeline,
+                                     global_config.structured_output_format)
+        stack_traces = None
+        if global_config.scan_mode == ScanModes.INDEXED:
+            indexed_all_in_directory(pattern_set, result_writer)
+        else:
+            stack_traces = single_pass_all_in_directory(pattern_set, result_writer)
+        result_writer.close(global_config.full_search_output_log_full_path)
+        if result_writer.timeline_spill is not None:
+            write_merged_timeline(result_writer.timeline_spill)
+        if stack_traces is not None:
+            write_stack_trace_report(stack_traces)
+        elif global_config.assemble_stack_traces:
+            log_general_message("Stack traces are only assembled in single pass scans, as other modes do not read every line",
+                                "Regex Searching: Stack Traces", string_log_level='WARN')
+        return
+
     # Use a ThreadPoolExecutor to execute the grep commands in parallel
+    result_writer = ResultWriter(global_config.regex_patterns, structured_format=global_config.structured_output_format)
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(grep_all_in_directory, pattern) for pattern in
-                   global_config.regex_patterns}
-
-        # Open the log file in the directory that the grep command is searching
-        with open(global_config.full_search_output_log_full_path, 'w') as full_search_output:
-            for future in concurrent.futures.as_completed(futures):
-                result = future.result()
+        futures = {executor.submit(grep_all_in_directory, pattern_index, pattern, result_writer)
+                   for pattern_index, pattern in enumerate(global_config.regex_patterns)}
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    result_writer.close(global_config.full_search_output_log_full_path)
 
-                # If None then there were no results, so skip the output
-                if result is None:
-                    continue
-                # If the result is full of ONLY None
-                if result.count(None) == len(result):
-                    continue
+class FollowCheckpoint():
+    """
+    Checkpoint of follow mode kept in the results folder between runs, mapping each followed file path to its inode and
+    the byte offset scanned up to, so a restarted follow resumes where it stopped and a renamed file can be recognized
+    """
+    def __init__(self, checkpoint_full_path):
+        self.checkpoint_full_path = checkpoint_full_path
+        self.files = {}
+        self.is_new = True
+        if os.path.exists(checkpoint_full_path):
+            with open(checkpoint_full_path, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if checkpoint.get('version') == FOLLOW_CHECKPOINT_VERSION:
+                self.files = checkpoint['files']
+                self.is_new = False
+
+    def save(self):
+        # Write to a temporary file and swap it in, so an interrupted save never leaves a partial checkpoint
+        temporary_full_path = f"{self.checkpoint_full_path}.tmp"
+        with open(temporary_full_path, 'w') as checkpoint_file:
+            json.dump({'version': FOLLOW_CHECKPOINT_VERSION, 'files': self.files}, checkpoint_file)
+        os.replace(temporary_full_path, self.checkpoint_full_path)
+
+def list_followed_files():
+    """
+    Lists the plain files in the input folder with their stat results, leaving out the excluded folders and archives
+    such as rotated files that were already compressed
+    """
+    followed_files = {}
+    for root, dirs, files in os.walk(global_config.input_folder_full_path):
+        root = convert_wsl_paths(root)
+        if any(root.startswith(excluded_folder) for excluded_folder in global_config.excluded_folders_full_path):
+            continue
+        for file in files:
+            file_path = join_paths_and_convert(root, file)
+            try:
+                file_stat = os.stat(file_path)
+                if not is_archive_file(file_path):
+                    followed_files[file_path] = file_stat
+            except OSError:
+                # The file was rotated away or removed while listing, it is picked up again by the next poll
+                continue
+    return followed_files
 
-                # Write the result to the log file
-                for message in result:
-                    # If the message is None skip to find any values that are not None
-                    if message is None:
+def scan_appended_bytes(file_path, offset, pattern_set, max_read_bytes):
+    """
+    Scans the complete lines appended to a file after offset, reading at most max_read_bytes at once. A partial last
+    line is left for the next poll, unless it fills the whole read, as it could then never be completed within one
+    read. Such a fragment is scanned as a line of its own and the rest of the line is scanned as the next line.
+    Returns the matches and the offset the file has been scanned up to. Follow mode only keeps offsets in its
+    checkpoint, so the line numbers of the matches count from the line at offset.
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        appended_bytes = file.read(max_read_bytes)
+    end = appended_bytes.rfind(b'\n') + 1
+    matches = {}
+    if end == 0:
+        if len(appended_bytes) < max_read_bytes:
+            return matches, offset
+        log_general_message(f"Scanning {len(appended_bytes)} bytes at offset {offset} of {file_path} as one line, as "
+                            f"no line break was found within follow_max_read_bytes", "Follow Mode: Scan",
+                            string_log_level='WARN')
+        end = len(appended_bytes)
+    for pattern_index, byte_offset, line_number, line in scan_stream(io.BytesIO(appended_bytes[:end]), pattern_set,
+                                                                     start_offset=offset):
+        matches.setdefault(pattern_index, []).append((byte_offset, line_number, line))
+    return matches, offset + end
+
+def follow_log_files():
+    """
+    Follows the files in the input folder in place, the same as tail -f, and appends the matches in newly written lines
+    to the followed results log until interrupted or until follow_max_polls polls have run.
+    Each poll lists the files once and compares them to the checkpoint. A checkpointed inode now found under another
+    name is a rotated file, its offset moves with it so its last lines are still scanned and the new file starts at 0.
+    A file smaller than its offset was truncated and is scanned again from the start. Files are only seen at their
+    current end on the very first run, unless follow_from_start is set.
+    """
+    pattern_set = load_pattern_set(global_config.regex_patterns)
+    checkpoint = FollowCheckpoint(global_config.follow_checkpoint_full_path)
+    start_at_end = checkpoint.is_new and not global_config.follow_from_start
+    log_general_message(f"Following files in {global_config.input_folder_full_path}, writing new matches to "
+                        f"{global_config.followed_results_log_full_path}", "Follow Mode: Main Method")
+
+    poll_count = 0
+    with open(global_config.followed_results_log_full_path, 'ab') as followed_output:
+        try:
+            while global_config.follow_max_polls is None or poll_count < global_config.follow_max_polls:
+                poll_count += 1
+                followed_files = list_followed_files()
+                path_by_inode = {file_stat.st_ino: file_path for file_path, file_stat in followed_files.items()}
+
+                # Carry every checkpointed offset to wherever its inode is now, which follows rotated files
+                tracked_files = {}
+                for file_path, entry in checkpoint.files.items():
+                    current_path = path_by_inode.get(entry['inode'])
+                    if current_path is None:
+                        log_general_message(f"Stopped following {file_path} as it was removed or compressed",
+                                            "Follow Mode: Rotation")
                         continue
-                    full_search_output.write(message)
-                    # Print the result
-                    log_general_message(message, "Regex Searching: Grep Commands", False)
-                # Print an extra tw blank lines in the log after printing the results
-                spacer_lines = f'--------------------\n\n'
-                full_search_output.write(spacer_lines)
-                log_general_message(spacer_lines, "Regex Searching: Spacer Lines", False)
+                    if current_path != file_path:
+                        log_general_message(f"Detected rotation of {file_path} to {current_path}", "Follow Mode: Rotation")
+                    tracked_files[current_path] = entry
+
+                for file_path, file_stat in followed_files.items():
+                    entry = tracked_files.get(file_path)
+                    if entry is None or entry['inode'] != file_stat.st_ino:
+                        entry = {'inode': file_stat.st_ino, 'offset': file_stat.st_size if start_at_end else 0}
+                        tracked_files[file_path] = entry
+                    elif file_stat.st_size < entry['offset']:
+                        log_general_message(f"Detected truncation of {file_path}, scanning it again from the start",
+                                            "Follow Mode: Rotation")
+                        entry['offset'] = 0
+
+                    if file_stat.st_size <= entry['offset']:
+                        continue
+                    previous_offset = entry['offset']
+                    matches, entry['offset'] = scan_appended_bytes(file_path, previous_offset, pattern_set,
+                                                                   global_config.follow_max_read_bytes)
+                    global_config.run_report.add_files('follow', 1, entry['offset'] - previous_offset)
+                    for pattern_index, lines in matches.items():
+                        pattern_str = pattern_set.patterns[pattern_index].decode('utf-8')
+                        followed_output.write(f"Results for pattern '{pattern_str}' in file '{file_path}: \n".encode('utf-8'))
+                        followed_output.writelines(line + b'\n' for byte_offset, line_number, line in lines)
+                        followed_output.write(b'\n')
+                    if matches:
+                        log_general_message(f"Found {sum(len(lines) for lines in matches.values())} new matched line(s) "
+                                            f"in {file_path}", "Follow Mode: Scan")
+
+                followed_output.flush()
+                checkpoint.files = tracked_files
+                checkpoint.save()
+                start_at_end = False
+                if global_config.follow_max_polls is None or poll_count < global_config.follow_max_polls:
+                    time.sleep(global_config.follow_poll_interval_seconds)
+        except KeyboardInterrupt:
+            log_general_message("Stopped following files", "Follow Mode: Main Method")
+    checkpoint.save()
 
 def sed_output_to_summary():
     log_general_message(f"Building  event extraction based on provided REGEX", "Regex Searching: Moving Files")
+    global_config.run_report.add_files('summarize', 1, os.path.getsize(global_config.full_search_output_log_full_path))
     # Use a ThreadPoolExecutor to execute the sed commands in order, as they build on each other
     # Open the log file in the directory that the sed command is reading from and writing to
     with open(global_config.result_summary_log_full_path, 'w') as summary_output:
         # for pattern, replace in global_config.sed_replacements_for_summary:
-        result = sed_patterns(global_config.full_search_output_log_full_path, [])
+        if global_config.summary_mode == SummaryModes.SED:
+            result = sed_patterns(global_config.full_search_output_log_full_path, [])
+        elif global_config.structured_output_format is not None:
+            # Load the matched lines from the structured records rather than parsing them back out of the text
+            result = summarize_patterns(structured_output_full_path(), global_config.structured_output_format)
+        else:
+            result = summarize_patterns(global_config.full_search_output_log_full_path)
 
         # # If None then there were no results, so skip the output
         # if result is None:
@@ -244,12 +2631,9 @@ def sed_output_to_summary():
 
         if result is None:
             log_general_message("No Results found in Sed Operations", "Sed Summary: Sed Commands", False)
+            return
         # Write the result to the log file
-        for message in result:
-            # If the message is None skip to find any values that are not None
-            if message is None:
-                continue
-            summary_output.write(message)
+        summary_output.write(result)
             # Print the result
             # log_general_message(message, "Sed Summary: Sed Commands", False)
         # Print an extra tw blank lines in the log after printing the results
@@ -303,6 +2687,123 @@ def detect_os():
     else:
         return OS.LINUX
 
+class ScanModes(Enum):
+    GREP = "grep"
+    SINGLE_PASS = "single_pass"
+    INDEXED = "indexed"
+
+class StructuredFormats(Enum):
+    JSONL = "jsonl"
+    COLUMNAR = "columnar"
+
+class Profilers(Enum):
+    CPROFILE = "cprofile"
+    PYINSTRUMENT = "pyinstrument"
+
+class SummaryModes(Enum):
+    SED = "sed"
+    IN_PROCESS = "in_process"
+
+class ArchiveTypes(Enum):
+    ZIP = "Zip"
+    TAR = "Tar"
+    GZIP = "Gzip"
+    SEVEN_ZIP = "7Zip"
+    ZSTD = "Zstandard"
+
+# Number of bytes read from the start of a file to detect its archive type, large enough to reach the tar magic
+ARCHIVE_HEADER_SIZE = 512
+# Regex repeat operators, a repeat with a minimum of at least one still requires the literals of what it repeats
+REQUIRED_REPEAT_OPS = tuple(getattr(sre_parse, op) for op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                            if hasattr(sre_parse, op))
+# A .* or ^.* at the start of a branch, including its lazy and possessive forms
+LEADING_WILDCARD_PATTERN = re.compile(rb'\^?\.\*[?+]?')
+# The opening of a capturing, non capturing, named or scoped flag group, lookarounds are not matched
+GROUP_OPENING_PATTERN = re.compile(rb'\((?!\?)|\(\?(?:P<\w+>|[aiLmsux]*(?:-[imsx]+)?:)')
+# An inline flag group such as (?i) that applies to the whole pattern
+INLINE_FLAGS_PATTERN = re.compile(rb'\(\?([aiLmsux]+)\)')
+# Compile flag of each inline flag letter
+INLINE_FLAG_VALUES = {ord('a'): re.ASCII, ord('i'): re.IGNORECASE, ord('L'): re.LOCALE, ord('m'): re.MULTILINE,
+                      ord('s'): re.DOTALL, ord('x'): re.VERBOSE}
+# Numbered or named backreferences, patterns holding one are searched exactly as written
+BACKREFERENCE_PATTERN = re.compile(rb'\\[1-9]|\(\?P=')
+# Timestamp at the start of each Kafka log event, the format sorts in time order when compared as bytes
+LOG_TIMESTAMP_PATTERN = re.compile(rb'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})\]')
+LOG_TIMESTAMP_LENGTH = len(b'[YYYY-MM-DD HH:MM:SS,mmm]')
+# The same timestamp at the start of a decoded result line, removed before mining templates
+TEXT_TIMESTAMP_PATTERN = re.compile(r'^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}\]')
+# Token standing in for a parameter slot of a mined template
+TEMPLATE_WILDCARD = '<*>'
+# First line of a Java stack trace, the fully qualified exception or error type followed by its message
+EXCEPTION_HEADER_PATTERN = re.compile(rb'^([A-Za-z_$][\w$]*(?:\.[\w$]+)+(?:Exception|Error|Throwable))(?::|$)')
+# Fields of each structured match record, in the order they are stored
+STRUCTURED_FIELDS = ('pattern_id', 'file', 'line_number', 'byte_offset', 'timestamp', 'groups', 'line')
+# Number of structured match records written to the structured output at a time
+STRUCTURED_BATCH_SIZE = 10000
+# Layout version of the pattern cache, bumped whenever the cached analysis of a pattern set changes
+PATTERN_CACHE_VERSION = 2
+# Named pattern packs that a config file or --pattern-packs can pick from instead of the default patterns
+PATTERN_PACKS = {
+    'broker': [
+        rb'.*\d{4}-\d{2}-\d{1,2} \d{1,2}:\d{2}:\d{2},\d{3}.( ERROR | FATAL ).*|(org.apache.kafka.common.errors.*)',
+        rb'.*(WARN.*)',
+        rb'(ReplicaFetcher.*Error sending fetch request.*)',
+        rb'.*(brokerId=\d+.*Connection with.*disconnected.*)',
+        rb'.*java.io.IOException.*(Connection to (.*) failed.*)',
+        rb'.*(Shrinking ISR from .*)',
+    ],
+    'connect': [
+        rb'(.*client.id.=.(.*))',
+        rb'^.*(Config values:.).*\(.*',
+        rb'.*(Task threw an uncaught and unrecoverable exception.*)',
+        rb'.*(org.apache.kafka.connect.errors.*)',
+    ],
+    'streams': [
+        rb'(.*application.id.=.(.*))',
+        rb'.*(State transition from \w+ to (ERROR|PENDING_ERROR|PENDING_SHUTDOWN).*)',
+        rb'.*(org.apache.kafka.streams.errors.*)',
+        rb'.*(Detected that the thread is being fenced.*)',
+    ],
+    'ksql': [
+        rb'.*(io.confluent.ksql.\S*Exception.*)',
+        rb'.*(Query \S+ .*(terminated|failed|ERROR).*)',
+    ],
+}
+# Config file settings that hold an enum, converted from the enum value written in the file
+SETTING_ENUMS = {
+    'scan_mode': ScanModes,
+    'summary_mode': SummaryModes,
+    'structured_output_format': StructuredFormats,
+    'profiler': Profilers,
+}
+# Number of the slowest functions by cumulative time written to the cProfile report
+PROFILE_REPORT_LINES = 50
+# Layout version of the follow mode checkpoint
+FOLLOW_CHECKPOINT_VERSION = 1
+# Number of characters of the exception line kept as the example of a stack trace fingerprint
+STACK_TRACE_MESSAGE_LENGTH = 300
+# Words that trigrams are taken from when building and querying the trigram index
+WORD_PATTERN = re.compile(rb'\w+')
+# Most runs of the timeline spill read at once in one merge, more runs are merged in several passes
+TIMELINE_MERGE_FAN_IN = 64
+# Number of bytes read from a run of the timeline spill at a time
+TIMELINE_READ_SIZE = 64 * 1024
+# Number of grep output lines handed to the result writer at a time
+RESULT_BATCH_SIZE = 10000
+# Layout version of the trigram index, bumped whenever the index files change shape so older entries are rebuilt
+TRIGRAM_INDEX_VERSION = 2
+# Layout version of the scan cache, bumped whenever the shape of cached matches changes
+SCAN_CACHE_VERSION = 5
+# Caches are stored as JSON rather than pickles, as they live inside the input folder and loading a pickle runs code.
+# Latin-1 maps every byte to one character, so the bytes of lines and patterns are stored as text and read back as is
+CACHE_BYTES_ENCODING = 'latin-1'
+# Directory names that identify which broker a log file came from when tagging the merged timeline
+BROKER_PATTERN = re.compile(r'(?:broker|kafka)[-_ ]?(\d+)', re.IGNORECASE)
+# Number of bytes read at a time when hashing file contents
+HASH_CHUNK_SIZE = 1024 * 1024
+# Separator between an archive and the path of a member inside of it when reporting results
+ARCHIVE_MEMBER_SEPARATOR = '!'
+
 class LogLevels(Enum):
     NONE = 00
     ALL = 10
@@ -313,6 +2814,13 @@ class LogLevels(Enum):
     ERROR = 60
     FATAL = 60
 
+# Log levels by the names they are requested with, so most messages skip the upper() and Enum lookup
+LOG_LEVELS_BY_NAME = {name: level for name, level in LogLevels.__members__.items()}
+# Most log messages written by the log writer thread in one batch
+LOG_BATCH_SIZE = 1000
+# The second and formatted timestamp last used in a log line
+cached_log_timestamp = (None, None)
+
 
 def replace_backslash(arr):
     """
@@ -330,7 +2838,7 @@ def replace_backslash(arr):
 
 
 class GlobalConfig():
-    def __init__(self):
+    def __init__(self, input_folder_full_path=None):
         # Define logging levels for later use
         self.current_log_level = LogLevels['info'.upper()]
         # TODO check that current_log_level is valid within the log_levels when read from configs
@@ -348,8 +2856,10 @@ class GlobalConfig():
         # Define name of the input folder
         self.input_foler_name = '183978'
 
-        # Define the path to the input folder
+        # Define the path to the input folder, every other folder is created inside of it
         self.input_folder_full_path = join_paths_and_convert(self.default_parent_foler_path, self.input_foler_name)
+        if input_folder_full_path is not None:
+            self.input_folder_full_path = convert_wsl_paths(input_folder_full_path)
 
         # Create a timestamp for output logs to indicate when the results are from
         now = datetime.now()  # current date and time
@@ -367,6 +2877,14 @@ class GlobalConfig():
         self.results_folder_name = 'Processing_Results'
         self.results_folder_full_path = join_paths_and_convert(self.input_folder_full_path, self.results_folder_name)
 
+        # Define the name and full path to the folder holding the scan cache manifest and cached results
+        self.scan_cache_folder_name = 'Scan_Cache'
+        self.scan_cache_folder_full_path = join_paths_and_convert(self.results_folder_full_path, self.scan_cache_folder_name)
+
+        # Define the name and full path to the folder holding the trigram index of the extracted logs
+        self.trigram_index_folder_name = 'Trigram_Index'
+        self.trigram_index_folder_full_path = join_paths_and_convert(self.results_folder_full_path, self.trigram_index_folder_name)
+
         # Define the name and full path to logs from running process
         self.processing_log_name = f'Python_Regex_Searching_Log_File_{self.date_time}.log'
         self.processing_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.processing_log_name)
@@ -376,10 +2894,42 @@ class GlobalConfig():
         self.results_summary_log_name = f'Patterns-in-Results_{self.date_time}.log'
         self.result_summary_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.results_summary_log_name)
 
+        # Define the name and full path to the timeline of matches from all files ordered by timestamp
+        self.merged_timeline_log_name = f'Merged-Timeline_{self.date_time}.log'
+        self.merged_timeline_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.merged_timeline_log_name)
+
         # Define the name and full path to directory used to store all extracted logs
         self.full_search_output_log = f'Parsed-Results_{self.date_time}.log'
         self.full_search_output_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.full_search_output_log)
 
+        # Define the name and full path to the folder caching the analysis of pattern sets between runs
+        self.pattern_cache_folder_name = 'Pattern_Cache'
+        self.pattern_cache_folder_full_path = join_paths_and_convert(self.results_folder_full_path, self.pattern_cache_folder_name)
+
+        # Define the name and full path to the JSON report of time, bytes and files per phase and of per pattern counts
+        self.run_report_name = f'Run-Report_{self.date_time}.json'
+        self.run_report_full_path = join_paths_and_convert(self.results_folder_full_path, self.run_report_name)
+
+        # Define the names and full paths to the profiler report and the raw cProfile stats
+        self.profile_log_name = f'Profile_{self.date_time}.log'
+        self.profile_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.profile_log_name)
+        self.profile_stats_name = f'Profile_{self.date_time}.prof'
+        self.profile_stats_full_path = join_paths_and_convert(self.results_folder_full_path, self.profile_stats_name)
+
+        # Define the name and full path to the matches found in follow mode, and its checkpoint kept between runs
+        self.followed_results_log_name = f'Followed-Results_{self.date_time}.log'
+        self.followed_results_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.followed_results_log_name)
+        self.follow_checkpoint_name = 'Follow-Checkpoint.json'
+        self.follow_checkpoint_full_path = join_paths_and_convert(self.results_folder_full_path, self.follow_checkpoint_name)
+
+        # Define the name and full path to the stack traces assembled while scanning
+        self.stack_traces_log_name = f'Stack-Traces_{self.date_time}.log'
+        self.stack_traces_log_full_path = join_paths_and_convert(self.results_folder_full_path, self.stack_traces_log_name)
+
+        # Define the name and full path to the templates mined from the parsed results
+        self.log_templates_name = f'Log-Templates_{self.date_time}.log'
+        self.log_templates_full_path = join_paths_and_convert(self.results_folder_full_path, self.log_templates_name)
+
     def finalize_configs(self):
         # Folders and files to exclude from any moving operations
         self.excluded_folders = [self.log_parsing_folder_name, self.compressed_files_folder_name, self.results_folder_name]
@@ -401,17 +2951,92 @@ class GlobalConfig():
 
         # Open the processing log to remove overhead of freqently reopening the file for each event
         self.processing_log_file_handle = open(self.processing_log_full_path, 'w+')
+        self.log_writer = LogWriter(self.processing_log_file_handle)
+
+        # Times each phase of the run and gathers per pattern counts for the run report
+        self.run_report = RunReport()
+
+        # Profile this process with cProfile or pyinstrument while it runs, None turns profiling off
+        self.profiler = None
+
+        # When False archives are moved into the log parsing folder as they are and their members are searched by
+        # streaming them out of the archive, instead of extracting everything to disk first
+        self.extract_archives_to_disk = True
+
+        # How many levels of archives inside of archives are opened when extracting or streaming archive members
+        self.max_archive_depth = 5
+
+        # Size at which nested zip or 7zip members being buffered for random access are moved from memory to disk
+        self.archive_spool_max_bytes = 64 * 1024 * 1024
+
+        # Number of processes used to extract archives and scan file chunks, and threads used to stream archives in
+        # single pass scans
+        self.scan_worker_count = os.cpu_count()
+
+        # Files larger than this are split into line aligned chunks of about this size to scan them in parallel
+        self.scan_chunk_size_bytes = 64 * 1024 * 1024
+
+        # Reuse single pass scan results from previous runs for files whose contents and patterns have not changed
+        self.use_scan_cache = True
+
+        # Scan files with identical contents only once, the other paths are listed as aliases alongside the results
+        self.skip_duplicate_log_files = True
+        self.log_file_aliases = {}
+        self.duplicate_log_files = set()
+
+        # Only search log events between these timestamps, set from --since and --until, None leaves the window open
+        self.search_since = None
+        self.search_until = None
+
+        # Also write every match from every file into one timeline ordered by timestamp, set from --merged-timeline
+        self.write_merged_timeline = False
+
+        # Also write every match as a record to a structured output in this format, None only writes the text results.
+        # When set, the summary and template mining load the matched lines from the structured records
+        self.structured_output_format = None
+
+        # Assemble multi line stack traces during single pass scans and count them by exception type plus their top
+        # frames in the stack traces log, which also turns off the scan cache as every line has to be read
+        self.assemble_stack_traces = False
+        self.stack_trace_frame_count = 5
+
+        # Follow the files in the input folder in place for newly written lines instead of extracting and searching
+        # them once. Files are polled every interval reading at most max_read_bytes per file, None polls until
+        # interrupted, and files are first followed from their current end unless follow_from_start is set
+        self.follow_logs = False
+        self.follow_poll_interval_seconds = 1.0
+        self.follow_max_read_bytes = 64 * 1024 * 1024
+        self.follow_max_polls = None
+        self.follow_from_start = False
+
+        # Build or update the trigram index of the log parsing folder after the files are moved into it
+        self.build_trigram_index = False
+
+        # Size of the line aligned blocks the trigram index points to, smaller blocks narrow queries further but make
+        # the index larger
+        self.index_block_size_bytes = 1024 * 1024
+
+        # Scans that may be running or waiting to be written at once, and results that may wait in the writer queue,
+        # together these bound the memory used by results no matter how many lines match. None is twice the scan worker
+        # count, worked out by derive_default_configs once the config file may have changed the worker count
+        self.scan_max_in_flight = None
+        self.result_queue_max_items = 64
+
+        # How the patterns are searched, SINGLE_PASS reads each file once for all patterns while GREP starts a
+        # grep process per pattern per file. INDEXED only reads the blocks of indexed files that the trigram index
+        # shows can match
+        self.scan_mode = ScanModes.SINGLE_PASS
 
         # Patterns for Regex searches to perform
         self.regex_patterns = [
-            b'.*\d{4}-\d{2}-\d{1,2} \d{1,2}:\d{2}:\d{2},\d{3}.( ERROR | FATAL ).*|(org.apache.kafka.common.errors.*)',
-            b'.*(WARN.*)',
-            b'(.*client.id.=.(.*))',
-            b'^.*(Config values:.).*\(.*',
-            b'(.*application.id.=.(.*))',
-            b'(ReplicaFetcher.*Error sending fetch request.*)',
-            b'.*(brokerId=\d+.*Connection with.*disconnected.*)',
-            b'.*java.io.IOException.*(Connection to (.*) failed.*)'
+            rb'.*\d{4}-\d{2}-\d{1,2} \d{1,2}:\d{2}:\d{2},\d{3}.( ERROR | FATAL ).*|(org.apache.kafka.common.errors.*)',
+            rb'.*(WARN.*)',
+            rb'(.*client.id.=.(.*))',
+            rb'^.*(Config values:.).*\(.*',
+            rb'(.*application.id.=.(.*))',
+            rb'(ReplicaFetcher.*Error sending fetch request.*)',
+            rb'.*(brokerId=\d+.*Connection with.*disconnected.*)',
+            rb'.*java.io.IOException.*(Connection to (.*) failed.*)'
         ]
 
         # Patterns for sed searches to perform
@@ -422,7 +3047,8 @@ class GlobalConfig():
         # List of pairs (pattern, replacement), these should be performed one at a time, in sequence with pipes between
         self.sed_replacements_for_summary = [
             (r'\[[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2},[0-9]{3}\]', ''),# Needs to be a global replace /g
-            (r'((blocked for| Negative message latency|at offset|correlation id|timed out at|deadlineMs|nextAllowedTryMs|partition|offset|changelog-|generationId=)(|=| |=-))([0-9]{1,13})/\1#########/g ;s/(task(s?))( | ID .| .?|Id=)[0-9]{1,5}_[0-9]{1,5}.?', r'\1 ID #########'), # Needs to be a global replace /g
+            (r'((blocked for| Negative message latency|at offset|correlation id|timed out at|deadlineMs|nextAllowedTryMs|partition|offset|changelog-|generationId=)(|=| |=-))([0-9]{1,13})', r'\1#########'), # Needs to be a global replace /g
+            (r'(task(s?))( | ID .| .?|Id=)[0-9]{1,5}_[0-9]{1,5}.?', r'\1 ID #########'), # Needs to be a global replace /g
             (r'[0-9]{1,13} attempts left', r'########## attempts left'),
             (r'(partition )(.*)(-[0-9]{1,4})', r'\1  TOPIC_NAME'),
 
@@ -430,6 +3056,21 @@ class GlobalConfig():
             (r'(vert.x-eventloop-thread)(.*)(,main)', r'\1-###-\3'),
             (r'.{8}-.{4}-.{4}-.{4}-.{12}(-StreamThread)?(-.{1,2})?', r'THREAD_UUID\1')
         ]
+        # How the summary is built, IN_PROCESS applies the replacements as compiled regexes and counts lines in memory
+        # while SED pipes the results through sed | sort | uniq -c | sort -r
+        self.summary_mode = SummaryModes.IN_PROCESS
+
+        # Number of the most frequent normalized lines written to the summary, None writes every distinct line
+        self.summary_top_k = None
+
+        # Mine templates from the parsed results into the log templates file, alongside the summary. The depth counts
+        # the token count level and the leaf level of the parse tree, lines join the most similar template when at
+        # least the threshold fraction of their tokens match it, and each tree level holds at most max_children tokens
+        self.mine_log_templates = False
+        self.template_tree_depth = 4
+        self.template_similarity_threshold = 0.4
+        self.template_max_children = 100
+
         # self.sed_replacements_for_summary = replace_backslash(self.sed_replacements_for_summary)
 
         #  grep -v "were supplied but are not used yet." |
@@ -451,31 +3092,199 @@ class GlobalConfig():
 
         log_general_message(f'Finished initializing required configurations at process init', 'Main Method: Init Process')
 
-def init_global_configs():
+    def derive_default_configs(self):
+        """
+        Fills in the settings whose defaults depend on other settings, run after the config file has been applied so
+        the defaults follow the configured values. Settings the config file set explicitly are kept.
+        """
+        if self.scan_max_in_flight is None:
+            self.scan_max_in_flight = self.scan_worker_count * 2
+
+def parse_time_bound(time_bound, milliseconds):
+    """
+    Converts a --since or --until value into the bytes of a log timestamp so it can be compared to log lines directly
+    """
+    if time_bound is None:
+        return None
+    parsed_time = datetime.fromisoformat(time_bound)
+    return f"{parsed_time.strftime('%Y-%m-%d %H:%M:%S')},{milliseconds}".encode('utf-8')
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Extract, search, and summarize Confluent Platform logs with regex patterns.")
+    parser.add_argument('--config', help='TOML or YAML config file of paths, pattern packs, summary rules, and settings.')
+    parser.add_argument('--pattern-packs', nargs='+', choices=list(PATTERN_PACKS),
+                        help='Search with the patterns of these packs instead of the configured patterns.')
+    parser.add_argument('--input-folder', help='Folder holding the logs and archives to search, defaults to the configured input folder.')
+    parser.add_argument('--since', help='Only search log events at or after this time, formatted as "YYYY-MM-DD HH:MM:SS".')
+    parser.add_argument('--until', help='Only search log events at or before this time, formatted as "YYYY-MM-DD HH:MM:SS".')
+    parser.add_argument('--merged-timeline', action='store_true',
+                        help='Also write the matches of every file into one Merged-Timeline log ordered by timestamp.')
+    parser.add_argument('--stack-traces', action='store_true', help='Also group multi line stack traces into a Stack-Traces log.')
+    parser.add_argument('--mine-templates', action='store_true', help='Also mine templates from the results into a Log-Templates log.')
+    parser.add_argument('--structured-output', choices=[structured_format.value for structured_format in StructuredFormats],
+                        help='Also write one record per match to a Parsed-Matches file in this format.')
+    parser.add_argument('--profile', choices=[profiler.value for profiler in Profilers],
+                        help='Profile the run with this profiler and write a Profile log next to the results.')
+    parser.add_argument('--follow', action='store_true', help='Follow the input folder for newly written lines instead of a one time search.')
+    parser.add_argument('--follow-polls', type=int, help='Stop following after this many polls, by default follows until interrupted.')
+    return parser.parse_args(arguments)
+
+def pattern_pack_patterns(pack_names):
+    """
+    Joins the patterns of the named packs in order, leaving out patterns already added by an earlier pack
+    """
+    patterns = []
+    for pack_name in pack_names:
+        if pack_name not in PATTERN_PACKS:
+            raise ValueError(f"Unknown pattern pack '{pack_name}', the packs are {', '.join(PATTERN_PACKS)}")
+        patterns.extend(pattern for pattern in PATTERN_PACKS[pack_name] if pattern not in patterns)
+    return patterns
+
+def load_config_file(config_full_path):
+    """
+    Reads a TOML or YAML config file, picking the format from the extension, for example:
+
+        [paths]
+        input_folder = "/home/me/Downloads/183978"
+
+        [patterns]
+        packs = ["broker", "connect"]
+        extra = ['.*(Some other event.*)']
+
+        [summary]
+        mode = "in_process"
+        top_k = 100
+        rules = [['[0-9]{1,13} attempts left', '########## attempts left']]
+
+        [settings]
+        scan_worker_count = 8
+        mine_log_templates = true
+
+    The TOML and YAML parsers are only imported when a config file of their format is read
+    """
+    extension = os.path.splitext(config_full_path)[1].lower()
+    if extension == '.toml':
+        toml_parser = import_optional('tomllib') or import_optional('tomli')
+        if toml_parser is None:
+            raise ImportError("Reading a TOML config file needs Python 3.11 or later, or the tomli package")
+        with open(config_full_path, 'rb') as config_file:
+            return toml_parser.load(config_file)
+    if extension in ('.yaml', '.yml'):
+        yaml = import_optional('yaml')
+        if yaml is None:
+            raise ImportError("Reading a YAML config file needs the PyYAML package")
+        with open(config_full_path, 'r') as config_file:
+            return yaml.safe_load(config_file) or {}
+    raise ValueError(f"Config file {config_full_path} must be a .toml, .yaml, or .yml file")
+
+def apply_config_file(config_values):
+    """
+    Applies the patterns, summary, and settings tables of a config file to the global config. Patterns come from the
+    listed packs, or the default patterns when no packs are listed, followed by any extra patterns. Settings may name
+    any plain attribute of the global config.
+    """
+    patterns = config_values.get('patterns', {})
+    if 'packs' in patterns or 'extra' in patterns:
+        regex_patterns = pattern_pack_patterns(patterns['packs']) if 'packs' in patterns else list(global_config.regex_patterns)
+        regex_patterns.extend(pattern.encode('utf-8') for pattern in patterns.get('extra', [])
+                              if pattern.encode('utf-8') not in regex_patterns)
+        global_config.regex_patterns = regex_patterns
+
+    summary = config_values.get('summary', {})
+    if 'rules' in summary:
+        global_config.sed_replacements_for_summary = [tuple(rule) for rule in summary['rules']]
+    if 'mode' in summary:
+        global_config.summary_mode = SummaryModes(summary['mode'])
+    if 'top_k' in summary:
+        global_config.summary_top_k = summary['top_k']
+
+    for setting_name, value in config_values.get('settings', {}).items():
+        # Paths are derived from the input folder and the writers are created at startup, so neither can be set here
+        if (not hasattr(global_config, setting_name) or setting_name.endswith(('_full_path', '_handle'))
+                or setting_name in ('log_writer', 'run_report')):
+            raise ValueError(f"Unknown setting '{setting_name}' in the config file")
+        if setting_name == 'current_log_level':
+            value = LogLevels[value.upper()]
+        elif setting_name in ('search_since', 'search_until'):
+            value = parse_time_bound(value, '000' if setting_name == 'search_since' else '999')
+        elif setting_name in SETTING_ENUMS and value is not None:
+            value = SETTING_ENUMS[setting_name](value)
+        setattr(global_config, setting_name, value)
+
+def init_global_configs(args=None):
     global global_config
-    global_config = GlobalConfig()
+    config_values = {}
+    if args is not None and args.config is not None:
+        config_values = load_config_file(args.config)
+    # The input folder is needed before the config is created, as every other path is derived from it
+    input_folder = config_values.get('paths', {}).get('input_folder')
+    if args is not None and args.input_folder is not None:
+        input_folder = args.input_folder
+    global_config = GlobalConfig(input_folder)
     global_config.finalize_configs()
+    apply_config_file(config_values)
+    global_config.derive_default_configs()
+    # Options given on the command line override the config file and the configured defaults
+    if args is not None:
+        if args.pattern_packs is not None:
+            global_config.regex_patterns = pattern_pack_patterns(args.pattern_packs)
+        if args.since is not None:
+            global_config.search_since = parse_time_bound(args.since, '000')
+        if args.until is not None:
+            global_config.search_until = parse_time_bound(args.until, '999')
+        if args.merged_timeline:
+            global_config.write_merged_timeline = True
+        if args.stack_traces:
+            global_config.assemble_stack_traces = True
+        if args.mine_templates:
+            global_config.mine_log_templates = True
+        if args.structured_output is not None:
+            global_config.structured_output_format = StructuredFormats(args.structured_output)
+        if args.profile is not None:
+            global_config.profiler = Profilers(args.profile)
+        if args.follow:
+            global_config.follow_logs = True
+        if args.follow_polls is not None:
+            global_config.follow_max_polls = args.follow_polls
 
 
 
 def close_application():
+    global_config.run_report.write(global_config.run_report_full_path)
     log_general_message("Process took --- %s seconds ---" % (time.time() - global_config.processing_start_time), 'Main Method: Closing application')
+    global_config.log_writer.close()
     global_config.processing_log_file_handle.close()
 
 
 global_config = None
-def main():
+def main(arguments=None):
     """
     The main function.
     """
-    init_global_configs()
+    init_global_configs(parse_arguments(arguments))
+    profiler = start_profiler()
+    if global_config.follow_logs:
+        # Live logs are searched where they are written, so nothing is extracted or moved
+        with global_config.run_report.phase('follow'):
+            follow_log_files()
+        stop_profiler(profiler)
+        close_application()
+        return
     # Create a global instance of the configuration object
     # Create any required folder, extract compressed data, and clean the top level of the input folder
     create_and_move_folders()
+    if global_config.build_trigram_index:
+        with global_config.run_report.phase('index'):
+            build_trigram_index()
     # Perform the grep across all the logs based on the defined regex patterns
-    find_all_grep_results()
-
-    sed_output_to_summary()
+    with global_config.run_report.phase('scan'):
+        find_all_grep_results()
+
+    with global_config.run_report.phase('summarize'):
+        sed_output_to_summary()
+        if global_config.mine_log_templates:
+            templates_to_summary()
+    stop_profiler(profiler)
     # Cleanup and close the application
     close_application()
 
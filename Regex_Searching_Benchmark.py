@@ -0,0 +1,354 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import py7zr
+except ImportError:
+    py7zr = None
+
+import Regex_Searching
+
+
+# Phases that can be timed on their own, in pipeline order, followed by the full main() pipeline
+PHASES = ['extract', 'move', 'scan', 'summarize']
+# The scan phase is also timed in grep mode, so the default single pass scan can be checked against it
+ALL_BENCHMARKS = PHASES + ['scan_grep', 'main']
+# The single pass scan fails the benchmark when it takes longer than grep mode times this tolerance, which allows for
+# the noise between runs
+SCAN_MODE_TOLERANCE = 1.1
+# Prefix of the line a benchmark child process prints its measurement on
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+# Baseline results committed next to this script, compared against when no other baseline is given
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Regex_Searching_Benchmark_Baseline.json')
+# Start of the synthetic log timestamps, fixed so bundles generated with the same seed are identical
+BASE_TIMESTAMP = datetime(2024, 1, 1)
+
+BROKER_EVENTS = [
+    ('INFO', '[ReplicaFetcher replicaId={broker}, leaderId={other}, fetcherId=0] Truncating partition {topic}-{partition} with TruncationState(offset={offset}, completed=true) due to leader epoch and offset EpochEndOffset(errorCode=0, partition={partition}, leaderEpoch={epoch}, endOffset={offset}) (kafka.server.ReplicaFetcherThread)'),
+    ('INFO', '[GroupCoordinator {broker}]: Preparing to rebalance group {group} in state PreparingRebalance with old generation {epoch} (__consumer_offsets-{partition}) (reason: Adding new member consumer-{group}-{member} with group instance id None) (kafka.coordinator.group.GroupCoordinator)'),
+    ('INFO', '[Log partition={topic}-{partition}, dir=/var/lib/kafka/data] Rolled new log segment at offset {offset} in {millis} ms. (kafka.log.Log)'),
+    ('WARN', '[ReplicaFetcher replicaId={broker}, leaderId={other}, fetcherId=0] Error in response for fetch request (type=FetchRequest, replicaId={broker}, maxWait=500, minBytes=1, maxBytes=10485760) (kafka.server.ReplicaFetcherThread)'),
+    ('WARN', '[SocketServer listenerType=ZK_BROKER, nodeId={broker}] Unexpected error from /10.0.{other}.{member}; closing connection (org.apache.kafka.common.network.Selector)'),
+]
+BROKER_ERRORS = [
+    ('ERROR', '[ReplicaManager broker={broker}] Error processing append operation on partition {topic}-{partition} (kafka.server.ReplicaManager)', 'org.apache.kafka.common.errors.NotEnoughReplicasException: The size of the current ISR Set(1) is insufficient to satisfy the min.isr requirement of 2 for partition {topic}-{partition}'),
+    ('ERROR', '[ReplicaFetcher replicaId={broker}, leaderId={other}, fetcherId=0] Error sending fetch request (sessionId={session}, epoch={epoch}) to node {other}: (org.apache.kafka.clients.FetchSessionHandler)', 'java.io.IOException: Connection to {other} was disconnected before the response was read'),
+]
+CONNECT_EVENTS = [
+    ('INFO', 'WorkerSourceTask{{id={connector}-{member}}} Committing offsets for {offset} acknowledged messages (org.apache.kafka.connect.runtime.WorkerSourceTask)'),
+    ('INFO', '[Worker clientId=connect-1, groupId=connect-cluster] Rebalance started (org.apache.kafka.connect.runtime.distributed.WorkerCoordinator)'),
+    ('WARN', 'WorkerSinkTask{{id={connector}-{member}}} Ignoring invalid task provided offset {topic}-{partition}/OffsetAndMetadata{{offset={offset}, leaderEpoch=null, metadata=\'\'}} -- partition not assigned (org.apache.kafka.connect.runtime.WorkerSinkTask)'),
+]
+CONNECT_ERRORS = [
+    ('ERROR', 'WorkerSinkTask{{id={connector}-{member}}} Task threw an uncaught and unrecoverable exception. Task is being killed and will not recover until manually restarted (org.apache.kafka.connect.runtime.WorkerTask)', 'org.apache.kafka.connect.errors.ConnectException: Exiting WorkerSinkTask due to unrecoverable exception.'),
+    ('ERROR', 'WorkerSourceTask{{id={connector}-{member}}} failed to send record to {topic}: (org.apache.kafka.connect.runtime.WorkerSourceTask)', 'org.apache.kafka.common.errors.TimeoutException: Expiring {member} record(s) for {topic}-{partition}:{millis} ms has passed since batch creation'),
+]
+STREAMS_EVENTS = [
+    ('INFO', 'stream-thread [{application}-{uuid}-StreamThread-{member}] Processed {offset} total records, ran {millis} punctuators, and committed {epoch} total tasks since the last update (org.apache.kafka.streams.processor.internals.StreamThread)'),
+    ('INFO', 'stream-client [{application}-{uuid}] State transition from REBALANCING to RUNNING (org.apache.kafka.streams.KafkaStreams)'),
+    ('WARN', 'stream-thread [{application}-{uuid}-StreamThread-{member}] Detected that the thread is being fenced. This implies that this thread missed a rebalance and dropped out of the consumer group. (org.apache.kafka.streams.processor.internals.StreamThread)'),
+]
+STREAMS_ERRORS = [
+    ('ERROR', 'stream-thread [{application}-{uuid}-StreamThread-{member}] Encountered the following exception during processing and the thread is going to shut down: (org.apache.kafka.streams.processor.internals.StreamThread)', 'org.apache.kafka.streams.errors.StreamsException: Exception caught in process. taskId={epoch}_{partition}, processor=KSTREAM-SOURCE-0000000000, topic={topic}, partition={partition}, offset={offset}'),
+]
+STACK_FRAMES = [
+    'org.apache.kafka.clients.producer.internals.Sender.runOnce(Sender.java:{line})',
+    'org.apache.kafka.clients.NetworkClient.poll(NetworkClient.java:{line})',
+    'kafka.server.ReplicaManager.appendToLocalLog(ReplicaManager.scala:{line})',
+    'kafka.server.KafkaApis.handleProduceRequest(KafkaApis.scala:{line})',
+    'org.apache.kafka.connect.runtime.WorkerSinkTask.deliverMessages(WorkerSinkTask.java:{line})',
+    'org.apache.kafka.connect.runtime.WorkerTask.doRun(WorkerTask.java:{line})',
+    'org.apache.kafka.streams.processor.internals.StreamTask.process(StreamTask.java:{line})',
+    'org.apache.kafka.streams.processor.internals.StreamThread.runLoop(StreamThread.java:{line})',
+    'java.base/java.util.concurrent.ThreadPoolExecutor.runWorker(ThreadPoolExecutor.java:{line})',
+    'java.base/java.lang.Thread.run(Thread.java:{line})',
+]
+COMPONENT_EVENTS = {
+    'broker': (BROKER_EVENTS, BROKER_ERRORS),
+    'connect': (CONNECT_EVENTS, CONNECT_ERRORS),
+    'streams': (STREAMS_EVENTS, STREAMS_ERRORS),
+}
+
+
+def format_event(template, rng, instance):
+    """
+    Fills a log event template with random but plausible values
+    """
+    return template.format(broker=instance, other=rng.randint(1, 9), topic=f'orders-{rng.randint(0, 40)}',
+                           partition=rng.randint(0, 63), offset=rng.randint(0, 10**9), epoch=rng.randint(1, 500),
+                           group=f'group-{rng.randint(0, 20)}', member=rng.randint(1, 16), millis=rng.randint(1, 5000),
+                           session=rng.randint(0, 2**31), connector=f'sink-{rng.randint(0, 5)}',
+                           application='orders-app', uuid=f'{rng.getrandbits(128):032x}', line=rng.randint(40, 900))
+
+def write_component_log(file, component, instance, size_bytes, error_density, stack_trace_frequency, rng):
+    """
+    Writes about size_bytes of log events for a broker, Connect worker or Streams instance. error_density is the
+    fraction of events that are errors, and stack_trace_frequency the fraction of errors followed by a stack trace.
+    """
+    events, errors = COMPONENT_EVENTS[component]
+    timestamp = BASE_TIMESTAMP
+    written_bytes = 0
+    while written_bytes < size_bytes:
+        timestamp += timedelta(milliseconds=rng.randint(1, 250))
+        time_str = f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')},{timestamp.microsecond // 1000:03d}]"
+        if rng.random() < error_density:
+            level, template, exception = rng.choice(errors)
+            lines = [f"{time_str} {level} {format_event(template, rng, instance)}"]
+            if rng.random() < stack_trace_frequency:
+                lines.append(format_event(exception, rng, instance))
+                frame_start = rng.randint(0, len(STACK_FRAMES) - 4)
+                lines.extend(f"\tat {format_event(frame, rng, instance)}" for frame in STACK_FRAMES[frame_start:])
+        else:
+            level, template = rng.choice(events)
+            lines = [f"{time_str} {level} {format_event(template, rng, instance)}"]
+        event_bytes = ('\n'.join(lines) + '\n').encode('utf-8')
+        file.write(event_bytes)
+        written_bytes += len(event_bytes)
+
+def component_log_bytes(component, instance, arguments, rng):
+    with io.BytesIO() as log_buffer:
+        write_component_log(log_buffer, component, instance, int(arguments.log_size_mb * 1024 * 1024),
+                            arguments.error_density, arguments.stack_trace_frequency, rng)
+        return log_buffer.getvalue()
+
+def add_to_tar(tar, name, data):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    member.mtime = int(BASE_TIMESTAMP.timestamp())
+    tar.addfile(member, io.BytesIO(data))
+
+def generate_bundle(bundle_folder, arguments):
+    """
+    Generates a synthetic support bundle in bundle_folder: one bundle.tar.gz holding a zip per broker with its current
+    and rotated gzip server logs, a 7zip per Connect worker (a zip when py7zr is not installed) and a tar.gz per Streams
+    instance. Returns the total size of the uncompressed logs.
+    """
+    rng = random.Random(arguments.seed)
+    log_bytes = 0
+    os.makedirs(bundle_folder, exist_ok=True)
+    with tarfile.open(os.path.join(bundle_folder, 'bundle.tar.gz'), 'w:gz') as bundle:
+        for broker in range(1, arguments.brokers + 1):
+            server_log = component_log_bytes('broker', broker, arguments, rng)
+            rotated_log = component_log_bytes('broker', broker, arguments, rng)
+            log_bytes += len(server_log) + len(rotated_log)
+            with io.BytesIO() as zip_buffer:
+                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as broker_zip:
+                    broker_zip.writestr(f'broker-{broker}/server.log', server_log)
+                    broker_zip.writestr(f'broker-{broker}/server.log.1.gz', gzip.compress(rotated_log, mtime=0))
+                add_to_tar(bundle, f'brokers/broker-{broker}.zip', zip_buffer.getvalue())
+
+        for worker in range(1, arguments.connect_workers + 1):
+            connect_log = component_log_bytes('connect', worker, arguments, rng)
+            log_bytes += len(connect_log)
+            with io.BytesIO() as archive_buffer:
+                if py7zr is not None:
+                    with py7zr.SevenZipFile(archive_buffer, 'w') as connect_archive:
+                        connect_archive.writestr(connect_log, f'connect-{worker}/connect.log')
+                    archive_name = f'connect/connect-{worker}.7z'
+                else:
+                    with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_DEFLATED) as connect_archive:
+                        connect_archive.writestr(f'connect-{worker}/connect.log', connect_log)
+                    archive_name = f'connect/connect-{worker}.zip'
+                add_to_tar(bundle, archive_name, archive_buffer.getvalue())
+
+        for instance in range(1, arguments.streams_instances + 1):
+            streams_log = component_log_bytes('streams', instance, arguments, rng)
+            log_bytes += len(streams_log)
+            with io.BytesIO() as tar_buffer:
+                with tarfile.open(fileobj=tar_buffer, mode='w:gz') as streams_tar:
+                    add_to_tar(streams_tar, f'streams-{instance}/streams.log', streams_log)
+                add_to_tar(bundle, f'streams/streams-{instance}.tar.gz', tar_buffer.getvalue())
+    return log_bytes
+
+def folder_size(folder):
+    total_size = 0
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            total_size += os.path.getsize(os.path.join(root, file))
+    return total_size
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of this process and of its largest finished child process, None where resource is missing
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+def move_and_deduplicate():
+    Regex_Searching.move_files_except()
+    if Regex_Searching.global_config.skip_duplicate_log_files:
+        Regex_Searching.deduplicate_log_files()
+
+def run_benchmark(benchmark, input_folder):
+    """
+    Runs one benchmark inside this process and returns its measurement. Every phase before the timed one is run first
+    without timing so the timed phase sees the same input it would in the full pipeline.
+    """
+    if benchmark == 'main':
+        start_time = time.perf_counter()
+        Regex_Searching.main(['--input-folder', input_folder])
+        seconds = time.perf_counter() - start_time
+        config = Regex_Searching.global_config
+        bytes_processed = folder_size(config.log_parsing_folder_full_path)
+    else:
+        Regex_Searching.init_global_configs(Regex_Searching.parse_arguments(['--input-folder', input_folder]))
+        config = Regex_Searching.global_config
+        if benchmark == 'scan_grep':
+            config.scan_mode = Regex_Searching.ScanModes.GREP
+            benchmark = 'scan'
+        phase_steps = {
+            'extract': Regex_Searching.extract_all_directory,
+            'move': move_and_deduplicate,
+            'scan': Regex_Searching.find_all_grep_results,
+            'summarize': Regex_Searching.sed_output_to_summary,
+        }
+        for phase in PHASES:
+            if phase != benchmark:
+                phase_steps[phase]()
+                continue
+            start_time = time.perf_counter()
+            phase_steps[phase]()
+            seconds = time.perf_counter() - start_time
+            break
+        # Measure the bytes each phase works through, the archives for extraction and the logs for the others
+        if benchmark == 'extract':
+            bytes_processed = folder_size(config.compressed_files_folder_full_path)
+        elif benchmark == 'summarize':
+            bytes_processed = os.path.getsize(config.full_search_output_log_full_path)
+        else:
+            bytes_processed = folder_size(config.log_parsing_folder_full_path)
+        Regex_Searching.close_application()
+
+    peak_rss, peak_child_rss = peak_rss_bytes()
+    return {'seconds': seconds, 'bytes': bytes_processed,
+            'megabytes_per_second': bytes_processed / (1024 * 1024) / seconds if seconds else None,
+            'peak_rss_bytes': peak_rss, 'peak_child_rss_bytes': peak_child_rss}
+
+def measure_in_child(benchmark, bundle_folder, work_folder):
+    """
+    Copies the bundle into a fresh input folder and runs the benchmark in a new Python process, so each measurement
+    starts cold and its peak RSS only covers that benchmark
+    """
+    input_folder = tempfile.mkdtemp(prefix=f'{benchmark}-', dir=work_folder)
+    for file_name in os.listdir(bundle_folder):
+        shutil.copy(os.path.join(bundle_folder, file_name), input_folder)
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-benchmark', benchmark,
+                                '--input-folder', input_folder], capture_output=True, text=True)
+    shutil.rmtree(input_folder, ignore_errors=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Benchmark '{benchmark}' failed with exit status {completed.returncode}:\n{completed.stderr}")
+
+def format_megabytes(byte_count):
+    return f"{byte_count / (1024 * 1024):.1f}" if byte_count is not None else 'n/a'
+
+def format_change(current, baseline):
+    if current is None or not baseline:
+        return 'n/a'
+    return f"{(current - baseline) / baseline:+.1%}"
+
+def report_results(results, baseline):
+    """
+    Prints MB/s and peak RSS of each benchmark next to the baseline, a falling MB/s or a rising RSS is a regression
+    """
+    print(f"{'Benchmark':<10} {'MB/s':>9} {'Baseline':>9} {'Change':>8} {'Peak RSS MB':>12} {'Child RSS MB':>13} "
+          f"{'Baseline RSS':>13} {'Change':>8}")
+    for benchmark, result in results.items():
+        baseline_result = baseline.get(benchmark, {})
+        baseline_throughput = baseline_result.get('megabytes_per_second')
+        baseline_rss = baseline_result.get('peak_rss_bytes')
+        print(f"{benchmark:<10} {result['megabytes_per_second']:>9.2f} "
+              f"{baseline_throughput if baseline_throughput is not None else float('nan'):>9.2f} "
+              f"{format_change(result['megabytes_per_second'], baseline_throughput):>8} "
+              f"{format_megabytes(result['peak_rss_bytes']):>12} {format_megabytes(result['peak_child_rss_bytes']):>13} "
+              f"{format_megabytes(baseline_rss):>13} {format_change(result['peak_rss_bytes'], baseline_rss):>8}")
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark Regex_Searching on a synthetic Kafka support bundle.")
+    parser.add_argument('--benchmarks', nargs='+', choices=ALL_BENCHMARKS, default=ALL_BENCHMARKS,
+                        help='Phases to time on their own, and main for the full pipeline.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, the median run is reported.')
+    parser.add_argument('--brokers', type=int, default=3, help='Number of brokers in the bundle.')
+    parser.add_argument('--connect-workers', type=int, default=2, help='Number of Connect workers in the bundle.')
+    parser.add_argument('--streams-instances', type=int, default=2, help='Number of Streams instances in the bundle.')
+    parser.add_argument('--log-size-mb', type=float, default=8, help='Size of each generated log file in MB.')
+    parser.add_argument('--error-density', type=float, default=0.02, help='Fraction of log events that are errors.')
+    parser.add_argument('--stack-trace-frequency', type=float, default=0.5, help='Fraction of errors with a stack trace.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the generator, the same seed gives the same bundle.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='JSON file of the baseline results to compare against.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--work-folder', help='Folder to generate the bundle in, defaults to a temporary folder.')
+    # Used by the benchmark to run a single measurement in a child process
+    parser.add_argument('--run-benchmark', choices=ALL_BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument('--input-folder', help=argparse.SUPPRESS)
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    if args.run_benchmark is not None:
+        print(RESULT_PREFIX + json.dumps(run_benchmark(args.run_benchmark, args.input_folder)))
+        return
+
+    work_folder = args.work_folder or tempfile.mkdtemp(prefix='regex-searching-benchmark-')
+    bundle_folder = os.path.join(work_folder, 'bundle')
+    print(f"Generating the synthetic bundle in {bundle_folder}")
+    log_bytes = generate_bundle(bundle_folder, args)
+    print(f"Generated {format_megabytes(log_bytes)} MB of logs, {format_megabytes(folder_size(bundle_folder))} MB compressed")
+
+    results = {}
+    for benchmark in args.benchmarks:
+        runs = [measure_in_child(benchmark, bundle_folder, work_folder) for _ in range(args.repeat)]
+        # The run with the median time is reported, which keeps one slow or fast outlier from skewing the result
+        median_seconds = statistics.median_low(run['seconds'] for run in runs)
+        results[benchmark] = next(run for run in runs if run['seconds'] == median_seconds)
+        print(f"Finished {benchmark} in {median_seconds:.2f} seconds (median of {args.repeat})")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    report_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'generator': {name: getattr(args, name) for name in ('brokers', 'connect_workers',
+                                                                            'streams_instances', 'log_size_mb',
+                                                                            'error_density', 'stack_trace_frequency',
+                                                                            'seed')},
+                       'results': results}, baseline_file, indent=4)
+        print(f"Saved the results as the baseline in {args.baseline}")
+    if args.work_folder is None:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    if 'scan' in results and 'scan_grep' in results:
+        single_pass_seconds, grep_seconds = results['scan']['seconds'], results['scan_grep']['seconds']
+        if single_pass_seconds > grep_seconds * SCAN_MODE_TOLERANCE:
+            sys.exit(f"The single pass scan took {single_pass_seconds:.2f} seconds, slower than the "
+                     f"{grep_seconds:.2f} seconds of grep mode on the same patterns")
+        print(f"The single pass scan took {single_pass_seconds:.2f} seconds against {grep_seconds:.2f} seconds in grep mode")
+
+
+if __name__ == "__main__":
+    main()
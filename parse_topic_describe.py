@@ -3,97 +3,915 @@ This script is designed to parse and analyze Kafka topic information. It can pro
 or execute a shell command to gather data. It provides insights into offline partitions, under-replicated partitions,
 leadership distribution, and frequency of preferred leadership among Kafka topics.
 
+The describe output is read one line at a time into a columnar partition table, so clusters with hundreds of thousands
+of partitions are analyzed without holding the raw output or a Python object per partition in memory.
+
 Usage:
     Run with a file: python kafka_analyzer.py --file <path_to_file>
     Run with a command: python kafka_analyzer.py --command '<shell_command>'
+    Run against many clusters: python kafka_analyzer.py --inventory <path_to_inventory_json>
 """
 
+import asyncio
 import subprocess
 import argparse
+import collections
+import json
 import os
 import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+# Leader id stored for partitions without a leader, shown as "none" or -1 by kafka-topics
+NO_LEADER = -1
+
+# Fallback for partition lines whose fields are separated by spaces instead of tabs, compiled once
+PARTITION_FIELD_PATTERN = re.compile(r"(Topic|Partition|Leader|Replicas|Isr|Offline|Observers):[ \t]*([^\s:]*)(?=\s|$)")
+
+# Number of partitions parsed between progress lines while the output of a command is streamed
+PROGRESS_INTERVAL = 10000
+
+# Most recent changes kept per partition when diffing snapshots, so long captures stay within bounded memory
+SNAPSHOT_TIMELINE_LENGTH = 20
+
+# Most describe commands run at once in multi-cluster mode
+FLEET_CONCURRENCY = 8
+
+# Bytes read from a describe command at a time in multi-cluster mode, lines are split from the chunks so a topic line
+# listing every topic config can be any length
+FLEET_READ_SIZE = 64 * 1024
+
+
+def kill_process_group(process):
+    """
+    Kills a command started in its own session along with any process it started, such as the JVM behind kafka-topics.
+
+    Args:
+        process (subprocess.Popen or asyncio.subprocess.Process): The shell running the command.
+    """
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
 
-def run_command(command):
+def stream_command(command, timeout=None):
     """
-    Execute a shell command and return its output or an error message.
+    Execute a shell command and yield its standard output one line at a time as it is produced, so the output can be
+    parsed while the command is still running without being held in memory.
 
     Args:
         command (str): The command to be executed in the shell.
+        timeout (float): Seconds after which the command is killed, or None to wait for it indefinitely.
 
-    Returns:
-        str: The standard output from the command or an error message.
+    Yields:
+        str: Each line of the standard output from the command.
 
     Raises:
-        subprocess.CalledProcessError: If the command execution fails.
+        subprocess.TimeoutExpired: If the command did not finish within the timeout.
+        subprocess.CalledProcessError: If the command exits with a non-zero status, with its standard error attached.
     """
-    try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        output, error = process.communicate()
+    # Standard error goes to a temporary file so a chatty command cannot block on a full pipe nobody is reading.
+    # Bytes that are not UTF-8, such as a topic config written in another encoding, are replaced rather than raising
+    # part way through the output, the same as in multi-cluster mode
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=error_file, shell=True, encoding='utf-8',
+                                   errors='replace', start_new_session=True)
+        timed_out = threading.Event()
+        def expire():
+            timed_out.set()
+            kill_process_group(process)
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            for line in process.stdout:
+                yield line
+            process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            # The caller stopped reading early, so do not leave the command running
+            if process.poll() is None:
+                kill_process_group(process)
+                process.wait()
+            process.stdout.close()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
         if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, command, output=output, stderr=error)
-        return output.decode()
-    except subprocess.CalledProcessError as e:
-        return f"Command '{command}' failed with exit status {e.returncode}: {e.stderr.decode()}"
+            error_file.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, command,
+                                                stderr=error_file.read().decode(errors='replace').strip())
+
+def parse_broker_list(value):
+    """
+    Parses a comma separated list of broker ids.
+
+    Args:
+        value (str): The list as written in the describe output, for example "1,2,3" or an empty string.
+
+    Returns:
+        list: The broker ids in the order they are listed.
+    """
+    return [int(broker) for broker in value.split(',') if broker]
+
+def parse_leader(value):
+    """
+    Parses the leader of a partition.
+
+    Args:
+        value (str): The leader as written in the describe output, a broker id, "none" or "-1".
+
+    Returns:
+        int: The leader broker id, or NO_LEADER when the partition has no leader.
+    """
+    return int(value) if value.lstrip('-').isdigit() else NO_LEADER
+
+def parse_partition_fields(line):
+    """
+    Splits a partition line of the describe output into its fields.
+
+    Args:
+        line (str): A line of the describe output.
+
+    Returns:
+        dict or None: The value of each field by name, or None when the line does not describe a partition, such as
+        the summary line of each topic.
+    """
+    if 'Partition:' not in line:
+        return None
+    return split_fields(line)
+
+def split_fields(text):
+    """
+    Splits the "Name: value" fields of a line of the describe output.
+
+    Args:
+        text (str): The line, or the part of it holding the fields of interest.
+
+    Returns:
+        dict: The value of each field by name.
+    """
+    text = text.strip()
+    # Output that separates the fields with spaces instead of tabs is split with the regex
+    if '\t' not in text:
+        return dict(PARTITION_FIELD_PATTERN.findall(text))
+    fields = {}
+    for field in text.split('\t'):
+        name, _, value = field.partition(':')
+        fields[name.strip()] = value.strip()
+    return fields
+
+class PartitionTable():
+    """
+    Columnar table of partitions. Topic names are interned once and referenced by id, and every other column is an
+    array of machine integers. Replicas, ISR and observers of all partitions are each kept in one flat array, with an
+    offsets array marking where the brokers of each partition start.
+    """
+    def __init__(self):
+        self.topic_names = []
+        self.topic_ids = {}
+        self.topics = array('i')
+        self.partitions = array('i')
+        self.leaders = array('i')
+        self.replicas = array('i')
+        self.replica_offsets = array('q', [0])
+        self.isr = array('i')
+        self.isr_offsets = array('q', [0])
+        self.observers = array('i')
+        self.observer_offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def add_partition(self, topic, partition, leader, replicas, isr, observers):
+        """
+        Appends one partition to the table.
+
+        Args:
+            topic (str): The topic name.
+            partition (int): The partition number.
+            leader (int): The leader broker id, or NO_LEADER.
+            replicas (list): The replica broker ids, the first one is the preferred leader.
+            isr (list): The in sync replica broker ids.
+            observers (list): The observer broker ids.
+        """
+        topic_id = self.topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = self.topic_ids[topic] = len(self.topic_names)
+            self.topic_names.append(topic)
+        self.topics.append(topic_id)
+        self.partitions.append(partition)
+        self.leaders.append(leader)
+        self.replicas.extend(replicas)
+        self.replica_offsets.append(len(self.replicas))
+        self.isr.extend(isr)
+        self.isr_offsets.append(len(self.isr))
+        self.observers.extend(observers)
+        self.observer_offsets.append(len(self.observers))
+
+    def add_line(self, line):
+        """
+        Parses one line of the describe output and appends the partition it describes.
+
+        Args:
+            line (str): A line of the describe output.
+
+        Returns:
+            bool: True if the line described a partition, False for any other line.
+        """
+        fields = parse_partition_fields(line)
+        if fields is None or 'Topic' not in fields:
+            return False
+        self.add_partition(fields['Topic'], int(fields['Partition']), parse_leader(fields.get('Leader', '')),
+                           parse_broker_list(fields.get('Replicas', '')), parse_broker_list(fields.get('Isr', '')),
+                           parse_broker_list(fields.get('Observers', '')))
+        return True
+
+    def replicas_of(self, index):
+        return self.replicas[self.replica_offsets[index]:self.replica_offsets[index + 1]]
+
+    def isr_of(self, index):
+        return self.isr[self.isr_offsets[index]:self.isr_offsets[index + 1]]
+
+    def observers_of(self, index):
+        return self.observers[self.observer_offsets[index]:self.observer_offsets[index + 1]]
+
+    def is_under_replicated(self, index):
+        """
+        Checks whether a replica that is not an observer is missing from the ISR of a partition. Observers replicate
+        asynchronously and are not expected to be in the ISR, so they never make a partition under replicated. The ISR
+        is always a subset of the replicas, so without observers comparing the lengths of the two columns is enough.
+
+        Args:
+            index (int): The index of the partition in the table.
+
+        Returns:
+            bool: True if the partition is under replicated.
+        """
+        replica_count = self.replica_offsets[index + 1] - self.replica_offsets[index]
+        isr_count = self.isr_offsets[index + 1] - self.isr_offsets[index]
+        if self.observer_offsets[index + 1] == self.observer_offsets[index]:
+            return replica_count > isr_count
+        isr = set(self.isr_of(index))
+        observers = set(self.observers_of(index))
+        return any(broker not in isr and broker not in observers for broker in self.replicas_of(index))
+
+    def preferred_leaders(self):
+        """
+        Returns:
+            array: The preferred leader of every partition, the first listed replica, or NO_LEADER without replicas.
+        """
+        replicas, offsets = self.replicas, self.replica_offsets
+        return array('i', (replicas[start] if start < end else NO_LEADER
+                           for start, end in zip(offsets, offsets[1:])))
+
+def parse_lines(lines, table=None, progress_interval=None):
+    """
+    Reads the describe output one line at a time into a partition table.
+
+    Args:
+        lines (iterable): Lines of the describe output, such as an open file or the output of a command.
+        table (PartitionTable): A table to add the partitions to, a new table is created when None.
+        progress_interval (int): Print the running offline and under replicated counts to standard error every this
+            many partitions, or None to parse quietly.
+
+    Returns:
+        PartitionTable: The table holding every partition that was read.
+    """
+    if table is None:
+        table = PartitionTable()
+    offline_count = 0
+    under_replicated_count = 0
+    for line in lines:
+        if not table.add_line(line) or not progress_interval:
+            continue
+        offline_count += table.leaders[-1] == NO_LEADER
+        under_replicated_count += table.is_under_replicated(len(table) - 1)
+        if len(table) % progress_interval == 0:
+            print(f"Parsed {len(table)} partitions of {len(table.topic_names)} topics so far, "
+                  f"{offline_count} offline and {under_replicated_count} under replicated", file=sys.stderr)
+    return table
+
+def get_offline_partitions(table):
+    """
+    Finds the partitions without a leader.
+
+    Args:
+        table (PartitionTable): The partitions to check.
+
+    Returns:
+        list: The indexes of the offline partitions in the table.
+    """
+    return [index for index, leader in enumerate(table.leaders) if leader == NO_LEADER]
+
+def get_under_replicated_partitions(table):
+    """
+    Finds the partitions with at least one replica missing from the ISR, leaving observers out of the comparison.
+
+    Args:
+        table (PartitionTable): The partitions to check.
+
+    Returns:
+        list: The indexes of the under replicated partitions in the table.
+    """
+    return [index for index in range(len(table)) if table.is_under_replicated(index)]
+
+def describe_out_of_sync_brokers(table, index):
+    """
+    Lists the replicas of a partition missing from its ISR. Observers are not expected in the ISR, so they are not listed.
+
+    Args:
+        table (PartitionTable): The table holding the partition.
+        index (int): The index of the partition in the table.
+
+    Returns:
+        str: The out of sync brokers, for example "1, 2".
+    """
+    isr = set(table.isr_of(index))
+    observers = set(table.observers_of(index))
+    return ', '.join(str(broker) for broker in sorted(table.replicas_of(index))
+                     if broker not in isr and broker not in observers)
+
+def get_leadership_distribution(table):
+    """
+    Counts the partitions led by each broker.
+
+    Args:
+        table (PartitionTable): The partitions to count.
+
+    Returns:
+        collections.Counter: The number of partitions led by each broker id.
+    """
+    leader_counts = collections.Counter(table.leaders)
+    leader_counts.pop(NO_LEADER, None)
+    return leader_counts
+
+def get_preferred_leadership(table):
+    """
+    Compares the leader of every partition to its preferred leader.
+
+    Args:
+        table (PartitionTable): The partitions to compare.
+
+    Returns:
+        tuple: Counters by broker id of the partitions where the preferred leader is the leader, and of the partitions
+        where the preferred leader is not the leader.
+    """
+    preferred_counts = collections.Counter()
+    non_preferred_counts = collections.Counter()
+    for leader, preferred_leader in zip(table.leaders, table.preferred_leaders()):
+        if preferred_leader == NO_LEADER:
+            continue
+        if leader == preferred_leader:
+            preferred_counts[preferred_leader] += 1
+        else:
+            non_preferred_counts[preferred_leader] += 1
+    return preferred_counts, non_preferred_counts
+
+def parse_output(output, progress_interval=None):
+    """
+    Parses the describe output and prints the offline, under replicated, leadership distribution and preferred
+    leadership reports.
+
+    Args:
+        output (str or iterable): The whole describe output, or its lines as they are read.
+        progress_interval (int): Print progress to standard error every this many partitions while parsing.
+
+    Returns:
+        PartitionTable: The table the reports were computed from.
+    """
+    if isinstance(output, str):
+        output = output.splitlines()
+    table = parse_lines(output, progress_interval=progress_interval)
+
+    # The offline report is only printed when there is something to report, keeping the usual output unchanged
+    offline_partitions = get_offline_partitions(table)
+    if offline_partitions:
+        print(f"Count of offline partitions: {len(offline_partitions)}")
+        print("Offline partitions:")
+        for index in offline_partitions:
+            replicas = ', '.join(str(broker) for broker in table.replicas_of(index))
+            print(f'  Topic: "{table.topic_names[table.topics[index]]}", Partition: "{table.partitions[index]}", '
+                  f'Replicas: "{replicas}"')
+
+    under_replicated_partitions = get_under_replicated_partitions(table)
+    print(f"Count of under replicated partitions: {len(under_replicated_partitions)}")
+    print("Under replicated partitions:")
+    for index in under_replicated_partitions:
+        print(f'  Topic: "{table.topic_names[table.topics[index]]}", Partition: "{table.partitions[index]}", '
+              f'Leader Node: "{table.leaders[index]}", '
+              f'Brokers Out of Sync: "{describe_out_of_sync_brokers(table, index)}"')
+
+    print("Leadership distribution:")
+    for broker, count in sorted(get_leadership_distribution(table).items()):
+        print(f"  Broker: {broker} is a leader for {count} partition(s)")
+
+    print("Under replicated leader counts:")
+    under_replicated_leaders = collections.Counter(table.leaders[index] for index in under_replicated_partitions)
+    under_replicated_leaders.pop(NO_LEADER, None)
+    for broker, count in sorted(under_replicated_leaders.items()):
+        print(f"  Broker: {broker} is a leader for {count} under replicated partition(s)")
+
+    preferred_counts, non_preferred_counts = get_preferred_leadership(table)
+    print("Frequency of Non-Preferred leadership:")
+    for broker, count in non_preferred_counts.most_common():
+        print(f"  Broker: {broker} is not the leader while being the preferred leader for {count} partitions(s)")
+
+    print("Frequency of Preferred leadership:")
+    for broker, count in sorted(preferred_counts.items()):
+        print(f"  Broker: {broker} is the preferred leader and the actual leader for {count} partitions(s)")
+
+    return table
 
-def extract_integer_value(line, keyword):
+def load_broker_racks(path):
     """
-    Extract an integer value from a line based on the specified keyword.
+    Loads the rack of each broker.
 
     Args:
-        line (str): The line from which to extract the value.
-        keyword (str): The keyword to identify the start of the value.
+        path (str): Path to a JSON file mapping broker ids to rack names, for example {"1": "rack-a"}.
 
     Returns:
-        int or None: The extracted integer value, or None if not found.
+        dict: The rack name of each broker id.
     """
-    match = re.search(rf"{keyword}(\d+)", line)
-    if match:
-        return int(match.group(1))
-    return None
+    with open(path, 'r') as file:
+        return {int(broker): rack for broker, rack in json.load(file).items()}
 
-def extract_replicas_and_isr(line):
+def get_leader_candidates(table, allowed_leaders=None):
     """
-    Extracts the replicas and ISR from a line.
+    Finds the brokers each partition can be led by after a preferred leader election. Observers cannot lead, and a
+    replica outside the ISR would fail the election, so the candidates are the in sync replicas that are not observers.
 
     Args:
-        line (str): The line from which to extract the information.
+        table (PartitionTable): The partitions to check.
+        allowed_leaders (set): Only these brokers may lead, for example the brokers of the racks leadership is kept
+            in, or None to allow any broker.
 
     Returns:
-        tuple: A set of replicas and a set of ISRs.
+        list: Tuples of the index of each partition with at least one candidate and its candidates in replica order.
     """
-    # Extract replicas
-    replicas_match = re.search(r"Replicas: ([\d,]+)", line)
-    replicas = set(map(int, replicas_match.group(1).split(","))) if replicas_match else set()
+    leader_candidates = []
+    for index in range(len(table)):
+        if table.leaders[index] == NO_LEADER:
+            continue
+        isr = set(table.isr_of(index))
+        observers = set(table.observers_of(index))
+        candidates = [broker for broker in table.replicas_of(index) if broker in isr and broker not in observers
+                      and (allowed_leaders is None or broker in allowed_leaders)]
+        if candidates:
+            leader_candidates.append((index, candidates))
+    return leader_candidates
 
-    # Extract ISR
-    isr_match = re.search(r"Isr: ([\d,]+)", line)
-    isr = set(map(int, isr_match.group(1).split(","))) if isr_match else set()
+def plan_preferred_leaders(table, leader_candidates):
+    """
+    Chooses a preferred leader for every partition so leadership is spread evenly across the candidate brokers. The
+    partitions with the fewest candidates are placed first, and a partition keeps its current preferred leader unless
+    that broker already has its share of leadership, so the plan moves as few partitions as it can. This is one greedy
+    pass, linear in the number of replicas.
+
+    Args:
+        table (PartitionTable): The partitions to plan.
+        leader_candidates (list): The candidates of each partition, as returned by get_leader_candidates.
+
+    Returns:
+        dict: The planned preferred leader by partition index.
+    """
+    brokers = {broker for _, candidates in leader_candidates for broker in candidates}
+    if not brokers:
+        return {}
+    target = -(-len(leader_candidates) // len(brokers))
+    preferred_leaders = table.preferred_leaders()
+    loads = collections.Counter()
+    planned_leaders = {}
+    for index, candidates in sorted(leader_candidates, key=lambda item: len(item[1])):
+        leader = preferred_leaders[index]
+        if leader not in candidates or loads[leader] >= target:
+            leader = min(candidates, key=loads.__getitem__)
+        planned_leaders[index] = leader
+        loads[leader] += 1
+    return planned_leaders
+
+def write_json_plan(path, plan):
+    """
+    Writes a plan file for the Kafka admin tools.
+
+    Args:
+        path (str): Path of the JSON file.
+        plan (dict): The plan to write.
+    """
+    # json.dumps encodes in one call to the C encoder, where json.dump streams through the much slower Python one
+    with open(path, 'w') as file:
+        file.write(json.dumps(plan))
+
+def generate_rebalance_plan(table, election_plan_path=None, reassignment_plan_path=None, broker_racks=None,
+                            leader_racks=None):
+    """
+    Writes the plans that even out leadership and prints the current and projected leader count of each broker.
+
+    Without a reassignment plan, the election plan elects the current preferred leader of every partition it can. With
+    a reassignment plan, the replicas of each partition are reordered so the balanced leader comes first, leaving the
+    replica set, and so the rack placement and observers, unchanged, and the election plan then elects those leaders
+    once the reassignment has completed.
+
+    Args:
+        table (PartitionTable): The partitions to rebalance.
+        election_plan_path (str): Path of the kafka-leader-election JSON to write, or None.
+        reassignment_plan_path (str): Path of the kafka-reassign-partitions JSON to write, or None.
+        broker_racks (dict): The rack of each broker, required when leader_racks is given.
+        leader_racks (list): Racks whose brokers may lead partitions, or None to allow every rack.
+
+    Returns:
+        dict: The projected leader by partition index, for the partitions whose leader changes.
 
-    return replicas, isr
+    Raises:
+        ValueError: If leader racks are given without the rack of each broker.
+    """
+    allowed_leaders = None
+    if leader_racks:
+        if not broker_racks:
+            raise ValueError("Leader racks need a broker racks file to know which brokers are in them")
+        allowed_leaders = {broker for broker, rack in broker_racks.items() if rack in leader_racks}
+
+    leader_candidates = get_leader_candidates(table, allowed_leaders)
+    preferred_leaders = table.preferred_leaders()
+    if reassignment_plan_path:
+        planned_leaders = plan_preferred_leaders(table, leader_candidates)
+        reassignments = []
+        for index, leader in planned_leaders.items():
+            if leader != preferred_leaders[index]:
+                replicas = table.replicas_of(index)
+                reassignment = {"topic": table.topic_names[table.topics[index]],
+                                "partition": table.partitions[index],
+                                "replicas": [leader] + [broker for broker in replicas if broker != leader]}
+                # The reassignment tool treats a partition listed without observers as having none, which would
+                # turn its observers into regular replicas
+                observers = table.observers_of(index)
+                if observers:
+                    reassignment["observers"] = list(observers)
+                reassignments.append(reassignment)
+        write_json_plan(reassignment_plan_path, {"version": 1, "partitions": reassignments})
+        print(f"Count of partitions in the reassignment plan: {len(reassignments)}")
+    else:
+        planned_leaders = {index: preferred_leaders[index] for index, candidates in leader_candidates
+                           if preferred_leaders[index] in candidates}
 
-# The functions `get_offline_partitions`, `get_under_replicated_partitions`, `parse_output` need to be updated accordingly
-# to match the structure and error handling strategy as discussed. Additionally, these functions should have detailed
-# documentation explaining their purpose, inputs, and outputs for consistency and clarity.
+    projected_leaders = {index: leader for index, leader in planned_leaders.items()
+                         if leader != table.leaders[index]}
+    if election_plan_path:
+        elections = [{"topic": table.topic_names[table.topics[index]], "partition": table.partitions[index]}
+                     for index in sorted(projected_leaders)]
+        write_json_plan(election_plan_path, {"partitions": elections})
+        print(f"Count of partitions in the election plan: {len(elections)}")
+
+    current_counts = get_leadership_distribution(table)
+    projected_counts = collections.Counter(current_counts)
+    for index, leader in projected_leaders.items():
+        projected_counts[table.leaders[index]] -= 1
+        projected_counts[leader] += 1
+    print("Projected leadership distribution:")
+    for broker in sorted(set(current_counts) | set(projected_counts)):
+        print(f"  Broker: {broker} is a leader for {current_counts[broker]} partition(s) now and "
+              f"{projected_counts[broker]} partition(s) after the plan")
+    return projected_leaders
+
+class SnapshotIndex():
+    """
+    Index of the latest state of every partition across a series of describe snapshots. Each partition line is keyed
+    by its topic and partition and stored with the text of its state, so an unchanged partition costs one string
+    comparison and only the partitions whose state text differs are parsed and diffed. Memory is bounded by the size of
+    the cluster and the timeline length, not by the number of snapshots.
+    """
+    def __init__(self, timeline_length=None):
+        self.partitions = {}
+        self.timelines = {}
+        self.timeline_length = timeline_length
+        self.broker_churn = collections.defaultdict(collections.Counter)
+        self.snapshot_labels = []
+        self.change_counts = collections.Counter()
+
+    def apply_snapshot(self, label, lines):
+        """
+        Diffs one snapshot against the index and updates the index to it. The first snapshot only fills the index.
+
+        Args:
+            label (str): The name of the snapshot shown in the timeline.
+            lines (iterable): Lines of the describe output of the snapshot.
+
+        Returns:
+            int: The number of partitions that changed since the previous snapshot.
+        """
+        baseline = not self.snapshot_labels
+        self.snapshot_labels.append(label)
+        previous_keys = set(self.partitions) if not baseline else set()
+        changed = 0
+        for line in lines:
+            prefix, separator, state = line.partition('Leader:')
+            if not separator or 'Partition:' not in prefix:
+                continue
+            key = ' '.join(prefix.split())
+            state = separator + state.rstrip('\n')
+            previous_state = self.partitions.get(key)
+            previous_keys.discard(key)
+            if previous_state == state:
+                continue
+            self.partitions[key] = state
+            if not baseline:
+                changed += 1
+                self.record_change(label, key, previous_state, state)
+        for key in previous_keys:
+            changed += 1
+            self.record_change(label, key, self.partitions.pop(key), None)
+        return changed
+
+    def record_change(self, label, key, previous_state, state):
+        """
+        Adds the differences between two states of a partition to its timeline and to the churn of each broker.
+
+        Args:
+            label (str): The name of the snapshot the change was seen in.
+            key (str): The topic and partition of the partition.
+            previous_state (str): The state text in the previous snapshot, or None for a new partition.
+            state (str): The state text in this snapshot, or None for a deleted partition.
+        """
+        changes = []
+        if previous_state is None:
+            changes.append("Partition created")
+            self.change_counts['created'] += 1
+        elif state is None:
+            changes.append("Partition deleted")
+            self.change_counts['deleted'] += 1
+        else:
+            previous_fields = split_fields(previous_state)
+            fields = split_fields(state)
+            previous_leader = parse_leader(previous_fields.get('Leader', ''))
+            leader = parse_leader(fields.get('Leader', ''))
+            if leader != previous_leader:
+                if leader == NO_LEADER:
+                    changes.append(f"Went offline, leader was {previous_leader}")
+                    self.change_counts['offline'] += 1
+                elif previous_leader == NO_LEADER:
+                    changes.append(f"Came back online with leader {leader}")
+                    self.change_counts['online'] += 1
+                else:
+                    changes.append(f"Leader changed from {previous_leader} to {leader}")
+                    self.change_counts['leader'] += 1
+                if previous_leader != NO_LEADER:
+                    self.broker_churn[previous_leader]['leadership lost'] += 1
+                if leader != NO_LEADER:
+                    self.broker_churn[leader]['leadership gained'] += 1
+            previous_isr = set(parse_broker_list(previous_fields.get('Isr', '')))
+            isr = set(parse_broker_list(fields.get('Isr', '')))
+            if previous_isr - isr:
+                changes.append(f"Brokers removed from ISR: {', '.join(map(str, sorted(previous_isr - isr)))}")
+                self.change_counts['isr shrink'] += 1
+                for broker in previous_isr - isr:
+                    self.broker_churn[broker]['ISR removals'] += 1
+            if isr - previous_isr:
+                changes.append(f"Brokers added to ISR: {', '.join(map(str, sorted(isr - previous_isr)))}")
+                self.change_counts['isr expand'] += 1
+                for broker in isr - previous_isr:
+                    self.broker_churn[broker]['ISR additions'] += 1
+            if previous_fields.get('Replicas') != fields.get('Replicas'):
+                changes.append(f"Replicas changed from {previous_fields.get('Replicas')} to {fields.get('Replicas')}")
+                self.change_counts['reassigned'] += 1
+            if not changes:
+                return
+        timeline = self.timelines.get(key)
+        if timeline is None:
+            timeline = self.timelines[key] = collections.deque(maxlen=self.timeline_length)
+        timeline.append((label, '; '.join(changes)))
+
+def diff_snapshots(snapshot_paths, timeline_length=None):
+    """
+    Diffs a series of describe snapshots in the order given and prints the change timeline of every partition that
+    changed and the churn of every broker.
+
+    Args:
+        snapshot_paths (list): Paths to the snapshot files, oldest first.
+        timeline_length (int): The most recent changes kept per partition, or None to keep all of them.
+
+    Returns:
+        SnapshotIndex: The index holding the state of the last snapshot and the changes seen.
+    """
+    index = SnapshotIndex(timeline_length)
+    for path in snapshot_paths:
+        with open(path, 'r') as file:
+            index.apply_snapshot(os.path.basename(path), file)
+
+    print(f"Count of snapshots compared: {len(index.snapshot_labels)}")
+    print(f"Count of partitions changed: {len(index.timelines)}")
+    print("Change counts:")
+    for change, count in sorted(index.change_counts.items()):
+        print(f"  {change}: {count}")
+    print("Partition change timeline:")
+    for key, timeline in index.timelines.items():
+        fields = split_fields(key)
+        print(f'  Topic: "{fields.get("Topic")}", Partition: "{fields.get("Partition")}"')
+        for label, change in timeline:
+            print(f"    {label}: {change}")
+    print("Broker churn:")
+    for broker, churn in sorted(index.broker_churn.items()):
+        counts = ', '.join(f"{kind}: {count}" for kind, count in sorted(churn.items()))
+        print(f"  Broker: {broker} {counts}")
+    return index
+
+def load_inventory(path):
+    """
+    Loads the clusters to collect in multi-cluster mode.
+
+    Args:
+        path (str): Path to a JSON file mapping each cluster name to the shell command that describes its topics, for
+            example {"prod-east": "kafka-topics --bootstrap-server east:9092 --describe"}.
+
+    Returns:
+        dict: The describe command of each cluster name, in the order of the file.
+
+    Raises:
+        ValueError: If the file does not map cluster names to commands.
+    """
+    with open(path, 'r') as file:
+        inventory = json.load(file)
+    if not isinstance(inventory, dict) or not all(isinstance(command, str) for command in inventory.values()):
+        raise ValueError(f"The inventory must map cluster names to describe commands: {path}")
+    return inventory
+
+async def collect_cluster(name, command, semaphore, timeout=None):
+    """
+    Runs the describe command of one cluster once the concurrency limit allows it, parsing its output into a partition
+    table as the lines arrive.
+
+    Args:
+        name (str): The cluster name.
+        command (str): The shell command that describes the topics of the cluster.
+        semaphore (asyncio.Semaphore): Limits how many describe commands run at once.
+        timeout (float): Seconds after which the command is killed, or None to wait for it indefinitely.
+
+    Returns:
+        tuple: The partition table, or None if the command failed, and the error message, or None if it succeeded.
+        Any error collecting the cluster is returned as its message, so one cluster never stops the rest of the fleet.
+    """
+    async with semaphore:
+        start_time = time.perf_counter()
+        table = PartitionTable()
+        process = None
+        error_output = None
+
+        async def read_output():
+            remainder = b''
+            while True:
+                chunk = await process.stdout.read(FLEET_READ_SIZE)
+                if not chunk:
+                    break
+                lines = (remainder + chunk).split(b'\n')
+                remainder = lines.pop()
+                for line in lines:
+                    table.add_line(line.decode(errors='replace'))
+            if remainder:
+                table.add_line(remainder.decode(errors='replace'))
+            await process.wait()
+
+        try:
+            process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE, start_new_session=True)
+            # Standard error is drained alongside standard output so neither pipe can fill up and block the command
+            error_output = asyncio.ensure_future(process.stderr.read())
+            try:
+                await asyncio.wait_for(read_output(), timeout)
+            except asyncio.TimeoutError:
+                message = f"Command '{command}' did not finish within {timeout} seconds and was killed"
+            else:
+                error = await error_output
+                if process.returncode == 0:
+                    message = None
+                else:
+                    message = (f"Command '{command}' failed with exit status {process.returncode}: "
+                               f"{error.decode(errors='replace').strip()}")
+        except Exception as e:
+            message = f"Collecting the output of '{command}' failed: {e!r}"
+        finally:
+            if error_output is not None and not error_output.done():
+                error_output.cancel()
+                await asyncio.gather(error_output, return_exceptions=True)
+            if process is not None and process.returncode is None:
+                kill_process_group(process)
+                await process.wait()
+
+        if message is not None:
+            print(f"Cluster {name}: {message}", file=sys.stderr)
+            return None, message
+        print(f"Cluster {name}: parsed {len(table)} partitions in {time.perf_counter() - start_time:.1f} seconds",
+              file=sys.stderr)
+        return table, None
+
+async def collect_fleet(inventory, concurrency=None, timeout=None):
+    """
+    Describes every cluster of the inventory concurrently.
+
+    Args:
+        inventory (dict): The describe command of each cluster name.
+        concurrency (int): The most describe commands run at once.
+        timeout (float): Seconds after which each command is killed, or None to wait for them indefinitely.
+
+    Returns:
+        dict: The partition table and error message of each cluster name, in the order of the inventory.
+    """
+    semaphore = asyncio.Semaphore(concurrency or FLEET_CONCURRENCY)
+    results = await asyncio.gather(*(collect_cluster(name, command, semaphore, timeout)
+                                     for name, command in inventory.items()))
+    return dict(zip(inventory, results))
+
+def print_fleet_report(results):
+    """
+    Prints one line per cluster with its offline, under replicated and preferred leadership counts and the spread of
+    leadership across its brokers, followed by the totals of the fleet.
+
+    Args:
+        results (dict): The partition table and error message of each cluster name, as returned by collect_fleet.
+    """
+    totals = collections.Counter()
+    print(f"Fleet report for {len(results)} cluster(s):")
+    for name, (table, error) in results.items():
+        if table is None:
+            totals['failed'] += 1
+            print(f'  Cluster: "{name}" could not be collected: {error}')
+            continue
+        offline_count = len(get_offline_partitions(table))
+        under_replicated_count = len(get_under_replicated_partitions(table))
+        non_preferred_count = sum(get_preferred_leadership(table)[1].values())
+        leader_counts = get_leadership_distribution(table).values()
+        leader_spread = f"{min(leader_counts)} to {max(leader_counts)}" if leader_counts else "none"
+        totals['topics'] += len(table.topic_names)
+        totals['partitions'] += len(table)
+        totals['offline'] += offline_count
+        totals['under replicated'] += under_replicated_count
+        totals['non-preferred'] += non_preferred_count
+        print(f'  Cluster: "{name}", Topics: {len(table.topic_names)}, Partitions: {len(table)}, '
+              f'Offline: {offline_count}, Under replicated: {under_replicated_count}, '
+              f'Non-preferred leaders: {non_preferred_count}, Partitions led per broker: {leader_spread}')
+    print(f"Fleet totals: Topics: {totals['topics']}, Partitions: {totals['partitions']}, "
+          f"Offline: {totals['offline']}, Under replicated: {totals['under replicated']}, "
+          f"Non-preferred leaders: {totals['non-preferred']}, Clusters failed: {totals['failed']}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze Kafka topic information from a file or command output.")
-    parser.add_argument('--file', help='Path to a file containing Kafka topic information.')
-    parser.add_argument('--command', help='Shell command to retrieve Kafka topic information.')
+    # Only one source of describe output is read per run
+    sources = parser.add_mutually_exclusive_group()
+    sources.add_argument('--file', help='Path to a file containing Kafka topic information.')
+    sources.add_argument('--command', help='Shell command to retrieve Kafka topic information.')
+    parser.add_argument('--timeout', type=float, help='Seconds to wait for the command before it is killed.')
+    parser.add_argument('--progress-interval', type=int, default=PROGRESS_INTERVAL,
+                        help='Partitions parsed between progress lines while the command runs, 0 to disable.')
+    sources.add_argument('--snapshots', nargs='+',
+                        help='Describe snapshot files, oldest first, to diff into a change timeline.')
+    parser.add_argument('--timeline-length', type=int, default=SNAPSHOT_TIMELINE_LENGTH,
+                        help='Most recent changes kept per partition when diffing snapshots.')
+    parser.add_argument('--election-plan', help='Write a kafka-leader-election JSON that evens out leadership.')
+    parser.add_argument('--reassignment-plan',
+                        help='Write a kafka-reassign-partitions JSON reordering replicas to balance preferred leaders.')
+    parser.add_argument('--broker-racks', help='JSON file mapping broker ids to rack names.')
+    parser.add_argument('--leader-racks', help='Comma separated racks whose brokers may lead partitions in the plans.')
+    sources.add_argument('--inventory', help='JSON file mapping cluster names to describe commands, for a fleet report.')
+    parser.add_argument('--concurrency', type=int, default=FLEET_CONCURRENCY,
+                        help='Most describe commands run at once with --inventory.')
 
     args = parser.parse_args()
+    if (args.election_plan or args.reassignment_plan) and not (args.file or args.command):
+        parser.error('--election-plan and --reassignment-plan need the describe output of --file or --command')
 
     try:
-        if args.file:
+        if args.inventory:
+            print_fleet_report(asyncio.run(collect_fleet(load_inventory(args.inventory), args.concurrency,
+                                                         args.timeout)))
+        elif args.snapshots:
+            for snapshot in args.snapshots:
+                if not os.path.isfile(snapshot):
+                    raise FileNotFoundError(f"The specified file does not exist: {snapshot}")
+            diff_snapshots(args.snapshots, args.timeline_length)
+        elif args.file:
             if not os.path.isfile(args.file):
                 raise FileNotFoundError(f"The specified file does not exist: {args.file}")
+            # The file is parsed as it is read rather than loaded into memory first
             with open(args.file, 'r') as file:
-                output = file.read()
-                parse_output(output)
+                table = parse_output(file)
         elif args.command:
-            output = run_command(args.command)
-            parse_output(output)
+            # The output is parsed as the command produces it, and no report is printed if the command fails
+            table = parse_output(stream_command(args.command, args.timeout), args.progress_interval)
         else:
             parser.print_help()
+        if args.election_plan or args.reassignment_plan:
+            generate_rebalance_plan(table, args.election_plan, args.reassignment_plan,
+                                    load_broker_racks(args.broker_racks) if args.broker_racks else None,
+                                    args.leader_racks.split(',') if args.leader_racks else None)
+    except subprocess.TimeoutExpired as e:
+        print(f"Command '{e.cmd}' did not finish within {e.timeout} seconds and was killed")
+    except subprocess.CalledProcessError as e:
+        print(f"Command '{e.cmd}' failed with exit status {e.returncode}: {e.stderr}")
     except Exception as e:
         print(f"An error occurred: {e}")
         print("Please check the input parameters and try again.")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The scripts live at the top of the repository and are imported as plain modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Regex_Searching
+
+
+@pytest.fixture
+def global_config(tmp_path, monkeypatch):
+    """
+    A finalized config whose input folder is a temporary directory, set as the module global for the test.
+    """
+    config = Regex_Searching.GlobalConfig(str(tmp_path))
+    config.current_log_level = Regex_Searching.LogLevels.ERROR
+    monkeypatch.setattr(Regex_Searching, 'global_config', config)
+    config.finalize_configs()
+    config.derive_default_configs()
+    return config
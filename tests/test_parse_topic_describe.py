@@ -0,0 +1,222 @@
+import asyncio
+import collections
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+import parse_topic_describe
+
+DESCRIBE_OUTPUT = """Topic: orders\tTopicId: abc\tPartitionCount: 3\tReplicationFactor: 3\tConfigs: min.insync.replicas=2
+\tTopic: orders\tPartition: 0\tLeader: 1\tReplicas: 1,2,3\tIsr: 1,2,3
+\tTopic: orders\tPartition: 1\tLeader: 1\tReplicas: 2,3,1\tIsr: 1,3
+\tTopic: orders\tPartition: 2\tLeader: none\tReplicas: 3,1,2\tIsr: 
+"""
+
+def python_command(source):
+    """
+    A shell command running a line of Python with the interpreter running the tests
+    """
+    return f'"{sys.executable}" -c "{source}"'
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='the fleet commands are POSIX shell commands')
+def test_collect_fleet_reports_every_failure_per_cluster(tmp_path):
+    describe_path = tmp_path / 'describe.txt'
+    describe_path.write_text(DESCRIBE_OUTPUT)
+    inventory = {
+        'healthy': python_command(f"print(open(r'{describe_path}').read())"),
+        # A topic line far longer than any line buffer, followed by the partitions
+        'long_line': python_command(f"print('Topic: orders\\tConfigs: ' + 'x' * 3000000); print(open(r'{describe_path}').read())"),
+        'unparsable': python_command("print('Topic: orders\\tPartition: first\\tLeader: 1\\tReplicas: 1\\tIsr: 1')"),
+        'failing': python_command("import sys; sys.exit('no brokers')"),
+        'hanging': python_command('import time; time.sleep(30)'),
+    }
+    results = asyncio.run(parse_topic_describe.collect_fleet(inventory, timeout=2))
+    assert list(results) == list(inventory)
+    assert len(results['healthy'][0]) == 3 and results['healthy'][1] is None
+    assert len(results['long_line'][0]) == 3 and results['long_line'][1] is None
+    assert results['unparsable'][0] is None and 'ValueError' in results['unparsable'][1]
+    assert results['failing'][0] is None and 'no brokers' in results['failing'][1]
+    assert results['hanging'][0] is None and 'did not finish within 2 seconds' in results['hanging'][1]
+
+def process_is_running(pid):
+    """
+    Whether a process is alive, counting a zombie left for its parent to reap as finished
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as file:
+            return file.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='the process state is read from /proc')
+def test_stream_command_kills_the_whole_process_group_on_timeout(tmp_path):
+    pid_path = tmp_path / 'pid.txt'
+    # The shell runs a command that starts a child of its own, which must not outlive the timeout either
+    command = python_command("import subprocess, sys, time; "
+                             "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); "
+                             f"open(r'{pid_path}', 'w').write(str(child.pid)); "
+                             "print('started', flush=True); time.sleep(30)")
+    lines = []
+    with pytest.raises(subprocess.TimeoutExpired):
+        for line in parse_topic_describe.stream_command(command, timeout=2):
+            lines.append(line)
+    assert lines == ['started\n']
+    child_pid = int(pid_path.read_text())
+    deadline = time.monotonic() + 5
+    while process_is_running(child_pid) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not process_is_running(child_pid)
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='the commands are POSIX shell commands')
+def test_stream_command_raises_with_the_standard_error_on_a_non_zero_exit():
+    command = python_command("import sys; print('partial'); sys.stderr.write('no brokers available'); sys.exit(3)")
+    lines = []
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        for line in parse_topic_describe.stream_command(command, timeout=10):
+            lines.append(line)
+    assert lines == ['partial\n']
+    assert error.value.returncode == 3
+    assert error.value.stderr == 'no brokers available'
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='the commands are POSIX shell commands')
+def test_stream_command_replaces_bytes_that_are_not_utf_8():
+    command = python_command("import sys; sys.stdout.buffer.write(b'Configs: name=caf\\xe9\\n'); "
+                             "sys.stdout.buffer.write(b'Topic: orders\\n')")
+    assert list(parse_topic_describe.stream_command(command)) == ['Configs: name=caf\ufffd\n', 'Topic: orders\n']
+
+def test_partition_table_parses_tab_and_space_separated_lines():
+    table = parse_topic_describe.parse_lines([
+        'Topic: orders\tTopicId: abc\tPartitionCount: 2\tReplicationFactor: 3\tConfigs: ',
+        '\tTopic: orders\tPartition: 0\tLeader: 1\tReplicas: 1,2,3\tIsr: 1,2,3\tOffline: \tObservers: ',
+        # Space separated output with an empty ISR directly followed by the next field name
+        'Topic: payments Partition: 4 Leader: 2 Replicas: 1,2 Isr:  Offline: 1 Observers: ',
+        '   Topic: payments   Partition: 5   Leader: none   Replicas: 1,2,11   Isr: 2   Observers: 11',
+    ])
+    assert len(table) == 3
+    assert table.topic_names == ['orders', 'payments']
+    assert list(table.topics) == [0, 1, 1]
+    assert list(table.partitions) == [0, 4, 5]
+    assert list(table.leaders) == [1, 2, parse_topic_describe.NO_LEADER]
+    assert [list(table.replicas_of(index)) for index in range(3)] == [[1, 2, 3], [1, 2], [1, 2, 11]]
+    assert [list(table.isr_of(index)) for index in range(3)] == [[1, 2, 3], [], [2]]
+    assert [list(table.observers_of(index)) for index in range(3)] == [[], [], [11]]
+    assert list(table.preferred_leaders()) == [1, 1, 1]
+
+def test_partition_table_reports():
+    table = parse_topic_describe.parse_lines(DESCRIBE_OUTPUT.splitlines())
+    table.add_partition('payments', 0, 4, [4, 5], [4, 5], [5])
+    table.add_partition('payments', 1, 5, [4, 5, 6], [5], [6])
+    # Observers replicate asynchronously, so one outside the ISR does not make the partition under replicated
+    table.add_partition('payments', 2, 4, [4, 5, 6], [4, 5], [6])
+    assert parse_topic_describe.get_offline_partitions(table) == [2]
+    assert parse_topic_describe.get_under_replicated_partitions(table) == [1, 2, 4]
+    assert parse_topic_describe.describe_out_of_sync_brokers(table, 1) == '2'
+    assert parse_topic_describe.describe_out_of_sync_brokers(table, 4) == '4'
+    assert parse_topic_describe.get_leadership_distribution(table) == {1: 2, 4: 2, 5: 1}
+    preferred_counts, non_preferred_counts = parse_topic_describe.get_preferred_leadership(table)
+    assert preferred_counts == {1: 1, 4: 2}
+    assert non_preferred_counts == {2: 1, 3: 1, 4: 1}
+
+def test_partition_table_rejects_a_partition_number_that_is_not_a_number():
+    with pytest.raises(ValueError):
+        parse_topic_describe.PartitionTable().add_line('Topic: orders\tPartition: first\tLeader: 1\tReplicas: 1\tIsr: 1')
+
+def test_snapshot_index_diffs_successive_snapshots():
+    index = parse_topic_describe.SnapshotIndex(timeline_length=2)
+    first = [
+        'Topic: orders\tTopicId: abc\tPartitionCount: 2\tReplicationFactor: 3\tConfigs: ',
+        '\tTopic: orders\tPartition: 0\tLeader: 1\tReplicas: 1,2,3\tIsr: 1,2,3',
+        '\tTopic: orders\tPartition: 1\tLeader: 2\tReplicas: 2,3,1\tIsr: 2,3,1',
+    ]
+    second = [
+        # Whitespace differences in the key do not count as a change
+        '    Topic: orders    Partition: 0\tLeader: 2\tReplicas: 1,2,3\tIsr: 2,3',
+        '\tTopic: orders\tPartition: 1\tLeader: 2\tReplicas: 2,3,1\tIsr: 2,3,1',
+        '\tTopic: payments\tPartition: 0\tLeader: 3\tReplicas: 3\tIsr: 3',
+    ]
+    third = [
+        '\tTopic: orders\tPartition: 0\tLeader: none\tReplicas: 1,2,3\tIsr: ',
+        '\tTopic: orders\tPartition: 1\tLeader: 2\tReplicas: 2,3\tIsr: 2,3,1',
+    ]
+    assert index.apply_snapshot('first', first) == 0
+    assert index.apply_snapshot('second', second) == 2
+    assert index.apply_snapshot('third', third) == 3
+    assert {key: list(timeline) for key, timeline in index.timelines.items()} == {
+        'Topic: orders Partition: 0': [
+            ('second', 'Leader changed from 1 to 2; Brokers removed from ISR: 1'),
+            ('third', 'Went offline, leader was 2; Brokers removed from ISR: 2, 3'),
+        ],
+        'Topic: payments Partition: 0': [('second', 'Partition created'), ('third', 'Partition deleted')],
+        'Topic: orders Partition: 1': [('third', 'Replicas changed from 2,3,1 to 2,3')],
+    }
+    assert index.change_counts == {'leader': 1, 'offline': 1, 'isr shrink': 2, 'created': 1, 'deleted': 1,
+                                   'reassigned': 1}
+    assert index.broker_churn == {1: {'leadership lost': 1, 'ISR removals': 1},
+                                  2: {'leadership gained': 1, 'leadership lost': 1, 'ISR removals': 1},
+                                  3: {'ISR removals': 1}}
+
+def test_snapshot_index_keeps_only_the_latest_changes():
+    index = parse_topic_describe.SnapshotIndex(timeline_length=1)
+    for snapshot, leader in enumerate((1, 2, 3)):
+        index.apply_snapshot(f'snapshot-{snapshot}', [f'Topic: orders\tPartition: 0\tLeader: {leader}\tReplicas: 1,2,3\tIsr: 1,2,3'])
+    assert list(index.timelines['Topic: orders Partition: 0']) == [('snapshot-2', 'Leader changed from 2 to 3')]
+
+def read_json(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def test_election_plan_elects_preferred_leaders_that_can_lead(tmp_path):
+    table = parse_topic_describe.PartitionTable()
+    table.add_partition('orders', 0, 2, [1, 2, 3], [1, 2, 3], [])
+    # The preferred leader is out of sync, an observer, or the partition is offline, so none of these are elected
+    table.add_partition('orders', 1, 2, [1, 2, 3], [2, 3], [])
+    table.add_partition('orders', 2, 2, [4, 2], [4, 2], [4])
+    table.add_partition('orders', 3, parse_topic_describe.NO_LEADER, [1, 2], [], [])
+    table.add_partition('orders', 4, 1, [1, 2], [1, 2], [])
+    election_plan_path = tmp_path / 'election.json'
+    projected_leaders = parse_topic_describe.generate_rebalance_plan(table, str(election_plan_path))
+    assert projected_leaders == {0: 1}
+    assert read_json(election_plan_path) == {'partitions': [{'topic': 'orders', 'partition': 0}]}
+
+def test_reassignment_plan_balances_preferred_leaders(tmp_path):
+    table = parse_topic_describe.PartitionTable()
+    for partition in range(6):
+        table.add_partition('orders', partition, 1, [1, 2, 3], [1, 2, 3], [])
+    election_plan_path = tmp_path / 'election.json'
+    reassignment_plan_path = tmp_path / 'reassignment.json'
+    projected_leaders = parse_topic_describe.generate_rebalance_plan(table, str(election_plan_path),
+                                                                     str(reassignment_plan_path))
+    assert collections.Counter(projected_leaders.values()) == {2: 2, 3: 2}
+    reassignments = read_json(reassignment_plan_path)
+    assert reassignments['version'] == 1
+    assert len(reassignments['partitions']) == 4
+    for reassignment in reassignments['partitions']:
+        # Only the order of the replicas changes, with the planned leader first
+        assert sorted(reassignment['replicas']) == [1, 2, 3]
+        assert reassignment['replicas'][0] == projected_leaders[reassignment['partition']]
+    assert [election['partition'] for election in read_json(election_plan_path)['partitions']] == sorted(projected_leaders)
+
+def test_reassignment_plan_keeps_the_observers(tmp_path):
+    table = parse_topic_describe.PartitionTable()
+    for partition in range(2):
+        table.add_partition('orders', partition, 1, [1, 2, 11], [1, 2], [11])
+    reassignment_plan_path = tmp_path / 'reassignment.json'
+    parse_topic_describe.generate_rebalance_plan(table, reassignment_plan_path=str(reassignment_plan_path))
+    assert read_json(reassignment_plan_path)['partitions'] == [
+        {'topic': 'orders', 'partition': 1, 'replicas': [2, 1, 11], 'observers': [11]}]
+
+def test_rebalance_plan_keeps_leadership_in_the_leader_racks(tmp_path):
+    table = parse_topic_describe.PartitionTable()
+    for partition in range(4):
+        table.add_partition('orders', partition, 1, [1, 2, 3], [1, 2, 3], [])
+    broker_racks = {1: 'rack-a', 2: 'rack-b', 3: 'rack-a'}
+    projected_leaders = parse_topic_describe.generate_rebalance_plan(
+        table, reassignment_plan_path=str(tmp_path / 'reassignment.json'), broker_racks=broker_racks,
+        leader_racks=['rack-a'])
+    assert set(projected_leaders.values()) == {3}
+    assert len(projected_leaders) == 2
+    with pytest.raises(ValueError):
+        parse_topic_describe.generate_rebalance_plan(table, leader_racks=['rack-a'])
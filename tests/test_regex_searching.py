@@ -0,0 +1,491 @@
+import concurrent.futures
+import io
+import pathlib
+import re
+import tarfile
+import warnings
+import zipfile
+
+import pytest
+
+import Regex_Searching
+
+
+def scan_lines(pattern_set, lines):
+    """
+    Runs the single pass scanner over the lines and returns the (pattern_index, line) pairs it matched.
+    """
+    stream = io.BytesIO(b''.join(line + b'\n' for line in lines))
+    return sorted((pattern_index, line) for pattern_index, byte_offset, line_number, line
+                  in Regex_Searching.scan_stream(stream, pattern_set))
+
+def grep_lines(patterns, file_path):
+    """
+    Runs every pattern through grep mode and returns the (pattern_index, line) pairs it matched.
+    """
+    return sorted((pattern_index, line) for pattern_index, pattern in enumerate(patterns)
+                  for batch in Regex_Searching.grep_pattern(pattern, file_path) for byte_offset, line_number, line in batch)
+
+LINES = [
+    b'[2024-01-02 10:00:00,000] WARN [ReplicaFetcher replicaId=1] Error sending fetch request (kafka.server)',
+    b'[2024-01-02 10:00:01,000] warn lowercase warning with client.id = consumer-1',
+    b'[2024-01-02 10:00:02,000] ERROR java.io.IOException: Connection to node-2 failed (org.apache.kafka)',
+    b'[2024-01-02 10:00:03,000] INFO Nothing to see here',
+    b'[2024-01-02 10:00:04,000] INFO application.id = streams-app',
+]
+
+# Patterns with leading wildcards, inline flags at the start and in the middle, and a group spanning a wildcard
+PATTERNS = [
+    rb'(?i).*warn.*',
+    rb'.*(WARN.*)',
+    rb'(.*client.id.=.(.*))',
+    rb'^.*java.io.IOException.*(Connection to (.*) failed.*)',
+    rb'INFO (?i)APPLICATION.id',
+    rb'.*Nothing',
+]
+
+def test_single_pass_matches_grep_mode(global_config, tmp_path):
+    log_path = tmp_path / 'server.log'
+    log_path.write_bytes(b''.join(line + b'\n' for line in LINES))
+    pattern_set = Regex_Searching.PatternSet(PATTERNS)
+    assert scan_lines(pattern_set, LINES) == grep_lines(PATTERNS, str(log_path))
+
+@pytest.mark.parametrize('pattern, search_pattern, flags', [
+    (rb'.*(WARN.*)', rb'(WARN.*)', 0),
+    (rb'^.*foo|.*bar', rb'foo|bar', 0),
+    (rb'(.*client.id.=.(.*))', rb'(client.id.=.(.*))', 0),
+    (rb'(?i).*warn.*', rb'warn.*', re.IGNORECASE),
+    (rb'foo(?i)bar', rb'foobar', re.IGNORECASE),
+    (rb'(.*a){2}', rb'(.*a){2}', 0),
+    (rb'.*(a)\1', rb'.*(a)\1', 0),
+])
+def test_pattern_search_form(pattern, search_pattern, flags):
+    assert Regex_Searching.pattern_search_form(pattern)[::2] == (search_pattern, flags)
+
+def test_module_compiles_with_warnings_as_errors():
+    # Pattern literals with escapes such as \d have to be raw strings, or they fail under -W error
+    source = pathlib.Path(Regex_Searching.__file__).read_text()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        compile(source, Regex_Searching.__file__, 'exec')
+
+def test_patterns_that_cannot_be_joined_are_tested_one_by_one():
+    pattern_set = Regex_Searching.PatternSet([rb'(?P<name>foo)', rb'.*(?P<name>bar)', rb'baz(?i)QUX'])
+    assert pattern_set.combined_pattern is None
+    assert pattern_set.match_line(b'foo bar') == [0, 1]
+    assert pattern_set.match_line(b'bazqux') == [2]
+    assert pattern_set.match_line(b'nothing') == []
+
+def test_scan_file_reads_seven_zip_members(global_config, tmp_path):
+    py7zr = pytest.importorskip('py7zr')
+    archive_path = tmp_path / 'logs.7z'
+    with py7zr.SevenZipFile(archive_path, 'w') as seven_zip:
+        seven_zip.writestr(b'WARN first\nINFO second\n', 'broker-1/server.log')
+    results, prefilter_counts, stack_traces = Regex_Searching.scan_file(str(archive_path), Regex_Searching.PatternSet([rb'WARN.*']))
+    assert results == [(f'{archive_path}!broker-1/server.log', {0: [(0, 1, b'WARN first')]})]
+
+def test_scan_file_skips_a_corrupt_archive(global_config, tmp_path):
+    archive_path = tmp_path / 'broken.zip'
+    archive_path.write_bytes(b'PK\x03\x04' + b'\0' * 64)
+    results, prefilter_counts, stack_traces = Regex_Searching.scan_file(str(archive_path), Regex_Searching.PatternSet([rb'WARN.*']))
+    assert results == []
+
+def test_scan_cache_round_trips_results_one_file_per_pattern(global_config, tmp_path):
+    log_path = tmp_path / 'logs.zip'
+    log_path.write_bytes(b'not read, only hashed')
+    patterns = [rb'WARN.*', rb'ERROR.*']
+    file_results = [
+        (f'{log_path}!a.log', {0: [(0, 1, b'WARN \xff not utf-8'), (20, 3, b'WARN again')], 1: [(10, 2, b'ERROR')]}),
+        (f'{log_path}!b.log', {}),
+        (f'{log_path}!c.log', {0: [(0, 1, b'WARN c')]}),
+    ]
+    scan_cache = Regex_Searching.ScanCache(str(tmp_path / 'cache'))
+    file_stat = log_path.stat()
+    assert scan_cache.cached_content_hash(str(log_path), file_stat) is None
+    scan_cache.record_content_hash(str(log_path), file_stat, Regex_Searching.hash_file_contents(str(log_path)))
+    cache_entry = scan_cache.open_entry(str(log_path), patterns)
+    assert cache_entry.missing_pattern_indexes == [0, 1]
+    for label, matches in file_results:
+        cache_entry.add(label, matches)
+    cache_entry.finish()
+    scan_cache.save()
+
+    scan_cache = Regex_Searching.ScanCache(str(tmp_path / 'cache'))
+    assert scan_cache.cached_content_hash(str(log_path), log_path.stat()) is not None
+    cache_entry = scan_cache.open_entry(str(log_path), patterns)
+    assert cache_entry.missing_pattern_indexes == []
+    assert list(cache_entry.cached_batches()) == [file_results[0], file_results[2]]
+    # A pattern added since is scanned on its own, the cached patterns are kept
+    cache_entry = scan_cache.open_entry(str(log_path), patterns + [rb'INFO.*'])
+    assert cache_entry.missing_pattern_indexes == [2]
+    assert sorted(path.suffix for path in (tmp_path / 'cache').iterdir()) == ['.json', '.jsonl', '.jsonl']
+
+def test_trigram_index_round_trips_as_json(global_config, tmp_path):
+    global_config.index_block_size_bytes = 32
+    log_path = tmp_path / 'server.log'
+    log_path.write_bytes(b''.join(line + b'\n' for line in LINES))
+    trigram_index = Regex_Searching.TrigramIndex(str(tmp_path / 'index'))
+    trigram_index.build([str(log_path)])
+
+    trigram_index = Regex_Searching.TrigramIndex(str(tmp_path / 'index'))
+    assert trigram_index.is_current(str(log_path))
+    pattern_set = Regex_Searching.PatternSet([rb'application.id = (.*)'])
+    last_line_offset = sum(len(line) + 1 for line in LINES[:-1])
+    assert trigram_index.query_file(str(log_path), pattern_set) == [
+        (str(log_path), {0: [(last_line_offset, len(LINES), LINES[-1])]})]
+
+def test_load_pattern_set_reuses_the_json_cache(global_config):
+    patterns = [rb'.*(WARN.*)', rb'(?i)error', rb'Connection (to|with)']
+    pattern_set = Regex_Searching.load_pattern_set(patterns)
+    cached_pattern_set = Regex_Searching.load_pattern_set(patterns)
+    assert cached_pattern_set.required_literals == pattern_set.required_literals
+    assert [path.suffix for path in pathlib.Path(global_config.pattern_cache_folder_full_path).iterdir()] == ['.json']
+
+@pytest.mark.parametrize('settings, scan_max_in_flight', [
+    ('  scan_worker_count: 5\n', 10),
+    ('  scan_worker_count: 5\n  scan_max_in_flight: 3\n', 3),
+])
+def test_scan_max_in_flight_follows_the_configured_worker_count(tmp_path, monkeypatch, settings, scan_max_in_flight):
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text('settings:\n  current_log_level: error\n' + settings)
+    monkeypatch.setattr(Regex_Searching, 'global_config', None)
+    Regex_Searching.init_global_configs(Regex_Searching.parse_arguments(['--input-folder', str(tmp_path),
+                                                                          '--config', str(config_path)]))
+    try:
+        assert Regex_Searching.global_config.scan_max_in_flight == scan_max_in_flight
+    finally:
+        Regex_Searching.global_config.log_writer.close()
+        Regex_Searching.global_config.processing_log_file_handle.close()
+
+@pytest.mark.parametrize('fan_in', [2, 64])
+def test_timeline_merge_orders_by_timestamp_across_labels(global_config, monkeypatch, fan_in):
+    monkeypatch.setattr(Regex_Searching, 'TIMELINE_MERGE_FAN_IN', fan_in)
+    timeline_spill = Regex_Searching.TimelineSpill()
+    timeline_spill.add('broker-1/server.log', [(b'2024-01-02 10:00:00,000', b'a1'), (b'2024-01-02 10:00:03,000', b'a2')])
+    timeline_spill.add('broker-2/server.log', [(b'2024-01-02 10:00:01,000', b'b1')])
+    # A label whose lines arrive in two parts stays a single run
+    timeline_spill.add('broker-2/server.log', [(b'2024-01-02 10:00:03,000', b'b2\twith a tab')])
+    timeline_spill.add('broker-3/server.log', [(b'2024-01-02 10:00:00,000', b'c1'), (b'2024-01-02 10:00:02,000', b'c2')])
+    assert len(timeline_spill.runs) == 3
+    assert [(label, line) for timestamp, label, line in timeline_spill.merged_records()] == [
+        ('broker-1/server.log', b'a1'),
+        ('broker-3/server.log', b'c1'),
+        ('broker-2/server.log', b'b1'),
+        ('broker-3/server.log', b'c2'),
+        ('broker-1/server.log', b'a2'),
+        ('broker-2/server.log', b'b2\twith a tab'),
+    ]
+    timeline_spill.close()
+
+def test_timeline_merge_keeps_one_spill_file_for_many_labels(global_config, monkeypatch):
+    monkeypatch.setattr(Regex_Searching, 'TIMELINE_MERGE_FAN_IN', 4)
+    timeline_spill = Regex_Searching.TimelineSpill()
+    for label_index in range(50):
+        timeline_spill.add(f'broker-{label_index}/server.log', [(b'%03d' % (49 - label_index), b'line')])
+    merged_labels = [label for timestamp, label, line in timeline_spill.merged_records()]
+    assert merged_labels == [f'broker-{label_index}/server.log' for label_index in reversed(range(50))]
+    timeline_spill.close()
+
+def test_scan_file_puts_archive_matches_in_batches(global_config, tmp_path, monkeypatch):
+    monkeypatch.setattr(Regex_Searching, 'RESULT_BATCH_SIZE', 2)
+    archive_path = tmp_path / 'logs.zip'
+    with zipfile.ZipFile(archive_path, 'w') as zip_file:
+        zip_file.writestr('a.log', b'WARN 1\nWARN 2\nWARN 3\n')
+        zip_file.writestr('b.log', b'INFO 1\nWARN 4\n')
+    put_results = []
+    results, prefilter_counts, stack_traces = Regex_Searching.scan_file(
+        str(archive_path), Regex_Searching.PatternSet([rb'WARN.*']), put_results=lambda *batch: put_results.append(batch))
+    assert results == []
+    assert put_results == [
+        (f'{archive_path}!a.log', {0: [(0, 1, b'WARN 1'), (7, 2, b'WARN 2')]}),
+        (f'{archive_path}!a.log', {0: [(14, 3, b'WARN 3')]}),
+        (f'{archive_path}!b.log', {0: [(7, 2, b'WARN 4')]}),
+    ]
+
+def test_streamed_scan_writes_only_on_its_turn():
+    class ListWriter():
+        def __init__(self):
+            self.results = []
+        def put(self, label, matches):
+            self.results.append(label)
+
+    def scan(label, put_results=None):
+        put_results(label, {})
+        return label
+
+    result_writer = ListWriter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        streamed_scans = [Regex_Searching.StreamedScan(executor, result_writer, scan, label) for label in ('first', 'second')]
+        assert result_writer.results == []
+        assert [streamed_scan.result() for streamed_scan in streamed_scans] == ['first', 'second']
+    assert result_writer.results == ['first', 'second']
+
+def test_extraction_keeps_same_named_archives_apart(global_config, tmp_path):
+    for broker in ('broker-1', 'broker-2'):
+        (tmp_path / broker).mkdir()
+        with zipfile.ZipFile(tmp_path / broker / 'logs.zip', 'w') as zip_file:
+            zip_file.writestr('server.log', f'{broker} log\n')
+        (tmp_path / broker / 'notes.txt').write_text(broker)
+    # An archive of the same name is already in the archive folder from an earlier run
+    (tmp_path / 'Archive_of_Compressed_Files' / 'broker-1').mkdir(parents=True)
+    (tmp_path / 'Archive_of_Compressed_Files' / 'broker-1' / 'logs.zip').write_bytes(b'earlier run')
+
+    Regex_Searching.extract_all_directory()
+    Regex_Searching.move_files_except()
+
+    logs_folder = tmp_path / 'Logs'
+    assert sorted(path.relative_to(logs_folder).as_posix() for path in logs_folder.rglob('*') if path.is_file()) == [
+        'broker-1/logs/server.log', 'broker-1/notes.txt', 'broker-2/logs/server.log', 'broker-2/notes.txt']
+    assert (logs_folder / 'broker-2' / 'logs' / 'server.log').read_text() == 'broker-2 log\n'
+    archive_folder = tmp_path / 'Archive_of_Compressed_Files'
+    assert sorted(path.relative_to(archive_folder).as_posix() for path in archive_folder.rglob('*') if path.is_file()) == [
+        'broker-1/logs.zip', 'broker-1/logs.zip_1', 'broker-2/logs.zip']
+    assert not (tmp_path / 'broker-1').exists()
+
+def test_extraction_output_paths_are_unique(tmp_path):
+    reserved_paths = set()
+    (tmp_path / 'logs.tar').mkdir()
+    output_paths = [Regex_Searching.extraction_output_path(str(tmp_path / file_name), str(tmp_path), reserved_paths)
+                    for file_name in ('logs.tar.gz', 'logs.tar.zst', 'server')]
+    assert output_paths == [str(tmp_path / 'logs.tar_1'), str(tmp_path / 'logs.tar_2'), str(tmp_path / 'server_extracted')]
+
+def test_extraction_rejects_members_outside_the_output_folder(tmp_path):
+    output_path = tmp_path / 'output' / 'logs'
+    zip_path = tmp_path / 'escape.zip'
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr('server.log', b'kept\n')
+        zip_file.writestr('../../escaped.log', b'escaped\n')
+    with pytest.raises(ValueError):
+        Regex_Searching.extract_file(str(zip_path), str(output_path))
+    assert not (tmp_path / 'escaped.log').exists()
+
+    tar_path = tmp_path / 'escape.tar'
+    with tarfile.open(tar_path, 'w') as tar_file:
+        link = tarfile.TarInfo('etc')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '/etc'
+        tar_file.addfile(link)
+    with pytest.raises(Exception):
+        Regex_Searching.extract_file(str(tar_path), str(output_path))
+    with tarfile.open(tar_path, 'r') as tar_file, pytest.raises(ValueError):
+        Regex_Searching.check_tar_members(tar_file, str(output_path))
+    assert not (output_path / 'etc').exists()
+
+def test_member_paths_must_stay_inside_the_output_folder(tmp_path):
+    # The check used for 7zip archives, whose writers refuse to create such members for a test archive
+    Regex_Searching.check_member_paths(['server.log', 'broker-1/../broker-2/server.log', './a/b.log'], str(tmp_path))
+    for member_name in ('../escaped.log', 'broker-1/../../escaped.log', '/etc/cron.d/job'):
+        with pytest.raises(ValueError):
+            Regex_Searching.check_member_paths([member_name], str(tmp_path))
+
+def test_scan_appended_bytes_moves_past_a_line_longer_than_a_read(global_config, tmp_path):
+    log_path = tmp_path / 'server.log'
+    log_path.write_bytes(b'WARN ' + b'x' * 20 + b'\nWARN short\n')
+    pattern_set = Regex_Searching.PatternSet([rb'WARN.*'])
+    matches, offset = Regex_Searching.scan_appended_bytes(str(log_path), 0, pattern_set, 16)
+    assert (matches, offset) == ({0: [(0, 1, b'WARN ' + b'x' * 11)]}, 16)
+    matches, offset = Regex_Searching.scan_appended_bytes(str(log_path), offset, pattern_set, 16)
+    assert (matches, offset) == ({}, 26)
+    # A partial line shorter than a read still waits for the rest of the line
+    log_path.write_bytes(log_path.read_bytes() + b'WARN partial')
+    assert Regex_Searching.scan_appended_bytes(str(log_path), offset, pattern_set, 16) == ({0: [(26, 1, b'WARN short')]}, 37)
+    assert Regex_Searching.scan_appended_bytes(str(log_path), 37, pattern_set, 64) == ({}, 37)
+
+def follow_once(global_config):
+    """
+    Runs one poll of follow mode and returns every matched line in the followed results log so far
+    """
+    global_config.follow_max_polls = 1
+    global_config.follow_poll_interval_seconds = 0
+    Regex_Searching.follow_log_files()
+    followed_results = pathlib.Path(global_config.followed_results_log_full_path).read_bytes()
+    return [line for line in followed_results.split(b'\n') if line.startswith(b'WARN')]
+
+def test_follow_resumes_from_the_checkpoint_and_follows_rotation(global_config, tmp_path):
+    global_config.regex_patterns = [rb'WARN.*']
+    global_config.follow_from_start = True
+    log_path = tmp_path / 'server.log'
+    log_path.write_bytes(b'WARN one\nINFO two\n')
+    assert follow_once(global_config) == [b'WARN one']
+
+    # Lines written before the rotation are still scanned in the rotated file, the new file starts from 0
+    with open(log_path, 'ab') as log_file:
+        log_file.write(b'WARN three\n')
+    log_path.rename(tmp_path / 'server.log.1')
+    log_path.write_bytes(b'WARN four\n')
+    assert sorted(follow_once(global_config)) == [b'WARN four', b'WARN one', b'WARN three']
+
+    checkpoint = Regex_Searching.FollowCheckpoint(global_config.follow_checkpoint_full_path)
+    assert {pathlib.Path(file_path).name: entry['offset'] for file_path, entry in checkpoint.files.items()} == {
+        'server.log': 10, 'server.log.1': 29}
+
+def numbered_log_lines(line_count):
+    """
+    Timestamped log lines with a stack trace frame after every fifth event, which has no timestamp of its own
+    """
+    lines = []
+    for index in range(line_count):
+        lines.append(b'[2024-01-02 10:%02d:00,000] WARN event %d client.id = consumer-%d' % (index, index, index))
+        if index % 5 == 4:
+            lines.append(b'\tat kafka.server.KafkaApis.handle(KafkaApis.scala:%d)' % index)
+    return lines
+
+@pytest.mark.parametrize('scan_mode', ['SINGLE_PASS', 'INDEXED', 'GREP'])
+@pytest.mark.parametrize('since', [None, b'2024-01-02 10:17:00,000'])
+def test_structured_records_carry_line_numbers_and_configured_groups(global_config, tmp_path, scan_mode, since):
+    if scan_mode == 'GREP' and since is not None:
+        pytest.skip('grep mode does not apply a time window')
+    lines = numbered_log_lines(40)
+    logs_folder = pathlib.Path(global_config.log_parsing_folder_full_path)
+    logs_folder.mkdir(parents=True, exist_ok=True)
+    (logs_folder / 'server.log').write_bytes(b''.join(line + b'\n' for line in lines))
+    if scan_mode != 'GREP':
+        with zipfile.ZipFile(logs_folder / 'logs.zip', 'w') as zip_file:
+            zip_file.writestr('member.log', b''.join(line + b'\n' for line in lines))
+    global_config.scan_mode = Regex_Searching.ScanModes[scan_mode]
+    global_config.structured_output_format = Regex_Searching.StructuredFormats.JSONL
+    # Small chunks and index blocks so the lines of the plain file are numbered across many of them
+    global_config.scan_chunk_size_bytes = 300
+    global_config.index_block_size_bytes = 200
+    global_config.search_since = since
+    global_config.regex_patterns = [rb'(.*client.id.=.(.*))', rb'.*(at kafka.*)']
+    if scan_mode == 'INDEXED':
+        Regex_Searching.build_trigram_index()
+    Regex_Searching.find_all_grep_results()
+
+    records = list(Regex_Searching.read_structured_records(Regex_Searching.structured_output_full_path(),
+                                                           Regex_Searching.StructuredFormats.JSONL))
+    first_line_number = 1 if since is None else lines.index(b'[2024-01-02 10:17:00,000] WARN event 17 client.id = consumer-17') + 1
+    expected_files = {str(logs_folder / 'server.log')}
+    if scan_mode != 'GREP':
+        expected_files.add(f"{logs_folder / 'logs.zip'}!member.log")
+    for file in expected_files:
+        file_records = [record for record in records if record['file'] == file]
+        assert sorted(record['line_number'] for record in file_records) == list(range(first_line_number, len(lines) + 1))
+        for record in file_records:
+            assert record['line'] == lines[record['line_number'] - 1].decode()
+            if record['pattern_id'] == 0:
+                # The group spans the leading wildcard, so it holds the whole line rather than the stripped search form
+                assert record['groups'] == [record['line'], record['line'].rpartition(' ')[2]]
+
+@pytest.mark.parametrize('pattern, required_literals', [
+    (rb'Connection to (.*) failed', [b'Connection to ']),
+    (rb'(ERROR|FATAL) broker', [b' broker']),
+    (rb'(ERROR|FATAL) in', [b'ERROR', b'FATAL']),
+    (rb'a|b.*', [b'a', b'b']),
+    (rb'abc?d', [b'ab']),
+    (rb'(?:foo){2}', [b'foo']),
+    (rb'x*yz', [b'yz']),
+    (rb'[Ee]rror sending', [b'rror sending']),
+    (rb'.*\d+.*', None),
+    (rb'(?i)warn', None),
+])
+def test_pattern_required_literals(pattern, required_literals):
+    assert Regex_Searching.pattern_required_literals(pattern) == required_literals
+
+def test_literal_prefilter_only_tests_patterns_whose_literals_are_found():
+    pattern_set = Regex_Searching.PatternSet([rb'WARN.*', rb'\d+ retries', rb'Connection (to|with) node'])
+    prefilter_counts = Regex_Searching.PrefilterCounts(3)
+    assert pattern_set.match_line(b'INFO nothing here', prefilter_counts) == []
+    assert pattern_set.match_line(b'WARN 12 retries', prefilter_counts) == [0, 1]
+    assert pattern_set.match_line(b'WARN retries left', prefilter_counts) == [0]
+    assert pattern_set.match_line(b'Connection with node 1', prefilter_counts) == [2]
+    assert prefilter_counts.lines_tested == [2, 2, 1]
+
+def test_template_miner_groups_lines_by_their_constant_tokens():
+    template_miner = Regex_Searching.TemplateMiner()
+    lines = [
+        'Connection to node 1 (broker-1/10.0.0.1:9092) could not be established',
+        'Connection to node 2 (broker-2/10.0.0.2:9092) could not be established',
+        'Connection to node 3 (broker-3/10.0.0.3:9092) could not be established',
+        'Shrinking ISR from 1,2,3 to 1,2',
+        '',
+        'Shrinking ISR from 2,3,1 to 2,3',
+    ]
+    templates = [template_miner.add_line(line) for line in lines]
+    assert templates[4] is None
+    assert len(template_miner.templates) == 2
+    connection_template, isr_template = template_miner.templates
+    assert templates[:3] == [connection_template] * 3 and templates[5] is isr_template
+    assert (connection_template.count, isr_template.count) == (3, 2)
+    wildcard = Regex_Searching.TEMPLATE_WILDCARD
+    assert str(connection_template) == f'Connection to node {wildcard} {wildcard} could not be established'
+    assert str(isr_template) == f'Shrinking ISR from {wildcard} to {wildcard}'
+
+def test_template_miner_keeps_dissimilar_lines_apart():
+    template_miner = Regex_Searching.TemplateMiner(similarity_threshold=0.6)
+    template_miner.add_line('Rolled new log segment at offset 10')
+    template_miner.add_line('Deleted old log segment at offset 5')
+    template_miner.add_line('Rolled new log segment at offset 20')
+    assert sorted((template.count, str(template)) for template in template_miner.templates) == [
+        (1, 'Deleted old log segment at offset 5'), (2, f'Rolled new log segment at offset {Regex_Searching.TEMPLATE_WILDCARD}')]
+
+STACK_TRACE_LINES = [
+    b'[2024-01-02 10:00:00,000] ERROR Error processing request (kafka.server.KafkaApis)',
+    b'org.apache.kafka.common.errors.NotLeaderOrFollowerException: not the leader',
+    b'\tat kafka.server.ReplicaManager.getPartition(ReplicaManager.scala:100)',
+    b'\tat kafka.server.KafkaApis.handle(KafkaApis.scala:200)',
+    b'\tat kafka.server.KafkaRequestHandler.run(KafkaRequestHandler.scala:300)',
+    b'Caused by: java.io.IOException: closed',
+    b'\tat sun.nio.ch.SocketChannelImpl.read(SocketChannelImpl.java:1)',
+    b'[2024-01-02 10:00:05,000] INFO Unrelated event (kafka.server.KafkaServer)',
+    b'[2024-01-02 10:00:09,000] ERROR Error processing request (kafka.server.KafkaApis)',
+    b'org.apache.kafka.common.errors.NotLeaderOrFollowerException: still not the leader',
+    b'\tat kafka.server.ReplicaManager.getPartition(ReplicaManager.scala:101)',
+    b'\tat kafka.server.KafkaApis.handle(KafkaApis.scala:201)',
+    b'java.lang.IllegalStateException',
+]
+
+def test_stack_trace_assembler_groups_traces_by_type_and_top_frames():
+    stack_traces = Regex_Searching.StackTraces()
+    trace_assembler = Regex_Searching.StackTraceAssembler(stack_traces, 'server.log', 2)
+    for line in STACK_TRACE_LINES:
+        trace_assembler.add_line(line)
+    trace_assembler.finish_trace()
+    assert stack_traces.fingerprints == {
+        # Frames past frame_count and frames of the Caused by section are left out of the fingerprint, as is the
+        # line number of each frame
+        ('org.apache.kafka.common.errors.NotLeaderOrFollowerException',
+         ('kafka.server.ReplicaManager.getPartition', 'kafka.server.KafkaApis.handle')):
+            [2, '2024-01-02 10:00:00,000', '2024-01-02 10:00:09,000', 'server.log',
+             'org.apache.kafka.common.errors.NotLeaderOrFollowerException: not the leader'],
+        ('java.lang.IllegalStateException', ()):
+            [1, '2024-01-02 10:00:09,000', '2024-01-02 10:00:09,000', 'server.log', 'java.lang.IllegalStateException'],
+    }
+
+def test_stack_traces_merge_keeps_the_widest_time_range():
+    stack_traces = Regex_Searching.StackTraces()
+    stack_traces.add(('java.io.IOException', ()), 2, '2024-01-02 10:00:05,000', '2024-01-02 10:00:06,000', 'a.log', 'first')
+    other_stack_traces = Regex_Searching.StackTraces()
+    other_stack_traces.add(('java.io.IOException', ()), 1, '2024-01-02 10:00:01,000', '2024-01-02 10:00:02,000', 'b.log', 'second')
+    stack_traces.merge(other_stack_traces)
+    assert stack_traces.fingerprints == {
+        ('java.io.IOException', ()): [3, '2024-01-02 10:00:01,000', '2024-01-02 10:00:06,000', 'a.log', 'first']}
+
+def test_scan_file_assembles_stack_traces_in_the_same_read(global_config, tmp_path):
+    log_path = tmp_path / 'server.log'
+    log_path.write_bytes(b''.join(line + b'\n' for line in STACK_TRACE_LINES))
+    results, prefilter_counts, stack_traces = Regex_Searching.scan_file(
+        str(log_path), Regex_Searching.PatternSet([rb'ERROR (.*)']), trace_frame_count=2)
+    assert [len(matches[0]) for label, matches in results] == [2]
+    assert sorted(count for count, *rest in stack_traces.fingerprints.values()) == [1, 2]
+
+def run_main(monkeypatch, *arguments):
+    """
+    Runs the whole pipeline through main() and returns the config it ran with, restoring the module global afterwards
+    """
+    monkeypatch.setattr(Regex_Searching, 'global_config', None)
+    Regex_Searching.main(list(arguments))
+    return Regex_Searching.global_config
+
+def test_merged_timeline_flag_writes_the_timeline(tmp_path, monkeypatch):
+    for broker, seconds in (('broker-1', (0, 2)), ('broker-2', (1, 3))):
+        (tmp_path / broker).mkdir()
+        (tmp_path / broker / 'server.log').write_bytes(b''.join(
+            b'[2024-01-02 10:00:0%d,000] WARN event %d of %s\n' % (second, second, broker.encode()) for second in seconds))
+    config = run_main(monkeypatch, '--input-folder', str(tmp_path), '--pattern-packs', 'broker', '--merged-timeline')
+    assert config.write_merged_timeline
+    timeline = pathlib.Path(config.merged_timeline_log_full_path).read_text().splitlines()
+    assert [line.rsplit(' ', 3)[1:] for line in timeline] == [
+        ['0', 'of', 'broker-1'], ['1', 'of', 'broker-2'], ['2', 'of', 'broker-1'], ['3', 'of', 'broker-2']]
+    assert timeline[0].startswith(f"[broker 1: {config.log_parsing_folder_full_path}/broker-1/server.log] ")